@@ -0,0 +1,237 @@
+"""
+Controle de admissão do /infer por projeto e por usuário.
+
+Cada projeto (e cada usuário, quando o pedido traz o header X-User) tem um
+token bucket - RATE disparos por segundo com rajadas de até BURST - e um limite
+de jobs em andamento (MAX_CONCURRENT). O estado fica em um SQLite local
+(WAL) compartilhado pelos workers do gunicorn, então o limite vale para o
+servidor inteiro e não para cada processo. A checagem e o consumo de todos
+os limites acontecem em uma única transação curta (BEGIN IMMEDIATE).
+
+Pedidos acima do limite recebem 429 com Retry-After antes de criar job ou
+tocar no ECS. As vagas de concorrência são liberadas quando o job termina
+(listener do jobs.store) ou quando o disparo não é aceito; vagas de workers
+que morreram expiram depois de SLOT_TTL.
+
+O X-User só vale se vier do proxy do XNAT, que autentica o usuário e
+sobrescreve o header recebido do navegador: o pedido precisa trazer também
+X-Proxy-Secret com o segredo compartilhado EF_PROXY_SECRET. Sem ele (ou sem
+EF_PROXY_SECRET configurado) o X-User é ignorado e só o limite por projeto
+vale - senão cada cliente escolheria o próprio nome e escaparia do limite.
+
+Limites padrão por variável de ambiente (0 = sem limite, o padrão):
+
+    EF_PROJECT_RATE / EF_PROJECT_BURST / EF_PROJECT_MAX_CONCURRENT
+    EF_USER_RATE    / EF_USER_BURST    / EF_USER_MAX_CONCURRENT
+
+e exceções em EF_ADMISSION_OVERRIDES (JSON):
+
+    {"project:CLINICO": {"rate": 0, "max_concurrent": 0},
+     "user:robot": {"rate": 0.1, "burst": 2}}
+"""
+import hmac
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import applog
+import metrics
+
+
+log = applog.get_logger(__name__)
+
+ADMISSION_DB = os.getenv(
+    "EF_ADMISSION_DB",
+    os.path.join(tempfile.gettempdir(), "monai-mock-admission.sqlite3")
+)
+
+PROJECT_LIMITS = {
+    "rate": float(os.getenv("EF_PROJECT_RATE", "0")),
+    "burst": float(os.getenv("EF_PROJECT_BURST", "0")),
+    "max_concurrent": int(os.getenv("EF_PROJECT_MAX_CONCURRENT", "0"))
+}
+USER_LIMITS = {
+    "rate": float(os.getenv("EF_USER_RATE", "0")),
+    "burst": float(os.getenv("EF_USER_BURST", "0")),
+    "max_concurrent": int(os.getenv("EF_USER_MAX_CONCURRENT", "0"))
+}
+OVERRIDES = json.loads(os.getenv("EF_ADMISSION_OVERRIDES", "{}"))
+
+# Segredo do proxy do XNAT (header X-Proxy-Secret); sem ele o X-User é ignorado
+PROXY_SECRET = os.getenv("EF_PROXY_SECRET")
+
+# Vaga de concorrência esquecida (worker morto antes do job terminar)
+SLOT_TTL = float(os.getenv("EF_ADMISSION_SLOT_TTL", "7200"))
+
+# Retry-After quando o limite estourado é o de concorrência
+CONCURRENCY_RETRY_AFTER = int(os.getenv("EF_ADMISSION_CONCURRENCY_RETRY_AFTER", "30"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS slots (
+    key TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    acquired_at REAL NOT NULL,
+    PRIMARY KEY (key, job_id)
+);
+CREATE INDEX IF NOT EXISTS slots_job ON slots (job_id);
+"""
+
+
+def trusted_user(user, proxy_secret):
+    """user (X-User) se o pedido veio do proxy (proxy_secret confere); senão None."""
+    if not user or not PROXY_SECRET:
+        return None
+
+    if not hmac.compare_digest((proxy_secret or "").encode(), PROXY_SECRET.encode()):
+        log.warning("X-User ignored, request did not come through the proxy", extra={"user": user})
+        return None
+
+    return user
+
+
+class Rejected(Exception):
+    """Pedido acima do limite - o cliente deve tentar depois de retry_after segundos."""
+
+    def __init__(self, key, reason, retry_after):
+        super().__init__(f"{key}: {reason}, retry after {retry_after}s")
+        self.key = key
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+
+    def __init__(self, path=ADMISSION_DB, project_limits=PROJECT_LIMITS, user_limits=USER_LIMITS,
+                 overrides=OVERRIDES, slot_ttl=SLOT_TTL):
+        self.path = path
+        self.project_limits = project_limits
+        self.user_limits = user_limits
+        self.overrides = overrides
+        self.slot_ttl = slot_ttl
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = None
+        self._admitted = 0
+        self._rejected = 0
+
+    def _connection(self):
+        # Uma conexão por thread; recriadas depois do fork do gunicorn
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._local = threading.local()
+                    self._pid = os.getpid()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+
+        return conn
+
+    def limits(self, scope, name):
+        defaults = self.project_limits if scope == "project" else self.user_limits
+        return dict(defaults, **self.overrides.get(f"{scope}:{name}", {}))
+
+    def _checks(self, project, user):
+        checks = []
+        if project:
+            checks.append((f"project:{project}", self.limits("project", project)))
+        if user:
+            checks.append((f"user:{user}", self.limits("user", user)))
+        return checks
+
+    def admit(self, project, user, job_id):
+        """Reserva um disparo (token + vaga) para job_id ou levanta Rejected."""
+        checks = self._checks(project, user)
+        if not checks:
+            return
+
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            conn.execute("DELETE FROM slots WHERE acquired_at < ?", (now - self.slot_ttl,))
+            updates = []
+
+            for key, limits in checks:
+                if limits.get("max_concurrent"):
+                    (in_flight,) = conn.execute("SELECT COUNT(*) FROM slots WHERE key = ?", (key,)).fetchone()
+                    if in_flight >= limits["max_concurrent"]:
+                        raise Rejected(key, "too many jobs in progress", CONCURRENCY_RETRY_AFTER)
+
+                if limits.get("rate"):
+                    row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                    burst = max(1.0, limits.get("burst") or 1.0)
+                    tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * limits["rate"])
+
+                    if tokens < 1.0:
+                        raise Rejected(key, "rate limit exceeded", math.ceil((1.0 - tokens) / limits["rate"]))
+
+                    updates.append((key, tokens - 1.0))
+
+            # Só consome depois de todos os limites aprovarem
+            for key, tokens in updates:
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now)
+                )
+            for key, limits in checks:
+                if limits.get("max_concurrent"):
+                    conn.execute("INSERT OR REPLACE INTO slots (key, job_id, acquired_at) VALUES (?, ?, ?)", (key, job_id, now))
+
+            conn.execute("COMMIT")
+        except Rejected as e:
+            conn.execute("ROLLBACK")
+            with self._lock:
+                self._rejected += 1
+            metrics.ADMISSION_REJECTED.labels(e.key.split(":", 1)[0], e.reason).inc()
+            log.info("Infer request rejected by admission control", extra={
+                "limit": e.key, "reason": e.reason, "retry_after": e.retry_after
+            })
+            raise
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        with self._lock:
+            self._admitted += 1
+
+    def release(self, job_id):
+        """Libera as vagas de concorrência do job (terminou ou não foi disparado)."""
+        self._connection().execute("DELETE FROM slots WHERE job_id = ?", (job_id,))
+
+    def usage(self):
+        conn = self._connection()
+        return {key: count for key, count in conn.execute("SELECT key, COUNT(*) FROM slots GROUP BY key")}
+
+    def stats(self):
+        # usage() fora do lock: _connection() também o usa
+        in_progress = self.usage()
+
+        with self._lock:
+            return {
+                "project_limits": self.project_limits,
+                "user_limits": self.user_limits,
+                "overrides": len(self.overrides),
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "in_progress": in_progress
+            }
+
+
+controller = AdmissionController()
@@ -0,0 +1,359 @@
+"""
+Logging estruturado e assíncrono do servidor mock.
+
+O request só monta o registro (dict) e o coloca em uma fila limitada
+(put_nowait): quem escreve no stdout é uma thread QueueListener por
+processo, então um coletor de logs lento não trava as threads do
+gunicorn. Com a fila cheia o registro é descartado e contado.
+
+A mesma thread guarda os últimos LOG_BUFFER_SIZE registros em memória
+(RingBuffer), servidos pelo GET /logs sem nenhum I/O extra. Cada registro
+tem um seq crescente: /logs?since=<seq> devolve só os novos e
+/logs?follow=1 acompanha em streaming (NDJSON). O buffer é por worker do
+gunicorn (cada registro traz o pid).
+
+    LOG_LEVEL=INFO            nível mínimo
+    LOG_FORMAT=json|text      formato no stdout
+    LOG_SAMPLING=DEBUG=0.1    fração mantida por nível (WARNING+ sempre 1)
+
+Uso:
+
+    log = applog.get_logger(__name__)
+    log.info("Fargate task started", extra={"started_by": started_by, "task_arn": arn})
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "DEBUG=0.1")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "2000"))
+
+# /logs?follow=1: tempo máximo de uma conexão e intervalo dos heartbeats
+LOG_FOLLOW_TIMEOUT = float(os.getenv("LOG_FOLLOW_TIMEOUT", "300"))
+LOG_FOLLOW_HEARTBEAT = float(os.getenv("LOG_FOLLOW_HEARTBEAT", "15"))
+# No gunicorn gthread cada follow prende uma thread do worker pela conexão
+# inteira: no máximo LOG_FOLLOW_MAX por worker (o asgi.py não tem esse limite)
+LOG_FOLLOW_MAX = int(os.getenv("LOG_FOLLOW_MAX", "1"))
+
+# Registros devolvidos por /logs sem since nem lines
+LOG_DEFAULT_LINES = 200
+
+ROOT_LOGGER = "monai_mock"
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+def parse_sampling(text):
+    """"DEBUG=0.1,INFO=0.5" -> {10: 0.1, 20: 0.5}"""
+    rates = {}
+
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        name, _, rate = part.partition("=")
+        level = logging.getLevelName(name.strip().upper())
+        if isinstance(level, int) and level < logging.WARNING:
+            rates[level] = min(1.0, max(0.0, float(rate)))
+
+    return rates
+
+
+def make_entry(record):
+    entry = {
+        "ts": round(record.created, 6),
+        "level": record.levelname,
+        "logger": record.name,
+        "message": record.getMessage(),
+        "pid": record.process,
+        "thread": record.threadName
+    }
+
+    for key, value in vars(record).items():
+        if key not in _STANDARD_ATTRS and key != "entry":
+            entry[key] = value
+
+    if record.exc_info:
+        entry["exception"] = logging.Formatter().formatException(record.exc_info)
+
+    return entry
+
+
+# =========================================================
+# Buffer em memória (/logs)
+# =========================================================
+class RingBuffer:
+
+    def __init__(self, size=LOG_BUFFER_SIZE):
+        self._entries = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._next_seq = 1
+
+    def _after_fork(self):
+        # O lock pode ter sido copiado travado por outra thread do pai
+        self._cond = threading.Condition()
+
+    @property
+    def last_seq(self):
+        return self._next_seq - 1
+
+    def append(self, entry):
+        with self._cond:
+            entry["seq"] = self._next_seq
+            self._next_seq += 1
+            self._entries.append(entry)
+            self._cond.notify_all()
+
+    def since(self, seq=0, level=None, limit=None):
+        """(registros com seq > seq, último seq) - fatia direta, sem varrer o buffer."""
+        min_level = logging.getLevelName(level.upper()) if level else 0
+        if not isinstance(min_level, int):
+            min_level = 0
+
+        with self._cond:
+            last = self._next_seq - 1
+            if not self._entries or seq >= last:
+                return [], last
+
+            first = self._entries[0]["seq"]
+            start = max(0, seq - first + 1)
+            entries = [self._entries[i] for i in range(start, len(self._entries))]
+
+        if min_level:
+            entries = [e for e in entries if logging.getLevelName(e["level"]) >= min_level]
+        if limit:
+            entries = entries[-limit:]
+
+        return entries, last
+
+    def wait(self, seq, timeout):
+        """Espera um registro com seq maior que seq (follow)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._next_seq - 1 > seq, timeout)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+buffer = RingBuffer()
+
+
+# =========================================================
+# Handlers
+# =========================================================
+class SamplingFilter(logging.Filter):
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+
+        self.sampled_out += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enfileira sem bloquear; a thread de escrita sobe no primeiro log de cada processo."""
+
+    def __init__(self, handlers, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self._handlers = handlers
+        self._maxsize = maxsize
+        self._listener = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def _after_fork(self):
+        self.queue = queue.Queue(maxsize=self._maxsize)
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._listener is not None:
+            return
+
+        with self._start_lock:
+            if self._listener is None:
+                listener = logging.handlers.QueueListener(self.queue, *self._handlers, respect_handler_level=True)
+                listener.start()
+                self._listener = listener
+
+    def prepare(self, record):
+        # Monta o dict aqui: os argumentos podem mudar depois que o request segue
+        record.entry = make_entry(record)
+        record.msg = record.entry["message"]
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_started()
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
+class RingBufferHandler(logging.Handler):
+
+    def __init__(self, ring):
+        super().__init__()
+        self.ring = ring
+
+    def emit(self, record):
+        self.ring.append(record.entry)
+
+
+class EntryFormatter(logging.Formatter):
+
+    def __init__(self, style="json"):
+        super().__init__()
+        self.style = style
+
+    def format(self, record):
+        entry = record.entry
+
+        if self.style == "json":
+            return json.dumps(entry, ensure_ascii=False, default=str, separators=(",", ":"))
+
+        extra = " ".join(
+            f"{key}={value}" for key, value in entry.items()
+            if key not in ("ts", "level", "logger", "message", "pid", "thread", "seq", "exception")
+        )
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['ts']))} {entry['level']:<7} [{entry['pid']}] {entry['message']}"
+        if extra:
+            line += f" | {extra}"
+        if "exception" in entry:
+            line += "\n" + entry["exception"]
+        return line
+
+
+def _setup():
+    stdout = logging.StreamHandler(sys.stdout)
+    stdout.setFormatter(EntryFormatter(LOG_FORMAT))
+
+    handler = NonBlockingQueueHandler([RingBufferHandler(buffer), stdout])
+    sampling = SamplingFilter(parse_sampling(LOG_SAMPLING))
+    handler.addFilter(sampling)
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(LOG_LEVEL)
+    root.handlers = [handler]
+    root.propagate = False
+
+    return handler, sampling
+
+
+_handler, _sampling = _setup()
+
+os.register_at_fork(after_in_child=buffer._after_fork)
+os.register_at_fork(after_in_child=_handler._after_fork)
+atexit.register(_handler.stop)
+
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+# =========================================================
+# /logs
+# =========================================================
+def read(since=None, level=None, lines=None):
+    if since is None and lines is None:
+        lines = LOG_DEFAULT_LINES
+    entries, last_seq = buffer.since(since or 0, level=level, limit=lines)
+    return {"pid": os.getpid(), "last_seq": last_seq, "entries": entries}
+
+
+_follow_lock = threading.Lock()
+_followers = 0
+_followers_rejected = 0
+
+
+class Follower:
+    """Iterável do follow; o servidor WSGI chama close() no fim e a vaga volta."""
+
+    def __init__(self, entries):
+        self._entries = entries
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._entries)
+
+    def close(self):
+        global _followers
+
+        self._entries.close()
+        with _follow_lock:
+            if not self._closed:
+                self._closed = True
+                _followers -= 1
+
+
+def follow(since=None, level=None, timeout=LOG_FOLLOW_TIMEOUT, heartbeat=LOG_FOLLOW_HEARTBEAT):
+    """
+    NDJSON para /logs?follow=1 (sem since: só registros novos), ou None
+    quando este worker já tem LOG_FOLLOW_MAX conexões acompanhando.
+    """
+    global _followers, _followers_rejected
+
+    with _follow_lock:
+        if _followers >= LOG_FOLLOW_MAX:
+            _followers_rejected += 1
+            return None
+        _followers += 1
+
+    # Posição lida agora, não no primeiro next(): nada escrito depois do pedido se perde
+    seq = buffer.last_seq if since is None else since
+    return Follower(_follow(seq, level, timeout, heartbeat))
+
+
+def _follow(seq, level, timeout, heartbeat):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        entries, seq = buffer.since(seq, level=level)
+
+        for entry in entries:
+            yield json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+        if not entries and not buffer.wait(seq, min(heartbeat, max(0.0, deadline - time.monotonic()))):
+            # Linha vazia mantém a conexão viva em proxies
+            yield "\n"
+
+
+def stats():
+    return {
+        "level": LOG_LEVEL,
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "sampled_out": _sampling.sampled_out,
+        "buffered": len(buffer),
+        "last_seq": buffer.last_seq,
+        "followers": _followers,
+        "followers_rejected": _followers_rejected
+    }
@@ -0,0 +1,462 @@
+"""
+Modo ASGI (asyncio) do servidor MONAI Label mock.
+
+Mesmas rotas do monaimockv1.py, servidas por um event loop: um /infer
+lento para o backend de IA fica esperando em um await, sem prender uma
+thread do gunicorn, então um processo segura milhares de inferências em
+andamento e /health continua respondendo.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+    gunicorn -w 4 -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8000 asgi:app
+
+Modelos com "dispatch": "ecs" no models.json são disparados no ECS (ef.py).
+Os demais são repassados em streaming para AI_BACKEND_URL, quando configurada.
+"""
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+from werkzeug.http import parse_options_header
+
+import applog
+import http_cache
+import inference
+import jobs
+import labels
+import metrics
+import proxy
+import warmpool
+
+
+log = applog.get_logger(__name__)
+
+AI_BACKEND_URL = os.getenv("AI_BACKEND_URL")
+
+# /logs?follow=1 e /work/lease: intervalo entre consultas
+FOLLOW_POLL_INTERVAL = 0.25
+
+# Conexões simultâneas ao backend por processo (não há threads para limitar)
+ASYNC_BACKEND_MAX_CONNECTIONS = int(os.getenv("ASYNC_BACKEND_MAX_CONNECTIONS", "1000"))
+
+_backend = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global _backend
+
+    # Um cliente por worker, criado depois do fork do gunicorn
+    _backend = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=ASYNC_BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=proxy.BACKEND_POOL_MAXSIZE
+        ),
+        timeout=httpx.Timeout(proxy.BACKEND_READ_TIMEOUT, connect=proxy.BACKEND_CONNECT_TIMEOUT)
+    )
+
+    try:
+        yield
+    finally:
+        await _backend.aclose()
+
+
+def _make_response(status, body, headers):
+    if body is None:
+        return Response(status_code=status, headers=headers)
+
+    if isinstance(body, bytes):
+        return Response(body, status_code=status, headers=headers, media_type="application/json")
+
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+def _label_response(request, path, label, stat):
+    # Range / If-Range pelo FileResponse; o 304 é por conta daqui
+    headers = labels.file_headers(label, stat)
+
+    if labels.not_modified(label, stat, request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        metrics.LABEL_RESPONSES.labels("not_modified").inc()
+        return Response(status_code=304, headers=headers)
+
+    metrics.LABEL_RESPONSES.labels("range" if "range" in request.headers else "full").inc()
+    return FileResponse(
+        path, media_type=label["content_type"], filename=label["filename"], headers=headers, stat_result=stat
+    )
+
+
+def _precomputed_response(request, document):
+    if document.not_modified(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=document.headers)
+
+    return Response(document.body, headers=document.headers, media_type="application/json")
+
+
+# =========================================================
+# /info, /datastore, /session
+# =========================================================
+async def info(request):
+    return _precomputed_response(request, inference.models.current().rendered_info)
+
+
+async def info_models(request):
+    return _precomputed_response(request, inference.models.current().rendered_models)
+
+
+async def info_model(request):
+    model = inference.models.current().rendered_model.get(request.path_params["name"])
+
+    if model is None:
+        return JSONResponse({"error": "Model not found"}, status_code=404)
+
+    return _precomputed_response(request, model)
+
+
+async def datastore_info(request):
+    # Consulta o XNAT (bloqueante) fora do event loop
+    return JSONResponse(await run_in_threadpool(inference.datastore_info, request.query_params.get("image", "")))
+
+
+async def session_create(request):
+    return JSONResponse(inference.create_session())
+
+
+# =========================================================
+# /infer
+# =========================================================
+async def infer(request):
+    model_name = request.path_params["model_name"]
+
+    if not inference.is_ecs_model(model_name) and AI_BACKEND_URL:
+        return await _proxy_infer(request, model_name)
+
+    # O disparo (cache em disco, fila) roda fora do event loop
+    status, body, headers = await run_in_threadpool(
+        inference.submit_infer,
+        model_name,
+        request.query_params.get("image", ""),
+        use_cache="no-cache" not in request.headers.get("cache-control", ""),
+        if_none_match=request.headers.get("if-none-match"),
+        user=request.headers.get("x-user"),
+        proxy_secret=request.headers.get("x-proxy-secret"),
+        traceparent=request.headers.get("traceparent")
+    )
+
+    # output=image (MONAI Label): resultado pronto volta como o arquivo de label
+    if request.query_params.get("output") == "image":
+        found = await run_in_threadpool(labels.result_label, status, body)
+        if found is not None:
+            return _label_response(request, *found)
+
+    return _make_response(status, body, headers)
+
+
+async def _proxy_infer(request, model_name):
+    mimetype, mimetype_params = parse_options_header(request.headers.get("content-type", ""))
+    upload = proxy.AsyncStreamingUpload(request.stream(), mimetype, mimetype_params, model_name)
+
+    try:
+        await upload.prepare()
+    except proxy.NoFileReceived:
+        return JSONResponse({
+            "error": "No file received",
+            "message": "Expected 'file' or 'image' in multipart/form-data"
+        }, status_code=400)
+    except proxy.FieldTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+
+    started = time.perf_counter()
+
+    stream = proxy.RESPONSE_MODE == "stream"
+    accept_encoding = request.headers.get("accept-encoding")
+
+    try:
+        response = await _backend.send(_backend.build_request(
+            "POST",
+            AI_BACKEND_URL,
+            content=upload,
+            headers={"Content-Type": upload.content_type, **proxy.response_headers(accept_encoding)}
+        ), stream=stream)
+    except proxy.FieldTooLarge as e:
+        # Campo depois do arquivo: o envio ao backend já foi abortado
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except httpx.ConnectError as e:
+        metrics.backend_request(time.perf_counter() - started, type(e).__name__, upload.bytes_sent, 0)
+        log.warning("AI backend unavailable", extra={"url": AI_BACKEND_URL})
+        try:
+            await upload.drain()
+        except proxy.FieldTooLarge as e:
+            return JSONResponse({"error": str(e)}, status_code=413)
+        return JSONResponse({"error": f"Backend unavailable at {AI_BACKEND_URL}"}, status_code=502)
+    except httpx.HTTPError as e:
+        metrics.backend_request(time.perf_counter() - started, type(e).__name__, upload.bytes_sent, 0)
+        return JSONResponse({"error": str(e), "type": type(e).__name__}, status_code=502)
+
+    if stream and response.status_code == 200:
+        # Os bytes recebidos são contados pelo relay, enquanto passam
+        metrics.backend_request(time.perf_counter() - started, response.status_code, upload.bytes_sent, 0)
+        relay = proxy.AsyncResponseRelay(response, accept_encoding)
+        return StreamingResponse(relay, headers=relay.headers)
+
+    await response.aread()
+    metrics.backend_request(
+        time.perf_counter() - started, response.status_code, upload.bytes_sent, len(response.content)
+    )
+
+    if response.status_code != 200:
+        return JSONResponse({
+            "error": f"Backend returned {response.status_code}",
+            "details": response.text
+        })
+
+    return JSONResponse(response.json())
+
+
+# =========================================================
+# /jobs, /results, /health
+# =========================================================
+# Store compartilhado (SQLite / Redis), XNAT, filas e labels em disco: tudo
+# bloqueante, sempre fora do event loop
+async def list_jobs(request):
+    return _make_response(*await run_in_threadpool(
+        inference.list_jobs,
+        request.headers.get("authorization"),
+        project=request.query_params.get("project"),
+        status=request.query_params.get("status")
+    ))
+
+
+async def get_job(request):
+    job_id = request.path_params["job_id"]
+    job = await run_in_threadpool(jobs.store.get, job_id)
+
+    if job is None:
+        return JSONResponse({"error": f"Job '{job_id}' not found"}, status_code=404)
+
+    return JSONResponse(job)
+
+
+async def get_label(request):
+    found, error = await run_in_threadpool(labels.locate, request.path_params["job_id"])
+    if error:
+        return _make_response(*error)
+
+    return _label_response(request, *found)
+
+
+async def upload_label(request):
+    content_length = request.headers.get("content-length")
+    writer, error = await run_in_threadpool(
+        labels.begin_upload,
+        request.headers.get("authorization"),
+        request.path_params["job_id"],
+        int(content_length) if content_length and content_length.isdigit() else None
+    )
+    if error:
+        return _make_response(*error)
+
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(writer.write, chunk)
+    except labels.LabelTooLarge as e:
+        return _make_response(*labels.reject_upload(writer, e))
+    except BaseException:
+        writer.abort()
+        raise
+
+    mimetype, _ = parse_options_header(request.headers.get("content-type", ""))
+    return _make_response(*await run_in_threadpool(
+        labels.finish_upload, writer, request.query_params.get("filename"), mimetype
+    ))
+
+
+async def invalidate_results(request):
+    return _make_response(*await run_in_threadpool(
+        inference.invalidate_results,
+        request.headers.get("authorization"),
+        request.path_params["model_name"],
+        request.query_params.get("image", "")
+    ))
+
+
+async def health(request):
+    return JSONResponse(await run_in_threadpool(inference.health, detail=request.query_params.get("detail") == "1"))
+
+
+async def logs(request):
+    """
+    Últimos registros deste worker: ?since=<seq> só os novos, ?level=WARNING,
+    ?lines=N (padrão 200 sem since) e ?follow=1 para acompanhar (NDJSON).
+    """
+    since = request.query_params.get("since")
+    since = int(since) if since and since.isdigit() else None
+    level = request.query_params.get("level")
+
+    if request.query_params.get("follow") in ("1", "true"):
+        return StreamingResponse(_follow_logs(since, level), media_type="application/x-ndjson")
+
+    lines = request.query_params.get("lines")
+    return JSONResponse(applog.read(since, level, int(lines) if lines and lines.isdigit() else None))
+
+
+async def _follow_logs(since, level):
+    # Consulta o buffer em vez de esperar na Condition: não prende uma thread
+    seq = applog.buffer.last_seq if since is None else since
+    deadline = time.monotonic() + applog.LOG_FOLLOW_TIMEOUT
+    idle = 0.0
+
+    while time.monotonic() < deadline:
+        entries, seq = applog.buffer.since(seq, level=level)
+
+        for entry in entries:
+            yield json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+        if entries:
+            idle = 0.0
+            continue
+
+        await asyncio.sleep(FOLLOW_POLL_INTERVAL)
+        idle += FOLLOW_POLL_INTERVAL
+        if idle >= applog.LOG_FOLLOW_HEARTBEAT:
+            idle = 0.0
+            yield "\n"
+
+
+async def prometheus_metrics(request):
+    body, content_type = await run_in_threadpool(metrics.render)
+    return Response(body, headers={"Content-Type": content_type})
+
+
+# =========================================================
+# /work (warm pool de workers EF)
+# =========================================================
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+async def work_lease(request):
+    """Long poll consultando a fila sem prender uma thread pelo tempo todo."""
+    authorization = request.headers.get("authorization")
+    body = await _json_body(request)
+
+    wait = warmpool.parse_wait(body)
+    if wait is None:
+        return _make_response(*warmpool.lease(authorization, body))
+
+    deadline = time.monotonic() + wait
+    while True:
+        status, payload, headers = await run_in_threadpool(warmpool.lease, authorization, dict(body, wait=0))
+        if status != 204 or time.monotonic() >= deadline:
+            return _make_response(status, payload, headers)
+        await asyncio.sleep(FOLLOW_POLL_INTERVAL)
+
+
+async def work_heartbeat(request):
+    return _make_response(*await run_in_threadpool(
+        warmpool.heartbeat, request.headers.get("authorization"),
+        request.path_params["lease_id"], await _json_body(request)
+    ))
+
+
+async def work_complete(request):
+    return _make_response(*await run_in_threadpool(
+        warmpool.complete, request.headers.get("authorization"),
+        request.path_params["lease_id"], await _json_body(request)
+    ))
+
+
+async def work_pool(request):
+    return _make_response(*await run_in_threadpool(warmpool.status))
+
+
+class MetricsMiddleware:
+    """Latência e pedidos em andamento por template de rota (inclui preflights)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route = next(
+            (r.path for r in routes if r.matches(scope)[0] != Match.NONE),
+            "unmatched"
+        )
+        started = metrics.request_started(route)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.request_finished(route, scope["method"], status, started)
+
+
+routes = [
+    Route("/info", info, methods=["GET"]),
+    Route("/info/", info, methods=["GET"]),
+    Route("/info/models", info_models, methods=["GET"]),
+    Route("/info/model/{name}", info_model, methods=["GET"]),
+    Route("/datastore/image/info/", datastore_info, methods=["GET"]),
+    Route("/session/", session_create, methods=["POST"]),
+    Route("/infer/{model_name}", infer, methods=["POST"]),
+    Route("/infer/{model_name}/", infer, methods=["POST"]),
+    Route("/jobs", list_jobs, methods=["GET"]),
+    Route("/jobs/", list_jobs, methods=["GET"]),
+    Route("/jobs/{job_id}", get_job, methods=["GET"]),
+    Route("/jobs/{job_id}/label", get_label, methods=["GET"]),
+    Route("/jobs/{job_id}/label", upload_label, methods=["PUT"]),
+    Route("/results/{model_name}", invalidate_results, methods=["DELETE"]),
+    Route("/health", health, methods=["GET"]),
+    Route("/logs", logs, methods=["GET"]),
+    Route("/logs/", logs, methods=["GET"]),
+    Route("/metrics", prometheus_metrics, methods=["GET"]),
+    Route("/work/lease", work_lease, methods=["POST"]),
+    Route("/work/pool", work_pool, methods=["GET"]),
+    Route("/work/{lease_id}/heartbeat", work_heartbeat, methods=["POST"]),
+    Route("/work/{lease_id}/complete", work_complete, methods=["POST"]),
+]
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[
+        Middleware(MetricsMiddleware),
+        Middleware(
+            CORSMiddleware,
+            allow_origins=inference.CORS_ORIGINS,
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            max_age=http_cache.CORS_MAX_AGE
+        )
+    ]
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    print("\n🚀 MONAI Label mock server (asyncio) running at:")
+    print("👉 http://0.0.0.0:8000\n")
+
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,581 @@
+"""
+Teste de carga do servidor mock.
+
+Sobe o servidor no gunicorn com o launcher ECS falso (EF_LAUNCHER=fake),
+o backend de IA falso (fake_backend.py), com --xnat o XNAT falso
+(fake_xnat.py) e, com --redis, o estado compartilhado no Redis falso
+(fake_redis.py) em vez do SQLite. Em seguida dispara tráfego misto:
+
+    info       GET /info/ (polling do OHIF / XNAT)
+    preflight  OPTIONS /infer/<modelo> (CORS)
+    infer      POST /infer/<infer-model>?image=... (disparo EF)
+    upload     POST /infer/<upload-model> com um volume de --upload-mb
+    burst      rajadas de --burst-size infer simultâneos a cada --burst-interval
+
+Relata, por rota, p50/p90/p99, throughput, taxa de erro e a memória (RSS)
+somada do master e dos workers. Listas em --server/--workers/--threads
+rodam todas as combinações:
+
+    python bench.py run --server monaimockv1.py --workers 2,4 --threads 1,4 --out runs/v1.json
+    python bench.py run --server futureversions/monaimockv.1.2.py --mix info=50,upload=50
+    python bench.py compare runs/v1.json runs/v12.json
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Sem upload: o servidor padrão (monaimockv1.py) só serve modelos ECS e
+# responderia 404 para --upload-model. Nas versões com backend de IA
+# (futureversions/) acrescente upload=N ao --mix
+DEFAULT_MIX = "info=60,preflight=20,infer=20"
+ORIGIN = "http://localhost"
+
+# Carrega a versão pelo caminho: o nome pode ter pontos (monaimockv.1.2.py)
+# e __file__ continua apontando para o diretório original
+APP_LOADER = """import importlib.util
+spec = importlib.util.spec_from_file_location("bench_server", {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+{app} = module.{app}
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(url, process=None, timeout=30):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with code {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+
+    raise RuntimeError(f"{url} did not come up in {timeout}s")
+
+
+def wait_for_port(port, process=None, timeout=30):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"port {port}: process exited with code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+
+    raise RuntimeError(f"port {port} did not open in {timeout}s")
+
+
+def start_process(args, env, log_path):
+    log = open(log_path, "wb")
+    return subprocess.Popen(args, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def stop_process(process, timeout=15):
+    if process.poll() is not None:
+        return
+
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def percentile(values, p):
+    """values já ordenados."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+# =========================================================
+# Memória (RSS do master + workers, via /proc)
+# =========================================================
+def _process_tree(root_pid):
+    children = {}
+
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    pids = [root_pid]
+    for pid in pids:
+        pids.extend(children.get(pid, []))
+
+    return pids
+
+
+def rss_bytes(root_pid):
+    total = 0
+
+    for pid in _process_tree(root_pid):
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+
+    return total
+
+
+class RssSampler(threading.Thread):
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.start_bytes = rss_bytes(pid)
+        self.peak = self.start_bytes
+        self.last = self.start_bytes
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.last = rss_bytes(self.pid)
+            self.peak = max(self.peak, self.last)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def report(self):
+        mb = 1024 * 1024
+        return {
+            "start": round(self.start_bytes / mb, 1),
+            "peak": round(self.peak / mb, 1),
+            "end": round(self.last / mb, 1)
+        }
+
+
+# =========================================================
+# Tráfego
+# =========================================================
+class Recorder:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+
+    def record(self, route, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            self.statuses.setdefault(route, Counter())[str(status)] += 1
+
+    def report(self, duration):
+        routes = {route: self._summary(self.latencies[route], self.statuses[route], duration) for route in self.latencies}
+
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        all_statuses = sum(self.statuses.values(), Counter())
+
+        return routes, self._summary(all_latencies, all_statuses, duration)
+
+    @staticmethod
+    def _summary(latencies, statuses, duration):
+        latencies = sorted(latencies)
+        requests_count = len(latencies)
+        errors = sum(count for status, count in statuses.items() if not _ok(status))
+
+        return {
+            "requests": requests_count,
+            "rps": round(requests_count / duration, 2) if duration else 0.0,
+            "errors": errors,
+            "error_rate": round(errors / requests_count, 4) if requests_count else 0.0,
+            "statuses": dict(statuses),
+            "mean_ms": round(sum(latencies) / requests_count * 1000, 2) if requests_count else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p90_ms": round(percentile(latencies, 90) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0
+        }
+
+
+def _ok(status):
+    return status.isdigit() and (200 <= int(status) < 300 or status == "304")
+
+
+class Traffic:
+
+    def __init__(self, base_url, args, payload):
+        self.base_url = base_url
+        self.args = args
+        self.payload = payload
+        self.scenarios = {
+            "info": self.info,
+            "preflight": self.preflight,
+            "infer": self.infer,
+            "upload": self.upload
+        }
+
+    def info(self, session, rng):
+        return session.get(f"{self.base_url}/info/", timeout=self.args.timeout).status_code
+
+    def preflight(self, session, rng):
+        return session.options(
+            f"{self.base_url}/infer/{self.args.infer_model}",
+            headers={
+                "Origin": ORIGIN,
+                "Access-Control-Request-Method": "POST",
+                "Access-Control-Request-Headers": "content-type"
+            },
+            timeout=self.args.timeout
+        ).status_code
+
+    def infer(self, session, rng):
+        # Exames diferentes a cada pedido: dedup e cache de resultados não mascaram o disparo
+        n = rng.randrange(10 ** 9)
+        return session.post(
+            f"{self.base_url}/infer/{self.args.infer_model}",
+            params={"image": f"bench/subject{n % 1000}/exam{n}/4"},
+            headers={"Origin": ORIGIN},
+            timeout=self.args.timeout
+        ).status_code
+
+    def upload(self, session, rng):
+        return session.post(
+            f"{self.base_url}/infer/{self.args.upload_model}",
+            files={"file": ("volume.nii.gz", self.payload, "application/gzip")},
+            headers={"Origin": ORIGIN},
+            timeout=self.args.timeout
+        ).status_code
+
+    def call(self, recorder, route, fn, session, rng):
+        start = time.perf_counter()
+        try:
+            status = fn(session, rng)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        if recorder is not None:
+            recorder.record(route, time.perf_counter() - start, status)
+
+    def client(self, recorder, mix, deadline, seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        names = list(mix)
+        weights = [mix[name] for name in names]
+
+        while time.monotonic() < deadline:
+            route = rng.choices(names, weights)[0]
+            self.call(recorder, route, self.scenarios[route], session, rng)
+
+        session.close()
+
+    def bursts(self, recorder, deadline, seed):
+        rng = random.Random(seed)
+
+        while time.monotonic() + self.args.burst_interval < deadline:
+            time.sleep(self.args.burst_interval)
+            threads = [
+                threading.Thread(
+                    target=self.call,
+                    args=(recorder, "infer_burst", self.infer, requests.Session(), random.Random(rng.random()))
+                )
+                for _ in range(self.args.burst_size)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    def drive(self, recorder, mix, seconds):
+        deadline = time.monotonic() + seconds
+        threads = [
+            threading.Thread(target=self.client, args=(recorder, mix, deadline, self.args.seed + i))
+            for i in range(self.args.clients)
+        ]
+        if self.args.burst_size:
+            threads.append(threading.Thread(target=self.bursts, args=(recorder, deadline, self.args.seed)))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("info", "preflight", "infer", "upload"):
+            raise SystemExit(f"Unknown scenario '{name}' in --mix")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# =========================================================
+# Execução
+# =========================================================
+def run_one(server, workers, threads, args, backend_url, xnat_url, state_url, payload):
+    worker_class = args.worker_class or (
+        "uvicorn.workers.UvicornWorker" if os.path.basename(server) == "asgi.py" else "gthread"
+    )
+    label = f"{os.path.basename(server)} w{workers}t{threads}"
+    mix = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix="monai-bench-")
+    with open(os.path.join(workdir, "bench_app.py"), "w") as f:
+        f.write(APP_LOADER.format(path=os.path.abspath(server), app=args.app))
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+
+    env = dict(
+        os.environ,
+        EF_LAUNCHER="fake",
+        AI_BACKEND_URL=backend_url,
+        EF_STATE_URL=state_url or "sqlite://" + os.path.join(workdir, "state.sqlite3"),
+        EF_ADMISSION_DB=os.path.join(workdir, "admission.sqlite3"),
+        EF_DISPATCH_QUEUE_DB=os.path.join(workdir, "dispatch.sqlite3"),
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, "metrics"),
+        PYTHONUNBUFFERED="1"
+    )
+    if xnat_url:
+        env["XNAT_HOST"] = xnat_url
+
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "-w", str(workers), "-k", worker_class, "--threads", str(threads),
+        "-b", f"127.0.0.1:{port}",
+        "--pythonpath", f"{workdir},{ROOT}",
+        f"bench_app:{args.app}"
+    ]
+
+    print(f"\n⏱️  {label}: {args.clients} clients, {args.duration}s, mix {args.mix}")
+    server_process = start_process(command, env, os.path.join(workdir, "server.log"))
+
+    try:
+        wait_until_ready(f"{base_url}/info/", server_process)
+
+        traffic = Traffic(base_url, args, payload)
+        if args.warmup:
+            traffic.drive(None, mix, args.warmup)
+
+        sampler = RssSampler(server_process.pid)
+        sampler.start()
+
+        recorder = Recorder()
+        started = time.monotonic()
+        traffic.drive(recorder, mix, args.duration)
+        elapsed = time.monotonic() - started
+
+        sampler.stop()
+    finally:
+        stop_process(server_process)
+        if args.keep_logs:
+            print(f"📄 Server log: {os.path.join(workdir, 'server.log')}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    routes, total = recorder.report(elapsed)
+
+    return {
+        "label": label,
+        "server": os.path.relpath(os.path.abspath(server), ROOT),
+        "workers": workers,
+        "threads": threads,
+        "worker_class": worker_class,
+        "clients": args.clients,
+        "duration": round(elapsed, 2),
+        "mix": args.mix,
+        "upload_mb": args.upload_mb,
+        "burst": {"size": args.burst_size, "interval": args.burst_interval},
+        "xnat": bool(xnat_url),
+        "state": "redis" if state_url else "sqlite",
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "routes": routes,
+        "total": total,
+        "rss_mb": sampler.report()
+    }
+
+
+def print_report(report):
+    print(f"\n📊 {report['label']}  ({report['duration']}s, RSS peak {report['rss_mb']['peak']} MB)")
+    print(f"{'route':<13}{'requests':>10}{'rps':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>9}")
+
+    for route, stats in sorted(report["routes"].items()) + [("TOTAL", report["total"])]:
+        print(
+            f"{route:<13}{stats['requests']:>10}{stats['rps']:>10.1f}{stats['p50_ms']:>10.1f}"
+            f"{stats['p90_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+            f"{stats['error_rate'] * 100:>8.1f}%"
+        )
+
+    for route, stats in sorted(report["routes"].items()):
+        if stats["errors"]:
+            print(f"   ⚠️  {route}: {stats['statuses']}")
+
+
+def cmd_run(args):
+    servers = [s.strip() for s in args.server.split(",") if s.strip()]
+    workers = [int(w) for w in args.workers.split(",")]
+    threads = [int(t) for t in args.threads.split(",")]
+
+    # Volume gerado só quando o mix tem upload
+    payload = os.urandom(int(args.upload_mb * 1024 * 1024)) if "upload" in parse_mix(args.mix) else b""
+    logdir = tempfile.mkdtemp(prefix="monai-bench-stubs-")
+    stubs = []
+
+    try:
+        backend_port = free_port()
+        backend_env = dict(os.environ, FAKE_BACKEND_LATENCY_MS=str(args.backend_latency_ms))
+        stubs.append(start_process(
+            [sys.executable, "fake_backend.py", "--host", "127.0.0.1", "--port", str(backend_port)],
+            backend_env, os.path.join(logdir, "backend.log")
+        ))
+        backend_url = f"http://127.0.0.1:{backend_port}/predict"
+        wait_until_ready(f"http://127.0.0.1:{backend_port}/health", stubs[-1])
+
+        xnat_url = None
+        if args.xnat:
+            xnat_port = free_port()
+            stubs.append(start_process(
+                [sys.executable, "fake_xnat.py", "--host", "127.0.0.1", "--port", str(xnat_port)],
+                dict(os.environ), os.path.join(logdir, "xnat.log")
+            ))
+            xnat_url = f"http://127.0.0.1:{xnat_port}"
+            wait_until_ready(f"{xnat_url}/fake/stats", stubs[-1])
+
+        state_url = None
+        if args.redis:
+            redis_port = free_port()
+            stubs.append(start_process(
+                [sys.executable, "fake_redis.py", "--host", "127.0.0.1", "--port", str(redis_port)],
+                dict(os.environ), os.path.join(logdir, "redis.log")
+            ))
+            wait_for_port(redis_port, stubs[-1])
+
+        reports = []
+        for server, w, t in itertools.product(servers, workers, threads):
+            # Um banco por configuração: runs não herdam jobs / cache da anterior
+            if args.redis:
+                state_url = f"redis://127.0.0.1:{redis_port}/{len(reports)}"
+            report = run_one(server, w, t, args, backend_url, xnat_url, state_url, payload)
+            print_report(report)
+            reports.append(report)
+    finally:
+        for stub in stubs:
+            stop_process(stub)
+        shutil.rmtree(logdir, ignore_errors=True)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump({"runs": reports}, f, indent=2)
+        print(f"\n💾 Saved {len(reports)} run(s) to {args.out}")
+
+    if len(reports) > 1:
+        compare(reports)
+
+
+def compare(reports):
+    baseline = reports[0]
+    routes = sorted({route for report in reports for route in report["routes"]}) + ["TOTAL"]
+
+    print(f"\n🔍 Comparison (baseline: {baseline['label']})")
+    print(f"{'run':<32}{'route':<13}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>9}{'Δ p99':>10}{'RSS MB':>9}")
+
+    for route in routes:
+        base = baseline["total"] if route == "TOTAL" else baseline["routes"].get(route)
+
+        for report in reports:
+            stats = report["total"] if route == "TOTAL" else report["routes"].get(route)
+            if stats is None:
+                continue
+
+            delta = ""
+            if base and base["p99_ms"] and report is not baseline:
+                delta = f"{(stats['p99_ms'] / base['p99_ms'] - 1) * 100:+.0f}%"
+
+            print(
+                f"{report['label'][:31]:<32}{route:<13}{stats['rps']:>10.1f}{stats['p50_ms']:>10.1f}"
+                f"{stats['p99_ms']:>10.1f}{stats['error_rate'] * 100:>8.1f}%{delta:>10}{report['rss_mb']['peak']:>9.1f}"
+            )
+        print()
+
+
+def cmd_compare(args):
+    reports = []
+    for path in args.files:
+        with open(path) as f:
+            document = json.load(f)
+        reports.extend(document["runs"] if "runs" in document else [document])
+
+    compare(reports)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the MONAI Label mock server")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="start the server with local stubs and drive mixed traffic")
+    run.add_argument("--server", default="monaimockv1.py", help="server file(s), comma separated")
+    run.add_argument("--app", default="app", help="WSGI/ASGI object in the server file")
+    run.add_argument("--workers", default="4", help="gunicorn -w value(s), comma separated")
+    run.add_argument("--threads", default="4", help="gunicorn --threads value(s), comma separated")
+    run.add_argument("--worker-class", default=None, help="gunicorn -k (default: gthread, uvicorn for asgi.py)")
+    run.add_argument("--clients", type=int, default=16, help="concurrent client threads")
+    run.add_argument("--duration", type=float, default=20, help="measured seconds per configuration")
+    run.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each run")
+    run.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights, e.g. info=60,upload=40")
+    run.add_argument("--infer-model", default="ef_analysis")
+    run.add_argument("--upload-model", default="segmentation_ct")
+    run.add_argument("--upload-mb", type=float, default=20)
+    run.add_argument("--burst-size", type=int, default=0, help="infer requests per burst (0 = no bursts)")
+    run.add_argument("--burst-interval", type=float, default=5)
+    run.add_argument("--backend-latency-ms", type=float, default=50)
+    run.add_argument("--xnat", action="store_true", help="also start fake_xnat.py and set XNAT_HOST")
+    run.add_argument("--redis", action="store_true", help="also start fake_redis.py and use it as EF_STATE_URL")
+    run.add_argument("--timeout", type=float, default=60)
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--keep-logs", action="store_true")
+    run.add_argument("--out", help="write the reports as JSON")
+    run.set_defaults(func=cmd_run)
+
+    cmp = sub.add_parser("compare", help="compare saved JSON runs (first one is the baseline)")
+    cmp.add_argument("files", nargs="+")
+    cmp.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+"""
+Fila persistente em disco (SQLite) para os disparos do ef.py.
+
+O /infer só responde "OK" depois que o disparo está gravado: se o worker
+do gunicorn for reciclado ou o container reiniciar, o que estava na fila
+ou sendo lançado continua no arquivo e é entregue de novo.
+
+- Group commit: put() entrega o item a uma thread de escrita por processo,
+  que grava tudo o que acumulou em uma única transação (um fsync), e só
+  então libera quem esperava. Com muitos /infer simultâneos o custo do
+  fsync é dividido pelo lote, não pago por pedido.
+- Entrega pelo menos uma vez: get() "aluga" mensagens por
+  visibility_timeout segundos; quem não confirmar (ack) a tempo perde o
+  aluguel e a mensagem volta para a fila. Quem consome precisa tolerar
+  entregas repetidas. release() devolve antes, com um atraso (backoff).
+  ack() e release() só valem enquanto o aluguel é de quem chama: depois
+  que ele expira e a mensagem vai para outro consumidor, não fazem nada.
+- Replay: ao subir, replay() devolve na hora as mensagens alugadas por
+  processos que já não existem, sem esperar o visibility_timeout.
+- Aluguel remoto: get(owner=...) aluga em nome de outro consumidor (um
+  worker EF do warm pool, warmpool.py), que depois renova (extend) e
+  confirma (complete) pelo id. Esses aluguéis não passam pelo replay: só
+  voltam à fila quando expiram.
+
+O arquivo é compartilhado pelos workers do mesmo host: qualquer worker
+consome o que qualquer outro enfileirou.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    visible_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_visible ON messages (visible_at, id);
+"""
+
+# Quanto esperar entre consultas quando a fila está vazia (mensagens de
+# outros processos ou que voltaram do aluguel não acordam esta thread)
+POLL_INTERVAL = 0.5
+
+
+class QueueError(Exception):
+    """Falha ao gravar ou ler a fila em disco."""
+
+
+class CommitUnknown(QueueError):
+    """
+    put() esgotou o tempo com o item já na transação da thread de escrita:
+    ele pode ter sido gravado (e vai ser entregue) ou não. Quem enfileirou
+    não deve repetir o put, e sim tratar o disparo como possivelmente feito.
+    """
+
+
+class Message:
+
+    __slots__ = ("id", "payload", "enqueued_at", "attempts")
+
+    def __init__(self, id, payload, enqueued_at, attempts):
+        self.id = id
+        self.payload = payload
+        self.enqueued_at = enqueued_at
+        self.attempts = attempts
+
+
+class _Batch:
+    """Itens gravados no mesmo commit; quem os enfileirou espera done."""
+
+    def __init__(self):
+        self.items = []
+        self.done = threading.Event()
+        self.error = None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DiskQueue:
+
+    def __init__(self, path, visibility_timeout=120.0, commit_window=0.0, timeout=5.0):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.commit_window = commit_window
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = None
+        self._owner = None
+
+        self._init_process()
+
+    def _init_process(self):
+        # Tudo o que é por processo: conexões, thread de escrita, dono dos aluguéis
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._owner = f"{self._pid}:{uuid.uuid4().hex[:8]}"
+        self._cond = threading.Condition()
+        self._available = threading.Condition()
+        self._batch = _Batch()
+        self._committing = None
+        self._writer = None
+        self._depth = 0
+
+        self._commits = 0
+        self._committed = 0
+        self._commit_seconds = 0.0
+        self._commit_last = 0.0
+        self._redelivered = 0
+        self._replayed = 0
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._init_process()
+
+    def _open(self, synchronous):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _connection(self):
+        # Aluguel e ack sem fsync: se um deles se perder, a mensagem só é
+        # entregue de novo (o que o consumidor já precisa tolerar)
+        self._check_pid()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open("NORMAL")
+
+        return conn
+
+    def _abort(self, conn):
+        """
+        ROLLBACK depois de um erro. Se o próprio ROLLBACK falhar, o erro
+        original é o que sobe; a conexão que não saiu da transação é
+        fechada e a próxima chamada abre outra. False nesse caso.
+        """
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+        if not conn.in_transaction:
+            return True
+
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        if getattr(self._local, "conn", None) is conn:
+            self._local.conn = None
+        return False
+
+    def _add_depth(self, count):
+        with self._lock:
+            self._depth = max(0, self._depth + count)
+
+    # -----------------------------------------------------
+    # Escrita (group commit)
+    # -----------------------------------------------------
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="diskqueue-writer", daemon=True)
+                self._writer.start()
+
+    def put(self, payload):
+        """
+        Grava payload (texto) e só retorna depois do fsync. QueueError: não
+        foi gravado; CommitUnknown: o resultado não é conhecido.
+        """
+        self._check_pid()
+        self._ensure_writer()
+
+        item = (payload, time.time())
+        with self._cond:
+            batch = self._batch
+            batch.items.append(item)
+            self._cond.notify()
+
+        if not batch.done.wait(self.timeout):
+            with self._cond:
+                # Ainda não saiu para o disco: retira do lote e o erro é definitivo
+                pending = batch is self._batch
+                if pending:
+                    batch.items[:] = [other for other in batch.items if other is not item]
+
+            if pending:
+                raise QueueError("Timed out waiting for the dispatch queue commit")
+
+            # Já está na transação: espera o resultado mais um pouco
+            if not batch.done.wait(self.timeout):
+                raise CommitUnknown("Dispatch queue commit still running, the item may have been written")
+
+        if batch.error is not None:
+            raise QueueError(str(batch.error))
+
+    def _write_loop(self):
+        # FULL: o commit do lote só volta depois do fsync
+        conn = None
+
+        while True:
+            with self._cond:
+                while not self._batch.items:
+                    self._cond.wait()
+
+            # Janela opcional para juntar mais itens no mesmo fsync
+            if self.commit_window > 0:
+                time.sleep(self.commit_window)
+
+            with self._cond:
+                batch, self._batch = self._batch, _Batch()
+                self._committing = batch
+
+            started = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = self._open("FULL")
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO messages (payload, enqueued_at, visible_at) VALUES (?, ?, ?)",
+                    [(payload, enqueued_at, enqueued_at) for payload, enqueued_at in batch.items]
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if conn is not None and not self._abort(conn):
+                    conn = None
+                batch.error = e
+                batch.done.set()
+                continue
+
+            elapsed = time.perf_counter() - started
+            metrics.DISPATCH_COMMIT_LATENCY.observe(elapsed)
+            metrics.DISPATCH_COMMIT_SIZE.observe(len(batch.items))
+            with self._lock:
+                self._commits += 1
+                self._committed += len(batch.items)
+                self._commit_seconds += elapsed
+                self._commit_last = elapsed
+                self._depth += len(batch.items)
+
+            batch.done.set()
+            with self._available:
+                self._available.notify(len(batch.items))
+
+    def flush(self, timeout):
+        """Espera a gravação do que já foi entregue a put()."""
+        with self._cond:
+            batches = [b for b in (self._committing, self._batch) if b is not None and b.items]
+        return all(batch.done.wait(timeout) for batch in batches)
+
+    # -----------------------------------------------------
+    # Leitura (aluguel / ack)
+    # -----------------------------------------------------
+    def _lease(self, limit, owner=None):
+        conn = self._connection()
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, payload, enqueued_at, attempts FROM messages "
+                "WHERE visible_at <= ? ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+
+            if rows:
+                conn.executemany(
+                    "UPDATE messages SET visible_at = ?, owner = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(now + self.visibility_timeout, owner or self._owner, row[0]) for row in rows]
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            self._abort(conn)
+            raise
+
+        messages = [Message(id, payload, enqueued_at, attempts + 1) for id, payload, enqueued_at, attempts in rows]
+
+        redelivered = sum(1 for message in messages if message.attempts > 1)
+        if redelivered:
+            metrics.DISPATCH_REDELIVERED.inc(redelivered)
+            with self._lock:
+                self._redelivered += redelivered
+
+        return messages
+
+    def get(self, max_items=1, window=0.0, timeout=None, owner=None):
+        """
+        Aluga até max_items mensagens. Bloqueia até a primeira aparecer
+        (ou timeout); depois espera até window segundos por mais.
+        owner aluga em nome de um consumidor remoto (ver complete()).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            try:
+                messages = self._lease(max_items, owner)
+            except sqlite3.Error as e:
+                raise QueueError(str(e))
+
+            if messages:
+                break
+
+            remaining = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+            if remaining <= 0:
+                return []
+
+            with self._available:
+                self._available.wait(remaining)
+
+        if window > 0:
+            window_end = time.monotonic() + window
+
+            while len(messages) < max_items:
+                remaining = window_end - time.monotonic()
+                if remaining <= 0:
+                    break
+                with self._available:
+                    self._available.wait(remaining)
+                try:
+                    messages += self._lease(max_items - len(messages), owner)
+                except sqlite3.Error as e:
+                    raise QueueError(str(e))
+
+        return messages
+
+    def _update_leased(self, sql, rows):
+        # Só mexe no que ainda é deste dono: aluguel expirado e entregue a
+        # outro consumidor fica com ele (rowcount conta o que foi aplicado)
+        if not rows:
+            return 0
+
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            changed = sum(conn.execute(sql, row).rowcount for row in rows)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self._abort(conn)
+            raise QueueError(str(e))
+
+        return changed
+
+    def ack(self, messages, owner=None):
+        """
+        Remove mensagens processadas (com sucesso ou falha definitiva) que
+        ainda estão alugadas por owner (padrão: este processo). Retorna quantas.
+        """
+        owner = owner or self._owner
+        acked = self._update_leased(
+            "DELETE FROM messages WHERE id = ? AND owner = ?",
+            [(message.id, owner) for message in messages]
+        )
+        self._add_depth(-acked)
+        return acked
+
+    def release(self, messages, delay=0.0, count_attempt=True, owner=None):
+        """Devolve mensagens de owner à fila, visíveis de novo daqui a delay segundos."""
+        owner = owner or self._owner
+        return self._update_leased(
+            "UPDATE messages SET visible_at = ?, owner = NULL, attempts = attempts - ? WHERE id = ? AND owner = ?",
+            [(time.time() + delay, 0 if count_attempt else 1, message.id, owner) for message in messages]
+        )
+
+    def extend(self, message_id, owner, seconds):
+        """Renova o aluguel de owner por mais seconds; False se ele já o perdeu."""
+        conn = self._connection()
+        try:
+            return conn.execute(
+                "UPDATE messages SET visible_at = ? WHERE id = ? AND owner = ?",
+                (time.time() + seconds, message_id, owner)
+            ).rowcount == 1
+        except sqlite3.Error as e:
+            raise QueueError(str(e))
+
+    def complete(self, message_id, owner):
+        """
+        Ack de um aluguel remoto: remove a mensagem e devolve o payload, ou
+        None se o aluguel expirou e a mensagem já foi entregue a outro.
+        """
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT payload FROM messages WHERE id = ? AND owner = ?", (message_id, owner)
+            ).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self._abort(conn)
+            raise QueueError(str(e))
+
+        if row is None:
+            return None
+
+        self._add_depth(-1)
+        return row[0]
+
+    def replay(self):
+        """Devolve à fila as mensagens alugadas por processos que morreram."""
+        conn = self._connection()
+        now = time.time()
+
+        owners = [
+            owner for (owner,) in conn.execute(
+                "SELECT DISTINCT owner FROM messages WHERE owner IS NOT NULL AND visible_at > ?", (now,)
+            )
+        ]
+        # Aluguéis remotos (sem pid) só voltam quando expiram
+        dead = [
+            owner for owner in owners
+            if owner != self._owner and owner.split(":", 1)[0].isdigit()
+            and not _pid_alive(int(owner.split(":", 1)[0]))
+        ]
+
+        replayed = 0
+        for owner in dead:
+            replayed += conn.execute(
+                "UPDATE messages SET visible_at = ?, owner = NULL WHERE owner = ? AND visible_at > ?",
+                (now, owner, now)
+            ).rowcount
+
+        if replayed:
+            with self._lock:
+                self._replayed += replayed
+            with self._available:
+                self._available.notify_all()
+
+        return replayed
+
+    @property
+    def depth(self):
+        """
+        Mensagens no arquivo, sem consultar o disco: somado a cada commit e
+        descontado a cada ack / complete deste processo. O que os outros
+        processos gravam ou confirmam só entra no próximo counts().
+        """
+        return self._depth
+
+    def counts(self):
+        now = time.time()
+        ready, leased = self._connection().execute(
+            "SELECT COALESCE(SUM(visible_at <= ?), 0), COALESCE(SUM(visible_at > ?), 0) FROM messages",
+            (now, now)
+        ).fetchone()
+        with self._lock:
+            self._depth = ready + leased
+        return {"ready": ready, "leased": leased}
+
+    def stats(self):
+        counts = self.counts()
+
+        with self._lock:
+            return dict(
+                counts,
+                path=self.path,
+                commits=self._commits,
+                committed=self._committed,
+                avg_commit_batch=round(self._committed / self._commits, 2) if self._commits else 0.0,
+                commit_ms={
+                    "last": round(self._commit_last * 1000, 3),
+                    "avg": round(self._commit_seconds / self._commits * 1000, 3) if self._commits else 0.0
+                },
+                redelivered=self._redelivered,
+                replayed=self._replayed
+            )
@@ -0,0 +1,444 @@
+"""
+Launchers de tarefas ECS usados pelo ef.py.
+
+Todos expõem a mesma interface (run_task / describe_tasks) e devolvem o
+mesmo formato de resposta da API do ECS ({"tasks": [...], "failures": [...]}),
+então o ef.py não precisa saber quem está por trás:
+
+- Boto3Launcher (padrão): cliente ECS em processo, com um pool HTTPS e
+  credenciais resolvidas uma única vez por worker do gunicorn.
+- AwsCliLauncher: comportamento antigo, um `aws ecs run-task` por chamada.
+- FakeEcsLauncher: ECS local (no store compartilhado, state.py), para testes
+  e benchmarks sem AWS.
+- LocalWorkerLauncher: cada "tarefa" é um processo ef_worker.py nesta
+  máquina, para exercitar o warm pool (warmpool.py) sem AWS.
+
+O launcher é escolhido pela variável EF_LAUNCHER (boto3 | cli | fake); o
+do warm pool, por EF_POOL_LAUNCHER (mesmos valores e local).
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:  # boto3 é opcional - sem ele caímos no aws CLI
+    boto3 = None
+
+import applog
+import state
+
+
+log = applog.get_logger(__name__)
+
+LAUNCHER = os.getenv("EF_LAUNCHER", "boto3")
+
+# Máximo de ARNs aceitos por uma chamada DescribeTasks
+DESCRIBE_TASKS_MAX = 100
+
+
+class LaunchError(Exception):
+    """Falha ao chamar o ECS (credenciais, validação, throttling, timeout...)."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+# =========================================================
+# aws CLI (um subprocesso por chamada)
+# =========================================================
+class AwsCliLauncher:
+    name = "cli"
+
+    def __init__(self, timeout=25):
+        self.timeout = timeout
+
+    def run_task(self, region, cluster, task_definition, network_configuration,
+                 overrides, started_by, count=1):
+        cmd = [
+            "aws", "ecs", "run-task",
+            "--region", region,
+            "--cluster", cluster,
+            "--launch-type", "FARGATE",
+            "--task-definition", task_definition,
+            "--count", str(count),
+            "--network-configuration", json.dumps(network_configuration),
+            "--started-by", started_by,
+            "--overrides", json.dumps(overrides),
+            "--output", "json"
+        ]
+
+        try:
+            process = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=self.timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise LaunchError(f"aws ecs run-task timed out after {self.timeout}s", code="Timeout")
+
+        if process.returncode != 0:
+            raise LaunchError(process.stderr.strip(), code=process.returncode)
+
+        return json.loads(process.stdout or "{}")
+
+    def describe_tasks(self, region, cluster, task_arns):
+        cmd = [
+            "aws", "ecs", "describe-tasks",
+            "--region", region,
+            "--cluster", cluster,
+            "--tasks", *task_arns,
+            "--output", "json"
+        ]
+
+        try:
+            process = subprocess.run(cmd, capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise LaunchError(f"aws ecs describe-tasks timed out after {self.timeout}s", code="Timeout")
+
+        if process.returncode != 0:
+            raise LaunchError(process.stderr.strip(), code=process.returncode)
+
+        return json.loads(process.stdout or "{}")
+
+
+# =========================================================
+# boto3 em processo (padrão)
+# =========================================================
+class Boto3Launcher:
+    name = "boto3"
+
+    def __init__(self, max_pool_connections=10, connect_timeout=5, read_timeout=25):
+        if boto3 is None:
+            raise RuntimeError("boto3 is not installed")
+
+        self.config = Config(
+            max_pool_connections=max_pool_connections,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retries={"max_attempts": 0}
+        )
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._clients = {}
+
+    def _client(self, region):
+        # Sessão e clientes são criados de forma preguiçosa e recriados após
+        # um fork: o gunicorn faz fork depois de importar o app, e sockets /
+        # credenciais não podem ser compartilhados entre processos.
+        with self._lock:
+            pid = os.getpid()
+            if self._pid != pid:
+                self._pid = pid
+                self._session = boto3.session.Session()
+                self._clients = {}
+
+            client = self._clients.get(region)
+            if client is None:
+                client = self._session.client("ecs", region_name=region, config=self.config)
+                self._clients[region] = client
+
+            return client
+
+    def run_task(self, region, cluster, task_definition, network_configuration,
+                 overrides, started_by, count=1):
+        try:
+            response = self._client(region).run_task(
+                cluster=cluster,
+                launchType="FARGATE",
+                taskDefinition=task_definition,
+                count=count,
+                networkConfiguration=network_configuration,
+                startedBy=started_by,
+                overrides=overrides
+            )
+        except ClientError as e:
+            error = e.response.get("Error", {})
+            raise LaunchError(error.get("Message", str(e)), code=error.get("Code"))
+        except BotoCoreError as e:
+            raise LaunchError(str(e), code=type(e).__name__)
+
+        response.pop("ResponseMetadata", None)
+        return response
+
+    def describe_tasks(self, region, cluster, task_arns):
+        try:
+            response = self._client(region).describe_tasks(cluster=cluster, tasks=list(task_arns))
+        except ClientError as e:
+            error = e.response.get("Error", {})
+            raise LaunchError(error.get("Message", str(e)), code=error.get("Code"))
+        except BotoCoreError as e:
+            raise LaunchError(str(e), code=type(e).__name__)
+
+        response.pop("ResponseMetadata", None)
+        return response
+
+
+# =========================================================
+# ECS falso (testes / benchmarks)
+# =========================================================
+class FakeEcsLauncher:
+    """
+    As tarefas avançam PROVISIONING -> PENDING -> RUNNING -> STOPPED
+    (exitCode 0) conforme a idade, terminando após run_seconds.
+
+    Ficam no store compartilhado, como no ECS de verdade: a tarefa lançada
+    por um worker do gunicorn é vista pelo poller de qualquer outro.
+
+    Com failure_rate > 0, essa fração dos RunTask falha do jeito de
+    failure_kind (throttle | capacity | timeout | invalid); com
+    failure_targets, só nos clusters / subnets listados.
+    """
+    name = "fake"
+
+    KEY_PREFIX = "fake-ecs:"
+    TASK_TTL = 86400
+
+    # failure_kind -> como o ECS de verdade falha nesse caso
+    FAILURES = {
+        "throttle": LaunchError("Rate exceeded", code="ThrottlingException"),
+        "timeout": LaunchError("Read timeout on endpoint URL", code="ReadTimeoutError"),
+        "invalid": LaunchError("Task definition does not exist", code="InvalidParameterException")
+    }
+    CAPACITY_REASON = "Capacity is unavailable at this time. Please try again later or in a different availability zone"
+
+    def __init__(self, latency=0.05, run_seconds=5.0, account="000000000000", backend=None,
+                 failure_rate=0.0, failure_kind="throttle", failure_targets=()):
+        self.latency = latency
+        self.run_seconds = run_seconds
+        self.account = account
+        self.backend = backend or state.store
+        self.failure_rate = failure_rate
+        self.failure_kind = failure_kind
+        self.failure_targets = set(failure_targets)
+        self._lock = threading.Lock()
+        self.describe_calls = 0
+
+    def run_task(self, region, cluster, task_definition, network_configuration,
+                 overrides, started_by, count=1):
+        if self.latency:
+            time.sleep(self.latency)
+
+        # Falhas injetadas para exercitar retentativas, circuit breaker e placement
+        if self._failing(cluster, network_configuration) and random.random() < self.failure_rate:
+            if self.failure_kind == "capacity":
+                return {"tasks": [], "failures": [{"reason": self.CAPACITY_REASON}]}
+            raise self.FAILURES.get(self.failure_kind, self.FAILURES["throttle"])
+
+        tasks = []
+        for _ in range(count):
+            arn = f"arn:aws:ecs:{region}:{self.account}:task/{cluster}/{uuid.uuid4().hex}"
+            task = {
+                "taskArn": arn,
+                "clusterArn": f"arn:aws:ecs:{region}:{self.account}:cluster/{cluster}",
+                "taskDefinitionArn": f"arn:aws:ecs:{region}:{self.account}:task-definition/{task_definition}",
+                "startedBy": started_by,
+                "lastStatus": "PROVISIONING",
+                "desiredStatus": "RUNNING",
+                "launchType": "FARGATE",
+                "overrides": overrides,
+                "createdAt": time.time()
+            }
+            self.backend.set(self.KEY_PREFIX + arn, json.dumps(task), ttl=self.TASK_TTL)
+            tasks.append(task)
+
+        return {"tasks": tasks, "failures": []}
+
+    def _failing(self, cluster, network_configuration):
+        if not self.failure_rate:
+            return False
+        if not self.failure_targets:
+            return True
+
+        subnets = network_configuration.get("awsvpcConfiguration", {}).get("subnets", [])
+        return cluster in self.failure_targets or any(subnet in self.failure_targets for subnet in subnets)
+
+    def _status(self, task, now):
+        created = task["createdAt"]
+        age = now - created
+
+        # Timestamps de cada estágio, como no DescribeTasks (tracing.py)
+        pulled = {"pullStartedAt": created + self.run_seconds * 0.2, "pullStoppedAt": created + self.run_seconds * 0.4}
+        started = dict(pulled, startedAt=created + self.run_seconds * 0.4)
+
+        if age >= self.run_seconds:
+            return dict(
+                started,
+                lastStatus="STOPPED",
+                desiredStatus="STOPPED",
+                stopCode="EssentialContainerExited",
+                stoppingAt=created + self.run_seconds,
+                stoppedAt=created + self.run_seconds,
+                containers=[{"name": task["taskDefinitionArn"].rsplit("/", 1)[-1], "exitCode": 0}]
+            )
+        if age >= self.run_seconds * 0.4:
+            return dict(started, lastStatus="RUNNING")
+        if age >= self.run_seconds * 0.2:
+            return {"lastStatus": "PENDING", "pullStartedAt": pulled["pullStartedAt"]}
+
+        return {"lastStatus": "PROVISIONING"}
+
+    def describe_tasks(self, region, cluster, task_arns):
+        if len(task_arns) > DESCRIBE_TASKS_MAX:
+            raise LaunchError("Tasks cannot be longer than 100.", code="InvalidParameterException")
+
+        now = time.time()
+        tasks = []
+        failures = []
+
+        with self._lock:
+            self.describe_calls += 1
+
+        for arn in task_arns:
+            stored = self.backend.get(self.KEY_PREFIX + arn)
+            if stored is None:
+                failures.append({"arn": arn, "reason": "MISSING"})
+                continue
+
+            task = json.loads(stored)
+            task.update(self._status(task, now))
+            tasks.append(task)
+
+        return {"tasks": tasks, "failures": failures}
+
+
+# =========================================================
+# Workers locais (warm pool sem AWS)
+# =========================================================
+class LocalWorkerLauncher:
+    """
+    Cada tarefa é um processo ef_worker.py, com o environment dos
+    overrides e EF_TASK_ARN com o ARN inventado. Só o processo que lançou
+    conhece as tarefas: describe_tasks dos demais devolve MISSING.
+    """
+    name = "local"
+
+    WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ef_worker.py")
+
+    def __init__(self, account="000000000000"):
+        self.account = account
+        self._lock = threading.Lock()
+        self._processes = {}
+
+    def run_task(self, region, cluster, task_definition, network_configuration,
+                 overrides, started_by, count=1):
+        environment = {
+            item["name"]: item["value"]
+            for container in overrides.get("containerOverrides", [])
+            for item in container.get("environment", [])
+        }
+
+        # Recolhe os workers que já saíram (não ficam zumbis)
+        with self._lock:
+            for process in self._processes.values():
+                process.poll()
+
+        tasks = []
+        for _ in range(count):
+            arn = f"arn:aws:ecs:{region}:{self.account}:task/{cluster}/{uuid.uuid4().hex}"
+            process = subprocess.Popen(
+                [sys.executable, self.WORKER_SCRIPT],
+                env=dict(os.environ, **environment, EF_TASK_ARN=arn),
+                stdin=subprocess.DEVNULL,
+                # Fora do grupo do gunicorn: um Ctrl+C no servidor não mata os workers
+                start_new_session=True
+            )
+            with self._lock:
+                self._processes[arn] = process
+
+            tasks.append({
+                "taskArn": arn,
+                "taskDefinitionArn": f"arn:aws:ecs:{region}:{self.account}:task-definition/{task_definition}",
+                "startedBy": started_by,
+                "lastStatus": "RUNNING",
+                "desiredStatus": "RUNNING",
+                "launchType": "LOCAL",
+                "createdAt": time.time()
+            })
+
+        return {"tasks": tasks, "failures": []}
+
+    def describe_tasks(self, region, cluster, task_arns):
+        tasks = []
+        failures = []
+
+        for arn in task_arns:
+            with self._lock:
+                process = self._processes.get(arn)
+            if process is None:
+                failures.append({"arn": arn, "reason": "MISSING"})
+                continue
+
+            exit_code = process.poll()
+            if exit_code is None:
+                tasks.append({"taskArn": arn, "lastStatus": "RUNNING"})
+            else:
+                tasks.append({
+                    "taskArn": arn,
+                    "lastStatus": "STOPPED",
+                    "stopCode": "EssentialContainerExited",
+                    "containers": [{"name": "ef_worker", "exitCode": exit_code}]
+                })
+
+        return {"tasks": tasks, "failures": failures}
+
+
+# =========================================================
+# Launcher do processo
+# =========================================================
+_launcher = None
+_launcher_lock = threading.Lock()
+
+
+def create_launcher(name=LAUNCHER):
+    if name == "local":
+        return LocalWorkerLauncher()
+
+    if name == "fake":
+        return FakeEcsLauncher(
+            latency=float(os.getenv("EF_FAKE_ECS_LATENCY", "0.05")),
+            run_seconds=float(os.getenv("EF_FAKE_ECS_RUN_SECONDS", "5")),
+            failure_rate=float(os.getenv("EF_FAKE_ECS_FAILURE_RATE", "0")),
+            failure_kind=os.getenv("EF_FAKE_ECS_FAILURE", "throttle"),
+            failure_targets=[name for name in os.getenv("EF_FAKE_ECS_FAILURE_TARGETS", "").split(",") if name]
+        )
+
+    if name == "cli":
+        return AwsCliLauncher()
+
+    if boto3 is None:
+        log.warning("boto3 not installed - falling back to the aws CLI launcher")
+        return AwsCliLauncher()
+
+    return Boto3Launcher(
+        max_pool_connections=int(os.getenv("EF_ECS_MAX_POOL", "10")),
+        connect_timeout=float(os.getenv("EF_ECS_CONNECT_TIMEOUT", "5")),
+        read_timeout=float(os.getenv("EF_ECS_READ_TIMEOUT", "25"))
+    )
+
+
+def get_launcher():
+    global _launcher
+
+    if _launcher is None:
+        with _launcher_lock:
+            if _launcher is None:
+                _launcher = create_launcher()
+
+    return _launcher
+
+
+def set_launcher(launcher):
+    """Troca o launcher do processo (testes / benchmarks)."""
+    global _launcher
+    _launcher = launcher
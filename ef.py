@@ -1,98 +1,584 @@
+import atexit
 import json
-import subprocess
+import os
+import tempfile
+import threading
+import time
 import datetime
 from threading import Thread
 
+import applog
+import diskqueue
+import ecs
+import jobs
+import metrics
+import placement
+import resilience
+import series
+import tracing
 
-desired_descriptions = [
-    "CINE EC 2",
-    "rEIXO_CURTO",
-    "SHORT_AXIS",
-    "SHORT AXIS",
-    "SA CINE",
-    "CINE SA",
-    "CINE_SHORT_AXIS",
-    "CINE SA 2",
-    "EIXO_CURTO",
-    "EIXO_CURTO_CINE",
-    "EC EIXO_CURTO",
-    "R_EIXO_CURTO",
-    "R EIXO CURTO",
-    "SX CINE SA",
-    "CINE EC SHORT AXIS"
-]
-
-
-def run_fargate_task(api_data):
-
-    def _run():
-
-        json_str = json.dumps(api_data, separators=(",", ":"))
-        started_by = f"temporary-run-{int(datetime.datetime.now().timestamp())}"
-
-        region = "us-east-2"
-        cluster = "fe-cluster"
-        task_definition = "fe-5-nov2025"
-        subnet_id = "subnet-0a068dd9915049166"
-
-        overrides = {
-            "containerOverrides": [
-                {
-                    "name": task_definition,
-                    "environment": [
-                        {"name": "EXAME_JSON", "value": json_str}
-                    ]
-                }
-            ]
-        }
-
-        network_config = {
-            "awsvpcConfiguration": {
-                "subnets": [subnet_id],
-                "assignPublicIp": "ENABLED"
+
+log = applog.get_logger(__name__)
+
+desired_descriptions = series.SHORT_AXIS_DESCRIPTIONS
+
+
+REGION = os.getenv("EF_REGION", "us-east-2")
+CLUSTER = os.getenv("EF_CLUSTER", "fe-cluster")
+TASK_DEFINITION = os.getenv("EF_TASK_DEFINITION", "fe-5-nov2025")
+SUBNET_ID = os.getenv("EF_SUBNET_ID", "subnet-0a068dd9915049166")
+
+# Região / cluster / subnets de cada RunTask (EF_LAUNCH_TARGETS, placement.py);
+# sem a variável, um único alvo com os valores acima
+targets = placement.load_targets(region=REGION, cluster=CLUSTER, subnet=SUBNET_ID)
+
+
+# Modo lote (opcional): a tarefa recebe EXAME_JSON como uma lista de exames.
+# A imagem da tarefa precisa entender o formato lista antes de ligar isso.
+BATCH_WINDOW = float(os.getenv("EF_BATCH_WINDOW_MS", "0")) / 1000
+BATCH_MAX_SIZE = int(os.getenv("EF_BATCH_MAX_SIZE", "10"))
+
+# O ECS limita os overrides de um RunTask a 8 KiB no total
+EXAME_JSON_MAX_BYTES = int(os.getenv("EF_EXAME_JSON_MAX_BYTES", "7000"))
+
+
+def build_task_request(environment, started_by, task_definition=TASK_DEFINITION):
+    """
+    Parâmetros do RunTask com environment [{"name", "value"}] no container.
+    Região, cluster e rede vêm do alvo escolhido em _run_task.
+    """
+    overrides = {
+        "containerOverrides": [
+            {
+                "name": task_definition,
+                "environment": environment
             }
-        }
-
-        cmd = [
-            "aws", "ecs", "run-task",
-            "--region", region,
-            "--cluster", cluster,
-            "--launch-type", "FARGATE",
-            "--task-definition", task_definition,
-            "--network-configuration", json.dumps(network_config),
-            "--started-by", started_by,
-            "--overrides", json.dumps(overrides)
         ]
+    }
+
+    return {
+        "task_definition": task_definition,
+        "overrides": overrides,
+        "started_by": started_by
+    }
+
+
+def build_run_task_request(api_data, traceparent=None):
+    """
+    Monta os parâmetros do RunTask, enviando api_data como EXAME_JSON.
+    api_data pode ser um exame (dict) ou um lote de exames (list).
+    traceparent (tracing.py) vai junto como TRACEPARENT.
+    """
+    json_str = json.dumps(api_data, separators=(",", ":"))
+    started_by = f"temporary-run-{int(datetime.datetime.now().timestamp())}"
+
+    environment = [{"name": "EXAME_JSON", "value": json_str}]
+    if traceparent:
+        environment.append({"name": "TRACEPARENT", "value": traceparent})
+
+    return build_task_request(environment, started_by)
+
+
+def split_batch(batch, max_bytes=EXAME_JSON_MAX_BYTES):
+    """
+    Divide um lote de (job_id, api_data, traceparent) para que cada
+    EXAME_JSON caiba no limite de overrides (o TRACEPARENT tem tamanho fixo,
+    dentro da folga de EXAME_JSON_MAX_BYTES).
+    """
+    chunks = []
+    chunk = []
+    size = 2
+
+    for item in batch:
+        item_size = len(json.dumps(item[1], separators=(",", ":")).encode()) + 1
+
+        if chunk and size + item_size > max_bytes:
+            chunks.append(chunk)
+            chunk = []
+            size = 2
+
+        chunk.append(item)
+        size += item_size
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+# =========================================================
+# Retentativas e circuit breaker do RunTask (resilience.py)
+# =========================================================
+# Pelo menos uma tentativa (0 deixaria o RunTask sem ser chamado)
+LAUNCH_ATTEMPTS = max(1, int(os.getenv("EF_LAUNCH_ATTEMPTS", "3")))
+LAUNCH_BACKOFF_BASE = float(os.getenv("EF_LAUNCH_BACKOFF_BASE", "0.5"))
+LAUNCH_BACKOFF_CAP = float(os.getenv("EF_LAUNCH_BACKOFF_CAP", "8"))
+
+# Esgotadas as tentativas imediatas, o disparo volta para a fila em disco
+REQUEUE_BACKOFF_BASE = float(os.getenv("EF_REQUEUE_BACKOFF_BASE", "5"))
+REQUEUE_BACKOFF_CAP = float(os.getenv("EF_REQUEUE_BACKOFF_CAP", "300"))
+
+breaker = resilience.CircuitBreaker(
+    "ecs_run_task",
+    failure_threshold=int(os.getenv("EF_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("EF_BREAKER_RESET_SECONDS", "30")),
+    max_reset_timeout=float(os.getenv("EF_BREAKER_MAX_RESET_SECONDS", "300"))
+)
+
+
+def _run_task(launcher, task_request):
+    """
+    RunTask com retentativas classificadas, cada tentativa em um alvo
+    (placement.py), de preferência diferente dos anteriores. Devolve
+    (resposta, alvo) assim que alguma tarefa sobe: com count > 1 a resposta
+    pode trazer tasks e failures juntas, e quem pediu trata o que faltou.
+    Levanta LaunchError para falhas definitivas e RetryLater quando o ECS
+    continua falhando (ou os circuitos estão abertos).
+    """
+    tried = set()
+
+    for attempt in range(LAUNCH_ATTEMPTS):
+        try:
+            breaker.allow()
+        except resilience.BreakerOpen as e:
+            raise resilience.RetryLater(str(e), e.retry_after, "breaker_open")
 
         try:
-            print("\n🛰️ Running AWS Fargate:")
-            print(" ".join(cmd))
+            target = targets.choose(exclude=tried)
+        except resilience.BreakerOpen as e:
+            breaker.release()
+            raise resilience.RetryLater(str(e), e.retry_after, "breaker_open")
+        tried.add(target.name)
+
+        with tracing.start_span("ecs.run_task", kind=tracing.CLIENT, root=False, attributes={
+            "target": target.name, "region": target.region, "cluster": target.cluster,
+            "attempt": attempt + 1, "launcher": launcher.name
+        }) as span:
+            started = time.perf_counter()
+            try:
+                with metrics.launcher_call(launcher, "run_task"):
+                    response = launcher.run_task(**target.place(task_request))
+            except Exception as e:
+                error, kind = e, resilience.classify(e)
+            else:
+                failures = response.get("failures") or []
+                if response.get("tasks"):
+                    breaker.record_success()
+                    target.record_success(time.perf_counter() - started, len(response["tasks"]))
+                    span.set_attribute("task_arn", response["tasks"][0].get("taskArn"))
+                    return response, target
+
+                reason = failures[0].get("reason") if failures else "no task returned"
+                kind = resilience.classify_failure_reason(reason) if failures else resilience.TRANSIENT
+                error = ecs.LaunchError(f"ECS: {failures or reason}", code=reason)
+
+            span.set_error(f"{kind}: {error}")
+
+        target.record_failure(kind, time.perf_counter() - started, error)
+
+        if kind == resilience.FATAL:
+            # O ECS respondeu (o pedido é que está errado): não conta contra o
+            # circuito, mas também não o fecha nem zera as falhas seguidas
+            breaker.release()
+            raise error if isinstance(error, ecs.LaunchError) else ecs.LaunchError(str(error), code=type(error).__name__)
+
+        breaker.record_failure(error)
+
+        if attempt + 1 < LAUNCH_ATTEMPTS:
+            delay = resilience.backoff(attempt, LAUNCH_BACKOFF_BASE, LAUNCH_BACKOFF_CAP)
+            metrics.LAUNCH_RETRIES.labels(kind).inc()
+            log.warning("RunTask failed, retrying", extra={
+                "reason": kind, "attempt": attempt + 1, "delay": round(delay, 2),
+                "target": target.name, "error": str(error)
+            })
+            time.sleep(delay)
+
+    raise resilience.RetryLater(str(error), 0.0, kind)
+
+
+def launch_retry_after():
+    """Segundos até o ECS aceitar disparos de novo (circuito geral ou todos os alvos)."""
+    return max(breaker.retry_after(), targets.retry_after())
+
+
+def _launch(batch):
+    """
+    Lança os exames de batch [(job_id, api_data, traceparent)]. Devolve
+    [(índice em batch, RetryLater)] do que deve voltar para a fila.
+
+    O span ecs.launch de um lote fica no trace do primeiro exame, com links
+    para os traces dos demais.
+    """
+    retry = []
+    offset = 0
+
+    for chunk in split_batch(batch):
+        job_ids = [job_id for job_id, _, _ in chunk if job_id]
+        api_data = [api_data for _, api_data, _ in chunk]
+        traces = [trace for _, _, trace in chunk if trace]
+
+        with tracing.continue_trace(
+            "ecs.launch", traces[0] if traces else None, kind=tracing.CONSUMER,
+            attributes={"job_ids": job_ids, "batch_size": len(chunk)}, links=traces[1:]
+        ) as span:
+            try:
+                _launch_chunk(job_ids, api_data[0] if len(api_data) == 1 else api_data, span.traceparent)
+            except resilience.RetryLater as e:
+                span.set_error(f"postponed ({e.kind}): {e}")
+                retry.extend((offset + i, e) for i in range(len(chunk)))
+
+        offset += len(chunk)
+
+    return retry
+
+
+def _launch_chunk(job_ids, api_data, traceparent=None):
+
+    task_request = build_run_task_request(api_data, traceparent)
+    started_by = task_request["started_by"]
+    launcher = ecs.get_launcher()
+
+    try:
+        log.info("Running AWS Fargate task", extra={
+            "launcher": launcher.name,
+            "started_by": started_by,
+            "batch_size": len(api_data) if isinstance(api_data, list) else 1
+        })
+
+        response, target = _run_task(launcher, task_request)
+
+        task = response["tasks"][0]
+        log.info("Fargate started", extra={
+            "started_by": started_by, "task_arn": task.get("taskArn"), "target": target.name
+        })
+        jobs.store.mark_launched(
+            job_ids,
+            task.get("taskArn"),
+            target.region,
+            target.cluster,
+            task_definition=task_request["task_definition"],
+            ecs_status=task.get("lastStatus")
+        )
 
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+    except resilience.RetryLater as e:
+        log.warning("Fargate launch postponed", extra={"started_by": started_by, "reason": e.kind, "error": str(e)})
+        raise
 
-            stdout, stderr = process.communicate(timeout=25)
+    except ecs.LaunchError as e:
+        log.error("Fargate failed", extra={"started_by": started_by, "error": str(e), "code": str(e.code)})
+        tracing.set_error(e)
+        jobs.store.mark_failed(job_ids, str(e))
 
-            if process.returncode == 0:
-                print("✅ Fargate started successfully for:", started_by)
-                print(stdout)
+    except Exception as e:
+        log.exception("Error running Fargate", extra={"started_by": started_by})
+        tracing.set_error(e)
+        jobs.store.mark_failed(job_ids, str(e))
+
+
+# =========================================================
+# Fila de disparo
+# =========================================================
+DISPATCH_WORKERS = int(os.getenv("EF_DISPATCH_WORKERS", "4"))
+DISPATCH_QUEUE_SIZE = int(os.getenv("EF_DISPATCH_QUEUE_SIZE", "1000"))
+DISPATCH_RETRY_AFTER = int(os.getenv("EF_DISPATCH_RETRY_AFTER", "30"))
+DISPATCH_DRAIN_TIMEOUT = float(os.getenv("EF_DISPATCH_DRAIN_TIMEOUT", "20"))
+
+# Fila em disco, compartilhada pelos workers do host (diskqueue.py)
+DISPATCH_QUEUE_DB = os.getenv(
+    "EF_DISPATCH_QUEUE_DB",
+    os.path.join(tempfile.gettempdir(), "monai-mock-dispatch.sqlite3")
+)
+DISPATCH_VISIBILITY_TIMEOUT = float(os.getenv("EF_DISPATCH_VISIBILITY_TIMEOUT", "120"))
+DISPATCH_COMMIT_WINDOW = float(os.getenv("EF_DISPATCH_COMMIT_WINDOW_MS", "0")) / 1000
+DISPATCH_MAX_ATTEMPTS = int(os.getenv("EF_DISPATCH_MAX_ATTEMPTS", "5"))
+
+
+class DispatchQueueFull(Exception):
+    """Fila de disparo cheia - o cliente deve tentar de novo mais tarde."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"dispatch queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _already_dispatched(job_id):
+    # Entrega repetida (aluguel perdido, worker reciclado): o job pode já
+    # ter sido lançado antes do ack
+    if job_id is None:
+        return False
+    job = jobs.store.get(job_id)
+    return job is None or job["status"] != jobs.QUEUED
+
+
+class Dispatcher:
+    """
+    Pool fixo de threads consumindo a fila persistente de disparos.
+
+    submit() só retorna depois que o disparo está gravado em disco; as
+    threads de qualquer worker do host alugam, lançam e confirmam (ack).
+    Disparos alugados por um worker que morreu voltam para a fila quando
+    outro worker sobe (replay) ou quando o aluguel expira.
+
+    Com batch_window > 0, cada thread espera até batch_window segundos por
+    mais itens depois do primeiro e dispara até batch_max_size de uma vez.
+
+    As threads só são criadas no primeiro submit de cada processo, porque
+    o gunicorn pode importar o app no master antes do fork.
+    """
+
+    def __init__(self, launch, workers, queue_size, retry_after,
+                 batch_window=0, batch_max_size=1, path=DISPATCH_QUEUE_DB,
+                 visibility_timeout=DISPATCH_VISIBILITY_TIMEOUT,
+                 commit_window=DISPATCH_COMMIT_WINDOW, max_attempts=DISPATCH_MAX_ATTEMPTS):
+        self._launch = launch
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self.batch_window = batch_window
+        self.batch_max_size = max(1, batch_max_size)
+        self.max_attempts = max_attempts
+
+        self._queue = diskqueue.DiskQueue(
+            path, visibility_timeout=visibility_timeout, commit_window=commit_window
+        )
+        self._lock = threading.Lock()
+        self._pid = None
+
+        self._busy = 0
+        self._in_flight = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._skipped = 0
+        self._requeued = 0
+        self._dead = 0
+        self._dequeued = 0
+        self._batches = 0
+        self._wait_last = 0.0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def start(self):
+        """Sobe as threads deste processo e recupera disparos de workers mortos."""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            replayed = self._queue.replay()
+            if replayed:
+                log.warning("Replaying dispatches left by a dead worker", extra={"replayed": replayed})
+            self._queue.counts()
+
+            for i in range(self.workers):
+                Thread(target=self._worker, name=f"ef-dispatch-{i}", daemon=True).start()
+
+            self._pid = os.getpid()
+
+    def submit(self, api_data, job_id=None):
+        self._ensure_started()
+
+        if self._queue.depth >= self.queue_size:
+            # depth só muda nos commits deste processo: relê do disco antes de recusar
+            self._queue.counts()
+
+        if self._queue.depth >= self.queue_size:
+            with self._lock:
+                self._rejected += 1
+            metrics.DISPATCH_REJECTED.inc()
+            raise DispatchQueueFull(self.retry_after)
+
+        self._queue.put(json.dumps(
+            {"job_id": job_id, "api_data": api_data, "trace": tracing.current_traceparent()},
+            separators=(",", ":")
+        ))
+
+        with self._lock:
+            self._submitted += 1
+        metrics.DISPATCH_QUEUE_DEPTH.set(self._queue.depth)
+
+    def _take(self, messages):
+        """Separa o que lançar [(message, item)], o que já foi lançado e o que esgotou as tentativas."""
+        now = time.time()
+        launch, dead = [], []
+
+        for message in messages:
+            item = json.loads(message.payload)
+            wait = max(0.0, now - message.enqueued_at)
+            metrics.DISPATCH_WAIT.observe(wait)
+
+            with self._lock:
+                self._dequeued += 1
+                self._wait_last = wait
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+
+            trace = item.get("trace")
+            tracing.record_span("dispatch.wait", trace, message.enqueued_at, now, {
+                "job_id": item["job_id"], "attempt": message.attempts
+            })
+
+            if message.attempts > 1 and _already_dispatched(item["job_id"]):
+                with self._lock:
+                    self._skipped += 1
+            elif message.attempts > self.max_attempts:
+                dead.append(item["job_id"])
             else:
-                print("❌ Fargate failed:", started_by)
-                print(stderr)
+                launch.append((message, (item["job_id"], item["api_data"], trace)))
+
+        return launch, dead
+
+    def _requeue(self, launch, retry):
+        """Devolve à fila, com backoff, os disparos que o ECS não aceitou agora."""
+        requeued = set()
+
+        for index, error in retry:
+            message = launch[index][0]
+            if message.id in requeued:
+                continue
+            requeued.add(message.id)
+
+            # Circuito aberto: a chamada nem foi feita, não gasta tentativa
+            counts = error.kind != "breaker_open"
+            delay = error.delay
+            if counts:
+                delay = max(delay, resilience.backoff(message.attempts - 1, REQUEUE_BACKOFF_BASE, REQUEUE_BACKOFF_CAP))
+
+            self._queue.release([message], delay, count_attempt=counts)
+
+        with self._lock:
+            self._requeued += len(requeued)
+
+        return requeued
+
+    def _worker(self):
+        while True:
+            # Circuito aberto: nem aluga, para não girar mensagens à toa
+            paused = launch_retry_after()
+            if paused > 0:
+                time.sleep(min(paused, 1.0))
+                continue
+
+            try:
+                if self.batch_window > 0:
+                    messages = self._queue.get(self.batch_max_size, self.batch_window)
+                else:
+                    messages = self._queue.get(1)
+            except diskqueue.QueueError as e:
+                log.error("Error reading the dispatch queue", extra={"error": str(e)})
+                time.sleep(1)
+                continue
+
+            launch, dead = self._take(messages)
+
+            with self._lock:
+                self._busy += 1
+                self._in_flight += len(messages)
+                self._batches += 1
+
+            metrics.DISPATCH_QUEUE_DEPTH.set(self._queue.depth)
+            metrics.DISPATCH_BATCH_SIZE.observe(len(launch))
+            metrics.DISPATCH_BUSY.inc()
+
+            try:
+                if dead:
+                    log.error("Dispatch gave up after repeated deliveries", extra={
+                        "job_ids": dead, "max_attempts": self.max_attempts
+                    })
+                    with self._lock:
+                        self._dead += len(dead)
+                    jobs.store.mark_failed([job_id for job_id in dead if job_id], "Dispatch failed after repeated attempts")
+
+                requeued = set()
+                if launch:
+                    retry = self._launch([item for _, item in launch]) or []
+                    requeued = self._requeue(launch, retry)
+
+                # Sem ack em caso de exceção: a mensagem volta quando o aluguel expirar
+                self._queue.ack([message for message in messages if message.id not in requeued])
+            except Exception:
+                log.exception("Error dispatching Fargate launches", extra={"batch_size": len(messages)})
+            finally:
+                # Depois do ack: o gauge não fica com as mensagens já lançadas
+                metrics.DISPATCH_QUEUE_DEPTH.set(self._queue.depth)
+                metrics.DISPATCH_BUSY.dec()
+                with self._lock:
+                    self._busy -= 1
+                    self._in_flight -= len(messages)
+                    self._completed += len(messages)
+
+    def drain(self, timeout):
+        """
+        Shutdown do worker do gunicorn: grava o que ainda está a caminho do
+        disco e espera os lançamentos em andamento. O que sobrar alugado é
+        entregue de novo por outro worker.
+        """
+        deadline = time.monotonic() + timeout
+        self._queue.flush(timeout)
+
+        while self._in_flight and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        return self._in_flight
+
+    def stats(self):
+        queue_stats = self._queue.stats()
+
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "busy": self._busy,
+                "queue_size": self.queue_size,
+                "depth": queue_stats["ready"] + queue_stats["leased"],
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "skipped_redeliveries": self._skipped,
+                "requeued": self._requeued,
+                "gave_up": self._dead,
+                "batches": self._batches,
+                "avg_batch_size": round(self._dequeued / self._batches, 2) if self._batches else 0.0,
+                "wait_seconds": {
+                    "last": round(self._wait_last, 4),
+                    "avg": round(self._wait_total / self._dequeued, 4) if self._dequeued else 0.0,
+                    "max": round(self._wait_max, 4)
+                },
+                "queue": queue_stats
+            }
 
-        except Exception as e:
-            print("❌ Error running Fargate:", str(e))
 
-    # ✅ DISPARA EM SEGUNDO PLANO (não trava o Flask)
-    Thread(target=_run, daemon=True).start()
+dispatcher = Dispatcher(
+    _launch,
+    DISPATCH_WORKERS,
+    DISPATCH_QUEUE_SIZE,
+    DISPATCH_RETRY_AFTER,
+    batch_window=BATCH_WINDOW,
+    batch_max_size=BATCH_MAX_SIZE
+)
 
-    return 
 
+@atexit.register
+def _drain_on_exit():
+    if dispatcher._pid != os.getpid():
+        return
 
+    pending = dispatcher.drain(DISPATCH_DRAIN_TIMEOUT)
+    if pending:
+        log.warning("Worker exiting with Fargate launches in progress, they will be redelivered", extra={
+            "pending": pending
+        })
 
-     
 
+def run_fargate_task(api_data, job_id=None):
+    """
+    Grava o disparo da tarefa Fargate na fila persistente (não trava o
+    Flask esperando o ECS). O job_id (jobs.store) recebe o taskArn quando
+    a tarefa for lançada. Levanta DispatchQueueFull quando a fila está
+    cheia e diskqueue.QueueError se não conseguir gravar.
+    """
+    dispatcher.submit(api_data, job_id)
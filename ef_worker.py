@@ -0,0 +1,212 @@
+"""
+Worker EF do warm pool (warmpool.py): referência do protocolo e stand-in
+local para testes.
+
+Fica em long poll em EF_WORK_URL/work/lease, "calcula" a FE do exame
+recebido (dorme EF_WORKER_COMPUTE_SECONDS, renovando o aluguel com
+heartbeats), envia o label em PUT /jobs/<job>/label (arquivo aleatório
+de EF_WORKER_LABEL_MB, 0 = sem label; com EF_LABEL_TOKEN, se houver, senão
+com EF_POOL_TOKEN) e confirma em
+/work/<lease>/complete. Sai quando o servidor
+manda {"retire": true}, depois de EF_WORKER_IDLE_EXIT segundos sem
+trabalho (0 = nunca) ou se o servidor ficar inacessível por
+EF_WORKER_GIVE_UP segundos.
+
+A imagem de verdade só precisa seguir o mesmo protocolo no lugar do
+sleep. Com EF_POOL_LAUNCHER=local o scaler sobe estes processos sozinho;
+para testar à mão:
+
+    EF_WORK_URL=http://localhost:8000 python ef_worker.py --compute-seconds 3
+"""
+import argparse
+import logging
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+import requests
+
+
+log = logging.getLogger("ef_worker")
+
+LEASE_WAIT = 20
+
+
+class EfWorker:
+
+    def __init__(self, server_url, worker_id, task=None, token=None, compute_seconds=2.0,
+                 failure_rate=0.0, idle_exit=0.0, give_up=60.0, label_mb=0.0, label_token=None):
+        self.server_url = server_url.rstrip("/")
+        self.worker_id = worker_id
+        self.task = task
+        self.compute_seconds = compute_seconds
+        self.failure_rate = failure_rate
+        self.idle_exit = idle_exit
+        self.give_up = give_up
+        self.label_mb = label_mb
+        self.label_token = label_token
+
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+        self.completed = 0
+
+    def _post(self, path, body, timeout):
+        return self.session.post(
+            f"{self.server_url}{path}", json=dict(body, worker=self.worker_id), timeout=timeout
+        )
+
+    def run(self):
+        idle_since = time.monotonic()
+        unreachable_since = None
+
+        while True:
+            try:
+                response = self._post("/work/lease", {"task": self.task, "wait": LEASE_WAIT}, LEASE_WAIT + 10)
+            except requests.RequestException as e:
+                unreachable_since = unreachable_since or time.monotonic()
+                if time.monotonic() - unreachable_since >= self.give_up:
+                    log.error("Server unreachable, exiting: %s", e)
+                    return 1
+                time.sleep(2)
+                continue
+
+            unreachable_since = None
+
+            if response.status_code == 204:
+                if self.idle_exit and time.monotonic() - idle_since >= self.idle_exit:
+                    log.info("Idle for %.0fs, exiting", self.idle_exit)
+                    return 0
+                continue
+
+            if response.status_code != 200:
+                log.error("Lease failed: %s %s", response.status_code, response.text[:200])
+                time.sleep(2)
+                continue
+
+            work = response.json()
+            if work.get("retire"):
+                log.info("Retired by the server after %d jobs", self.completed)
+                return 0
+
+            self.process(work)
+            idle_since = time.monotonic()
+
+    def process(self, work):
+        lease_id = work["lease_id"]
+        log.info("Job %s leased (attempt %s)", work["job_id"], work.get("attempt"))
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(lease_id, work.get("lease_seconds", 60) / 3, stop), daemon=True
+        )
+        heartbeat.start()
+
+        started = time.monotonic()
+        try:
+            result, error = self.compute(work["exame"])
+            # Ainda com heartbeats: um label grande pode demorar a subir
+            if not error and self.label_mb:
+                error = self.upload_label(work["job_id"])
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        body = {"status": "FAILED" if error else "SUCCEEDED", "result": result, "error": error}
+        try:
+            response = self._post(f"/work/{lease_id}/complete", body, 30)
+        except requests.RequestException as e:
+            # O aluguel expira e o exame vai para outro worker
+            log.error("Could not report job %s: %s", work["job_id"], e)
+            return
+
+        if response.status_code == 200:
+            self.completed += 1
+            log.info("Job %s %s in %.1fs", work["job_id"], body["status"], time.monotonic() - started)
+        else:
+            log.warning("Job %s not accepted: %s %s", work["job_id"], response.status_code, response.text[:200])
+
+    def compute(self, exame):
+        """Cálculo da FE simulado: devolve (result, error)."""
+        time.sleep(self.compute_seconds)
+
+        if self.failure_rate and random.random() < self.failure_rate:
+            return None, "Simulated EF failure"
+
+        return {
+            "ef": round(random.uniform(35, 70), 1),
+            "scan": exame.get("scan"),
+            "worker": self.worker_id
+        }, None
+
+    def upload_label(self, job_id):
+        """Envia um label falso de label_mb (em streaming); devolve o erro ou None."""
+        headers = {"Content-Type": "application/gzip"}
+        if self.label_token:
+            headers["Authorization"] = f"Bearer {self.label_token}"
+
+        with tempfile.TemporaryFile() as f:
+            remaining = int(self.label_mb * 1024 * 1024)
+            while remaining > 0:
+                f.write(os.urandom(min(remaining, 1024 * 1024)))
+                remaining -= 1024 * 1024
+            f.seek(0)
+
+            try:
+                # Objeto arquivo: o requests envia em blocos, com Content-Length
+                response = self.session.put(
+                    f"{self.server_url}/jobs/{job_id}/label",
+                    params={"filename": "label.nii.gz"},
+                    data=f,
+                    headers=headers,
+                    timeout=300
+                )
+            except requests.RequestException as e:
+                return f"Label upload failed: {e}"
+
+        if response.status_code != 201:
+            return f"Label upload failed: {response.status_code} {response.text[:200]}"
+        return None
+
+    def _heartbeat(self, lease_id, interval, stop):
+        while not stop.wait(interval):
+            try:
+                response = self._post(f"/work/{lease_id}/heartbeat", {}, 10)
+            except requests.RequestException as e:
+                log.warning("Heartbeat failed: %s", e)
+                continue
+
+            if response.status_code == 409:
+                log.warning("Lease %s lost while computing", lease_id)
+                return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EF warm pool worker (local stand-in)")
+    parser.add_argument("--server", default=os.getenv("EF_WORK_URL", "http://localhost:8000"))
+    parser.add_argument("--worker-id", default=os.getenv("EF_WORKER_ID", f"{socket.gethostname()}-{os.getpid()}"))
+    parser.add_argument("--compute-seconds", type=float, default=float(os.getenv("EF_WORKER_COMPUTE_SECONDS", "2")))
+    parser.add_argument("--failure-rate", type=float, default=float(os.getenv("EF_WORKER_FAILURE_RATE", "0")))
+    parser.add_argument("--idle-exit", type=float, default=float(os.getenv("EF_WORKER_IDLE_EXIT", "0")))
+    parser.add_argument("--give-up", type=float, default=float(os.getenv("EF_WORKER_GIVE_UP", "60")))
+    parser.add_argument("--label-mb", type=float, default=float(os.getenv("EF_WORKER_LABEL_MB", "0")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s ef_worker[{args.worker_id}] %(message)s")
+
+    raise SystemExit(EfWorker(
+        args.server,
+        args.worker_id,
+        task=os.getenv("EF_TASK_ARN"),
+        token=os.getenv("EF_POOL_TOKEN"),
+        compute_seconds=args.compute_seconds,
+        failure_rate=args.failure_rate,
+        idle_exit=args.idle_exit,
+        give_up=args.give_up,
+        label_mb=args.label_mb,
+        label_token=os.getenv("EF_LABEL_TOKEN")
+    ).run())
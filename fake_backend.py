@@ -0,0 +1,74 @@
+"""
+Backend de IA falso (AI_BACKEND_URL) para testes e benchmarks.
+
+Recebe o multipart que o proxy envia ("file", "model", "params"), lê o
+arquivo em blocos sem guardar em memória e responde com o tamanho e o md5
+do que chegou, depois de FAKE_BACKEND_LATENCY_MS de "inferência".
+FAKE_BACKEND_RESULT_KB engorda o resultado (contornos em JSON) e
+FAKE_BACKEND_GZIP=1 comprime a resposta quando o cliente aceita gzip.
+
+    python fake_backend.py --port 8001
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import time
+
+from flask import Flask, jsonify, request
+
+
+LATENCY = float(os.getenv("FAKE_BACKEND_LATENCY_MS", "50")) / 1000
+RESULT_KB = int(os.getenv("FAKE_BACKEND_RESULT_KB", "0"))
+GZIP = os.getenv("FAKE_BACKEND_GZIP", "0") == "1"
+CHUNK_SIZE = 64 * 1024
+
+app = Flask(__name__)
+
+
+@app.route("/predict", methods=["POST"])
+def predict():
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": "No file received"}), 400
+
+    digest = hashlib.md5()
+    size = 0
+    for chunk in iter(lambda: upload.stream.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+
+    if LATENCY:
+        time.sleep(LATENCY)
+
+    result = {
+        "model": request.form.get("model"),
+        "filename": upload.filename,
+        "size": size,
+        "md5": digest.hexdigest(),
+        "label": {"heart": 1}
+    }
+    if RESULT_KB:
+        # ~16 bytes por ponto [x,y,z]
+        result["contours"] = [[i % 512, i // 512 % 512, i // 262144] for i in range(RESULT_KB * 64)]
+
+    response = jsonify(result)
+    if GZIP and "gzip" in request.headers.get("Accept-Encoding", ""):
+        response.set_data(gzip.compress(response.get_data()))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "READY"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake AI backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    print(f"\n🧪 Fake AI backend running at http://{args.host}:{args.port}/predict\n")
+    app.run(host=args.host, port=args.port, threaded=True)
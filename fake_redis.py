@@ -0,0 +1,242 @@
+"""
+Servidor Redis falso (protocolo RESP) para testes e benchmarks.
+
+Implementa só os comandos que state.RedisStore usa - GET, SET (EX / PX /
+NX / XX), DEL, MGET, SCAN, EXISTS, PING, SELECT, AUTH - mais DBSIZE,
+FLUSHDB e FLUSHALL, com os dados em memória e expiração por chave. Basta
+para rodar o servidor mock com EF_STATE_URL=redis://... sem um Redis
+instalado; com um Redis de verdade nada muda.
+
+    python fake_redis.py --port 6380
+    EF_STATE_URL=redis://localhost:6380/0 gunicorn -w 4 ... monaimockv1:app
+
+FAKE_REDIS_PASSWORD exige AUTH antes dos demais comandos.
+"""
+import argparse
+import os
+import re
+import socketserver
+import threading
+import time
+
+
+PASSWORD = os.getenv("FAKE_REDIS_PASSWORD", "")
+
+_lock = threading.Lock()
+_databases = {}
+
+
+class CommandError(Exception):
+    pass
+
+
+class Status(str):
+    """Resposta simples (+OK), diferente de um valor (bulk string)."""
+
+
+OK = Status("OK")
+
+
+def _db(index):
+    return _databases.setdefault(index, {})
+
+
+def _alive(db, key, now):
+    entry = db.get(key)
+    if entry is None:
+        return None
+    if entry[1] is not None and entry[1] <= now:
+        del db[key]
+        return None
+    return entry
+
+
+def _set(db, args, now):
+    if len(args) < 2:
+        raise CommandError("ERR wrong number of arguments for 'set' command")
+
+    key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+    expires_at = None
+    i = 0
+    while i < len(options):
+        option = options[i]
+        if option in ("EX", "PX") and i + 1 < len(options):
+            amount = float(options[i + 1])
+            expires_at = now + (amount if option == "EX" else amount / 1000)
+            i += 2
+        elif option in ("NX", "XX"):
+            i += 1
+        else:
+            raise CommandError("ERR syntax error")
+
+    exists = _alive(db, key, now) is not None
+    if ("NX" in options and exists) or ("XX" in options and not exists):
+        return None
+
+    db[key] = (value, expires_at)
+    return OK
+
+
+def _glob(pattern):
+    """Padrão do MATCH do Redis (com escapes por barra) como regex."""
+    parts, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\" and i + 1 < len(pattern):
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        elif c == "*":
+            parts.append(".*")
+        elif c == "?":
+            parts.append(".")
+        elif c == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            body = pattern[i + 1:end]
+            parts.append("[^" + body[1:] + "]" if body.startswith("^") else "[" + body + "]")
+            i = end
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def _scan(db, args, now):
+    cursor = int(args[0]) if args else 0
+    pattern, count = "*", 10
+    for name, value in zip(args[1::2], args[2::2]):
+        if name.upper() == "MATCH":
+            pattern = value
+        elif name.upper() == "COUNT":
+            count = int(value)
+
+    match = _glob(pattern).fullmatch
+    keys = sorted(db)
+    batch = keys[cursor:cursor + count]
+    next_cursor = cursor + count if cursor + count < len(keys) else 0
+
+    return [str(next_cursor), [
+        key for key in batch
+        if match(key) and _alive(db, key, now) is not None
+    ]]
+
+
+def execute(session, command, args):
+    name = command.upper()
+    now = time.time()
+
+    if name == "AUTH":
+        if args[-1:] != [PASSWORD]:
+            raise CommandError("WRONGPASS invalid password")
+        session["authenticated"] = True
+        return OK
+
+    if PASSWORD and not session.get("authenticated"):
+        raise CommandError("NOAUTH Authentication required.")
+
+    if name == "PING":
+        return Status("PONG")
+    if name == "SELECT":
+        session["db"] = int(args[0])
+        return OK
+    if name == "FLUSHALL":
+        _databases.clear()
+        return OK
+
+    db = _db(session["db"])
+
+    if name == "GET":
+        entry = _alive(db, args[0], now)
+        return entry[0] if entry else None
+    if name == "MGET":
+        return [(_alive(db, key, now) or (None,))[0] for key in args]
+    if name == "SET":
+        return _set(db, args, now)
+    if name == "DEL":
+        return sum(1 for key in args if _alive(db, key, now) is not None and db.pop(key, None))
+    if name == "EXISTS":
+        return sum(1 for key in args if _alive(db, key, now) is not None)
+    if name == "SCAN":
+        return _scan(db, args, now)
+    if name == "DBSIZE":
+        return sum(1 for key in list(db) if _alive(db, key, now) is not None)
+    if name == "FLUSHDB":
+        db.clear()
+        return OK
+
+    raise CommandError(f"ERR unknown command '{command}'")
+
+
+def encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    if isinstance(value, Status):
+        return b"+%s\r\n" % value.encode()
+    data = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Comando inline (ex.: "PING" digitado no telnet)
+            return line.decode().split()
+
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2].decode())
+        return args
+
+    def handle(self):
+        session = {"db": 0}
+
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            if not args:
+                continue
+
+            if args[0].upper() == "QUIT":
+                self.wfile.write(b"+OK\r\n")
+                return
+
+            try:
+                with _lock:
+                    reply = encode(execute(session, args[0], args[1:]))
+            except CommandError as e:
+                reply = f"-{e}\r\n".encode()
+            except (IndexError, ValueError):
+                reply = f"-ERR wrong arguments for '{args[0]}' command\r\n".encode()
+
+            try:
+                self.wfile.write(reply)
+            except OSError:
+                return
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Redis (RESP) server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+
+    print(f"\n🧪 Fake Redis running at redis://{args.host}:{args.port}/0\n")
+    with Server((args.host, args.port), RespHandler) as server:
+        server.serve_forever()
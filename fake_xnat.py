@@ -0,0 +1,182 @@
+"""
+XNAT falso para testes e benchmarks do servidor mock.
+
+Implementa só o que xnat.XnatClient usa: login por JSESSION (com
+expiração, para exercitar o re-login em 401), o experimento completo em
+JSON (séries + recursos) e a listagem de séries. Os exames são gerados de
+forma determinística a partir dos nomes, então qualquer
+project/subject/experiment existe, exceto experimentos que começam com
+"missing" (404). Um em cada dez experimentos não tem série de eixo curto.
+
+    python fake_xnat.py --port 8002
+    XNAT_HOST=http://localhost:8002 python monaimockv1.py
+
+Variáveis: FAKE_XNAT_USER / FAKE_XNAT_PASSWORD (credenciais aceitas),
+FAKE_XNAT_SESSION_TTL (segundos de validade do JSESSIONID) e
+FAKE_XNAT_LATENCY_MS (atraso artificial por pedido).
+"""
+import argparse
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from flask import Flask, jsonify, request
+
+
+USER = os.getenv("FAKE_XNAT_USER", "admin")
+PASSWORD = os.getenv("FAKE_XNAT_PASSWORD", "")
+SESSION_TTL = float(os.getenv("FAKE_XNAT_SESSION_TTL", "900"))
+LATENCY = float(os.getenv("FAKE_XNAT_LATENCY_MS", "0")) / 1000
+
+# Protocolo típico de ressonância cardíaca: (type, series_description, frames)
+PROTOCOL = [
+    ("Localizer", "Localizer", 3),
+    ("CINE 2CH", "cine_2ch", 30),
+    ("CINE 4CH", "cine_4ch", 30),
+    ("CINE SA", "cine_sa", 360),
+    ("SA MOLLI", "SA MOLLI", 8),
+    ("LGE SA", "LGE SA PSIR", 12)
+]
+
+app = Flask(__name__)
+
+_lock = threading.Lock()
+_sessions = {}
+_stats = {"logins": 0, "requests": 0, "unauthorized": 0}
+
+
+def _seed(*parts):
+    return int(hashlib.sha1("/".join(parts).encode()).hexdigest()[:8], 16)
+
+
+def _scans(project, subject, experiment):
+    seed = _seed(project, subject, experiment)
+    protocol = PROTOCOL if seed % 10 else [item for item in PROTOCOL if "SA" not in item[0]]
+
+    scans = []
+    for index, (scan_type, description, frames) in enumerate(protocol, start=1):
+        file_size = frames * (180_000 + (seed + index) % 40_000)
+        scans.append({
+            "ID": str(index),
+            "type": scan_type,
+            "series_description": description,
+            "quality": "usable",
+            "frames": frames,
+            "resources": [{"label": "DICOM", "format": "DICOM", "file_count": frames, "file_size": file_size}]
+        })
+
+    return scans
+
+
+def _authorized():
+    if request.authorization and (request.authorization.username, request.authorization.password) == (USER, PASSWORD):
+        return True
+
+    token = request.cookies.get("JSESSIONID")
+    with _lock:
+        expires_at = _sessions.get(token)
+        if expires_at is not None and expires_at > time.monotonic():
+            return True
+        _sessions.pop(token, None)
+        _stats["unauthorized"] += 1
+
+    return False
+
+
+@app.before_request
+def before():
+    if LATENCY:
+        time.sleep(LATENCY)
+
+    with _lock:
+        _stats["requests"] += 1
+
+
+@app.route("/data/JSESSION", methods=["POST", "GET"])
+def login():
+    auth = request.authorization
+    if auth is None or (auth.username, auth.password) != (USER, PASSWORD):
+        return "Unauthorized", 401
+
+    token = uuid.uuid4().hex.upper()
+    with _lock:
+        _sessions[token] = time.monotonic() + SESSION_TTL
+        _stats["logins"] += 1
+
+    return token
+
+
+@app.route("/data/JSESSION", methods=["DELETE"])
+def logout():
+    with _lock:
+        _sessions.pop(request.cookies.get("JSESSIONID"), None)
+
+    return "", 200
+
+
+@app.route("/data/projects/<project>/subjects/<subject>/experiments/<experiment>", methods=["GET"])
+def get_experiment(project, subject, experiment):
+    if not _authorized():
+        return "Unauthorized", 401
+
+    if experiment.startswith("missing"):
+        return "Not found", 404
+
+    scan_items = [
+        {
+            "meta": {"xsi:type": "xnat:mrScanData"},
+            "data_fields": {key: scan[key] for key in ("ID", "type", "series_description", "quality", "frames")},
+            "children": [{
+                "field": "file",
+                "items": [
+                    {"meta": {"xsi:type": "xnat:resourceCatalog"}, "data_fields": resource, "children": []}
+                    for resource in scan["resources"]
+                ]
+            }]
+        }
+        for scan in _scans(project, subject, experiment)
+    ]
+
+    return jsonify({"items": [{
+        "meta": {"xsi:type": "xnat:mrSessionData"},
+        "data_fields": {
+            "ID": f"XNAT_E{_seed(project, subject, experiment) % 100000:05d}",
+            "label": experiment,
+            "project": project,
+            "modality": "MR",
+            "date": "2025-11-05"
+        },
+        "children": [{"field": "scans/scan", "items": scan_items}]
+    }]})
+
+
+@app.route("/data/projects/<project>/subjects/<subject>/experiments/<experiment>/scans", methods=["GET"])
+def list_scans(project, subject, experiment):
+    if not _authorized():
+        return "Unauthorized", 401
+
+    if experiment.startswith("missing"):
+        return "Not found", 404
+
+    return jsonify({"ResultSet": {"Result": [
+        {key: str(scan[key]) for key in ("ID", "type", "series_description", "quality", "frames")}
+        for scan in _scans(project, subject, experiment)
+    ]}})
+
+
+@app.route("/fake/stats", methods=["GET"])
+def stats():
+    with _lock:
+        return jsonify(dict(_stats, sessions=len(_sessions)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake XNAT server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8002)
+    args = parser.parse_args()
+
+    print(f"\n🧪 Fake XNAT running at http://{args.host}:{args.port}\n")
+    app.run(host=args.host, port=args.port, threaded=True)
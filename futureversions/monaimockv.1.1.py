@@ -1,14 +1,26 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import requests
 import tempfile
 import os
+import sys
+
+# Módulos compartilhados (proxy, registry, ...) ficam na raiz do repositório;
+# no container o Dockerfile copia todos ao lado do app.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import proxy
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 # URL do seu backend real
-AI_BACKEND_URL = "http://localhost:8001/predict"
+AI_BACKEND_URL = os.getenv("AI_BACKEND_URL", "http://localhost:8001/predict")
+
+def relay_response(response):
+    """Resposta 200 do backend repassada em blocos, sem json() / jsonify"""
+    relay = proxy.ResponseRelay(response, request.headers.get("Accept-Encoding"))
+    return Response(relay, headers=relay.headers)
 
 # ==================== ENDPOINTS MONAI LABEL COMPATÍVEIS ====================
 
@@ -219,20 +231,26 @@ def infer(model_name):
     # Para ferramentas interativas, os cliques/scribbles vêm no form
     # Exemplo: {"foreground": [[x,y,z], [x,y,z]], "background": [[x,y,z]]}
     
+    relay = None
+
     try:
         # Tenta enviar para seu backend real
         with open(temp_path, "rb") as f:
-            response = requests.post(
+            response = proxy.backend.post(
                 AI_BACKEND_URL,
                 files={"file": f},
                 data={
                     "model": model_name,
                     "params": str(params)  # Envia parâmetros interativos
                 },
-                timeout=300
+                headers=proxy.response_headers(request.headers.get("Accept-Encoding")),
+                stream=proxy.RESPONSE_MODE == "stream"
             )
         
-        if response.status_code == 200:
+        if response.status_code == 200 and proxy.RESPONSE_MODE == "stream":
+            relay = relay_response(response)
+            result = {}
+        elif response.status_code == 200:
             result = response.json()
         else:
             # Backend retornou erro
@@ -259,6 +277,9 @@ def infer(model_name):
         if os.path.exists(temp_path) and "file" not in result:
             os.remove(temp_path)
     
+    if relay is not None:
+        return relay
+
     return jsonify(result)
 
 @app.route("/activelearning/<model_name>", methods=["POST"])
@@ -332,7 +353,8 @@ def health():
     return jsonify({
         "status": "READY",
         "healthy": True,
-        "version": "0.5.2"
+        "version": "0.5.2",
+        "backend_pool": proxy.backend.stats()
     })
 
 @app.route("/logs/", methods=["GET"])
@@ -1,14 +1,65 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 import requests
 import tempfile
 import os
+import sys
+
+# Módulos compartilhados (proxy, registry, ...) ficam na raiz do repositório;
+# no container o Dockerfile copia todos ao lado do app.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import applog
+import metrics
+import proxy
+import registry
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+log = applog.get_logger("monaimockv.1.2")
+
+
+@app.before_request
+def start_metrics():
+    g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_started = metrics.request_started(g.metrics_route)
+
+
+@app.after_request
+def record_metrics(response):
+    if "metrics_started" in g:
+        metrics.request_finished(g.metrics_route, request.method, response.status_code, g.metrics_started)
+    return response
+
 # URL do seu backend real
-AI_BACKEND_URL = "http://localhost:8001/predict"
+AI_BACKEND_URL = os.getenv("AI_BACKEND_URL", "http://localhost:8001/predict")
+
+# Modelos publicados (models.1.2.json, recarregado sem restart)
+MODEL_REGISTRY = os.getenv(
+    "MODEL_REGISTRY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.1.2.json")
+)
+models = registry.HotRegistry(MODEL_REGISTRY)
+
+# "stream": repassa o upload ao backend em blocos, sem arquivo temporário
+# "buffered": modo antigo (request.data -> arquivo temporário -> backend)
+PROXY_MODE = os.getenv("PROXY_MODE", "stream")
+
+def precomputed_response(document):
+    """Resposta JSON pré-serializada, com ETag / 304"""
+    if document.not_modified(request.headers.get("If-None-Match")):
+        response = Response(status=304)
+    else:
+        response = Response(document.body, mimetype="application/json")
+
+    response.headers.update(document.headers)
+    return response
+
+def relay_response(response):
+    """Resposta 200 do backend repassada em blocos, sem json() / jsonify"""
+    relay = proxy.ResponseRelay(response, request.headers.get("Accept-Encoding"))
+    return Response(relay, headers=relay.headers)
 
 # ==================== ENDPOINTS MONAI LABEL COMPATÍVEIS ====================
 
@@ -19,164 +70,24 @@ def info():
     Endpoint obrigatório - XNAT chama isso primeiro
     Deve retornar exatamente este formato
     """
-    return jsonify({
-        "name": "MONAILabel",
-        "version": "0.5.2",
-        "description": "MONAI Label Mock Server with Interactive Tools",
-        "labels": ["liver", "spleen", "kidney", "left_ventricle", "right_ventricle", "calcification"],
-        "models": {
-            # Modelos de Segmentação Automática
-            "segmentation_ct": {
-                "type": "segmentation",
-                "labels": {
-                    "liver": 1,
-                    "spleen": 2,
-                    "kidney": 3
-                },
-                "dimension": 3,
-                "description": "Segmentação automática de órgãos abdominais"
-            },
-            "ef_analysis": {
-                "type": "segmentation", 
-                "labels": {
-                    "left_ventricle": 1,
-                    "right_ventricle": 2
-                },
-                "dimension": 3,
-                "description": "Análise de fração de ejeção cardíaca"
-            },
-            "calcium_score": {
-                "type": "segmentation",
-                "labels": {
-                    "calcification": 1
-                },
-                "dimension": 3,
-                "description": "Cálculo de escore de cálcio coronariano"
-            },
-            
-            # Modelos Interativos - DeepEdit
-            "deepedit": {
-                "type": "deepedit",
-                "labels": {
-                    "organ": 1,
-                    "tumor": 2,
-                    "background": 0
-                },
-                "dimension": 3,
-                "description": "Segmentação interativa com DeepEdit - cliques positivos/negativos"
-            },
-            
-            # DeepGrow
-            "deepgrow": {
-                "type": "deepgrow",
-                "labels": {
-                    "foreground": 1,
-                    "background": 0
-                },
-                "dimension": 3,
-                "description": "Segmentação interativa com DeepGrow - cliques para crescimento de região"
-            },
-            
-            # Scribbles
-            "scribbles": {
-                "type": "scribbles",
-                "labels": {
-                    "organ": 1,
-                    "tumor": 2,
-                    "background": 0
-                },
-                "dimension": 3,
-                "description": "Segmentação interativa com Scribbles - desenhe sobre a região"
-            }
-        }
-    })
+    return precomputed_response(models.current().rendered_info)
 
 @app.route("/info/models", methods=["GET"])
 def info_models():
     """
     Lista de modelos - chamado após /info
     """
-    return jsonify([
-        "segmentation_ct",
-        "ef_analysis", 
-        "calcium_score",
-        "deepedit",
-        "deepgrow",
-        "scribbles"
-    ])
+    return precomputed_response(models.current().rendered_models)
 
 @app.route("/info/model/<model_name>", methods=["GET"])
 def info_model(model_name):
     """
     Informações detalhadas de um modelo específico
     """
-    models_info = {
-        "segmentation_ct": {
-            "type": "segmentation",
-            "labels": {
-                "liver": 1,
-                "spleen": 2,
-                "kidney": 3
-            },
-            "dimension": 3,
-            "description": "Segmentação automática de órgãos abdominais",
-            "model_state": "COMPLETED"
-        },
-        "ef_analysis": {
-            "type": "segmentation",
-            "labels": {
-                "left_ventricle": 1,
-                "right_ventricle": 2
-            },
-            "dimension": 3,
-            "description": "Análise de fração de ejeção",
-            "model_state": "COMPLETED"
-        },
-        "calcium_score": {
-            "type": "segmentation",
-            "labels": {
-                "calcification": 1
-            },
-            "dimension": 3,
-            "description": "Cálculo de escore de cálcio",
-            "model_state": "COMPLETED"
-        },
-        "deepedit": {
-            "type": "deepedit",
-            "labels": {
-                "organ": 1,
-                "tumor": 2,
-                "background": 0
-            },
-            "dimension": 3,
-            "description": "Segmentação interativa DeepEdit",
-            "model_state": "COMPLETED"
-        },
-        "deepgrow": {
-            "type": "deepgrow",
-            "labels": {
-                "foreground": 1,
-                "background": 0
-            },
-            "dimension": 3,
-            "description": "Segmentação interativa DeepGrow",
-            "model_state": "COMPLETED"
-        },
-        "scribbles": {
-            "type": "scribbles",
-            "labels": {
-                "organ": 1,
-                "tumor": 2,
-                "background": 0
-            },
-            "dimension": 3,
-            "description": "Segmentação interativa Scribbles",
-            "model_state": "COMPLETED"
-        }
-    }
-    
-    if model_name in models_info:
-        return jsonify(models_info[model_name])
+    model = models.current().rendered_model.get(model_name)
+
+    if model is not None:
+        return precomputed_response(model)
     else:
         return jsonify({"error": f"Model {model_name} not found"}), 404
 
@@ -187,6 +98,9 @@ def infer(model_name):
     Endpoint de inferência - quando o usuário clica em 'Run'
     Suporta modelos automáticos e interativos
     """
+    if PROXY_MODE == "stream":
+        return infer_streaming(model_name)
+
     # Verifica se recebeu arquivo
     file_data = None
     
@@ -219,20 +133,26 @@ def infer(model_name):
     # Para ferramentas interativas, os cliques/scribbles vêm no form
     # Exemplo: {"foreground": [[x,y,z], [x,y,z]], "background": [[x,y,z]]}
     
+    relay = None
+
     try:
         # Tenta enviar para seu backend real
         with open(temp_path, "rb") as f:
-            response = requests.post(
+            response = proxy.backend.post(
                 AI_BACKEND_URL,
                 files={"file": f},
                 data={
                     "model": model_name,
                     "params": str(params)  # Envia parâmetros interativos
                 },
-                timeout=300
+                headers=proxy.response_headers(request.headers.get("Accept-Encoding")),
+                stream=proxy.RESPONSE_MODE == "stream"
             )
         
-        if response.status_code == 200:
+        if response.status_code == 200 and proxy.RESPONSE_MODE == "stream":
+            relay = relay_response(response)
+            result = {}
+        elif response.status_code == 200:
             result = response.json()
         else:
             # Backend retornou erro
@@ -243,9 +163,8 @@ def infer(model_name):
     
     except requests.exceptions.ConnectionError:
         # Backend não disponível - retorna resultado fake
-        print(f"⚠️  Backend não disponível em {AI_BACKEND_URL}")
-        print(f"   Retornando resultado fake para modelo '{model_name}'")
-        
+        log.warning("AI backend unavailable, returning fake result", extra={"url": AI_BACKEND_URL, "model": model_name})
+
         result = generate_fake_result(model_name, params)
     
     except Exception as e:
@@ -259,6 +178,70 @@ def infer(model_name):
         if os.path.exists(temp_path) and "file" not in result:
             os.remove(temp_path)
     
+    if relay is not None:
+        return relay
+
+    return jsonify(result)
+
+def infer_streaming(model_name):
+    """
+    Mesmo contrato do infer(), mas o corpo do pedido é repassado ao
+    backend enquanto chega, sem cópia em memória nem em disco
+    """
+    upload = proxy.StreamingUpload.from_request(request, model_name)
+
+    try:
+        upload.prepare()
+    except proxy.NoFileReceived:
+        return jsonify({
+            "error": "No file received",
+            "message": "Expected 'file' or 'image' in multipart/form-data"
+        }), 400
+    except proxy.FieldTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+
+    try:
+        response = proxy.backend.post(
+            AI_BACKEND_URL,
+            data=upload,
+            headers={
+                "Content-Type": upload.content_type,
+                **proxy.response_headers(request.headers.get("Accept-Encoding"))
+            },
+            stream=proxy.RESPONSE_MODE == "stream"
+        )
+
+        if response.status_code == 200 and proxy.RESPONSE_MODE == "stream":
+            return relay_response(response)
+        elif response.status_code == 200:
+            result = response.json()
+        else:
+            # Backend retornou erro
+            result = {
+                "error": f"Backend returned {response.status_code}",
+                "details": response.text
+            }
+
+    except requests.exceptions.ConnectionError:
+        # Backend não disponível - retorna resultado fake
+        log.warning("AI backend unavailable, returning fake result", extra={"url": AI_BACKEND_URL, "model": model_name})
+
+        try:
+            upload.drain()
+        except proxy.FieldTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+        result = generate_fake_result(model_name, upload.params)
+
+    except proxy.FieldTooLarge as e:
+        # Campo depois do arquivo: o envio ao backend já foi abortado
+        return jsonify({"error": str(e)}), 413
+
+    except Exception as e:
+        result = {
+            "error": str(e),
+            "type": type(e).__name__
+        }
+
     return jsonify(result)
 
 @app.route("/activelearning/<model_name>", methods=["POST"])
@@ -283,7 +266,8 @@ def generate_fake_result(model_name, params=None):
     }
     
     # Se for ferramenta interativa, menciona os parâmetros recebidos
-    if model_name in ["deepedit", "deepgrow", "scribbles"] and params:
+    model = models.current().get(model_name)
+    if model is not None and model["type"] in ("deepedit", "deepgrow", "scribbles") and params:
         result["interactive_params"] = params
         result["message"] = f"Ferramenta interativa '{model_name}' processada com parâmetros recebidos"
     
@@ -293,35 +277,7 @@ def get_labels_for_model(model_name):
     """
     Retorna labels para cada modelo
     """
-    labels = {
-        "segmentation_ct": {
-            "liver": 1,
-            "spleen": 2,
-            "kidney": 3
-        },
-        "ef_analysis": {
-            "left_ventricle": 1,
-            "right_ventricle": 2
-        },
-        "calcium_score": {
-            "calcification": 1
-        },
-        "deepedit": {
-            "organ": 1,
-            "tumor": 2,
-            "background": 0
-        },
-        "deepgrow": {
-            "foreground": 1,
-            "background": 0
-        },
-        "scribbles": {
-            "organ": 1,
-            "tumor": 2,
-            "background": 0
-        }
-    }
-    return labels.get(model_name, {})
+    return models.current().labels(model_name)
 
 # ==================== ENDPOINTS AUXILIARES ====================
 
@@ -332,14 +288,34 @@ def health():
     return jsonify({
         "status": "READY",
         "healthy": True,
-        "version": "0.5.2"
+        "version": "0.5.2",
+        "backend_pool": proxy.backend.stats(),
+        "logs": applog.stats()
     })
 
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Métricas Prometheus (soma de todos os workers do gunicorn)"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 @app.route("/logs/", methods=["GET"])
 @app.route("/logs", methods=["GET"])
 def logs():
-    """Logs (opcional)"""
-    return jsonify([])
+    """
+    Últimos registros deste worker: ?since=<seq> só os novos, ?level=WARNING,
+    ?lines=N (padrão 200 sem since) e ?follow=1 para acompanhar (NDJSON).
+    """
+    since = request.args.get("since", type=int)
+    level = request.args.get("level")
+
+    if request.args.get("follow") in ("1", "true"):
+        follower = applog.follow(since, level)
+        if follower is None:
+            return jsonify({"error": "Too many log followers on this worker"}), 503, {"Retry-After": "30"}
+        return Response(follower, mimetype="application/x-ndjson")
+
+    return jsonify(applog.read(since, level, request.args.get("lines", type=int)))
 
 # ==================== MAIN ====================
 
@@ -355,6 +331,8 @@ if __name__ == "__main__":
     print("   GET  /info/models             - Lista de modelos")
     print("   GET  /info/model/<n>       - Info de modelo específico")
     print("   POST /infer/<model>           - Executar inferência")
+    print("   GET  /metrics                 - Métricas Prometheus")
+    print("   GET  /logs?follow=1           - Logs do worker (NDJSON)")
     print("=" * 70)
     print("\n💡 Modelos Automáticos:")
     print("   • segmentation_ct   - Segmentação de órgãos abdominais")
@@ -0,0 +1,45 @@
+"""
+Configuração do gunicorn (lida automaticamente do diretório atual).
+
+Prepara as métricas Prometheus para vários workers: cada worker grava em
+PROMETHEUS_MULTIPROC_DIR e o /metrics soma todos (metrics.py). Cada
+worker sobe a fila de disparos assim que inicia, para recuperar na hora
+o que um worker anterior deixou pela metade (ef.py). Os flags de
+workers / threads continuam na linha de comando (Dockerfile).
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+# Precisa estar definido antes de qualquer import do prometheus_client,
+# que escolhe o modo de armazenamento ao ser importado
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "monai-mock-metrics")
+)
+
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    # Arquivos de uma execução anterior somariam contadores antigos
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Gauges "livesum" do worker morto deixam de contar
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # Só quando o app usa o ef.py (monaimockv1 / asgi): não importa por conta própria
+    ef = sys.modules.get("ef")
+    if ef is not None:
+        ef.dispatcher.start()
+
+    # Warm pool: o scaler precisa rodar mesmo sem /infer chegando
+    warmpool = sys.modules.get("warmpool")
+    if warmpool is not None and warmpool.ENABLED:
+        warmpool.pool.start()
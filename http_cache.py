@@ -0,0 +1,35 @@
+"""
+Respostas JSON pré-serializadas para as rotas mais consultadas (/info...).
+
+O corpo é gerado uma vez (na subida ou quando os modelos mudam) junto com
+um ETag forte; cada hit só compara o If-None-Match e devolve os bytes
+prontos, ou um 304 sem corpo.
+"""
+import hashlib
+import json
+import os
+
+from werkzeug.http import parse_etags
+
+
+# Tempo que o navegador / XNAT pode reutilizar /info sem revalidar
+INFO_MAX_AGE = int(os.getenv("INFO_MAX_AGE", "30"))
+
+# Access-Control-Max-Age dos preflights CORS (o Chrome limita a 7200)
+CORS_MAX_AGE = int(os.getenv("CORS_MAX_AGE", "7200"))
+
+
+class PrecomputedJSON:
+
+    def __init__(self, document, max_age=INFO_MAX_AGE):
+        self.body = json.dumps(document, separators=(",", ":")).encode()
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+        self.headers = {
+            "ETag": self.etag,
+            "Cache-Control": f"public, max-age={max_age}, must-revalidate"
+        }
+
+    def not_modified(self, if_none_match):
+        # If-None-Match usa comparação fraca: W/"..." (ETag enfraquecido por
+        # um proxy que comprimiu a resposta) também vale
+        return bool(if_none_match) and parse_etags(if_none_match).contains_weak(self.etag.strip('"'))
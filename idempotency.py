@@ -0,0 +1,109 @@
+"""
+Deduplicação de pedidos de inferência repetidos.
+
+Duplo clique no OHIF e retentativas do XNAT mandam o mesmo scan várias
+vezes; dentro do TTL o pedido repetido reaproveita o disparo que já foi
+feito em vez de lançar outra tarefa Fargate. As chaves ficam no store
+compartilhado (state.py), então o pedido repetido é reconhecido mesmo
+quando cai em outro worker.
+"""
+import json
+import os
+import threading
+import time
+
+import metrics
+import state
+
+
+DEDUP_TTL = float(os.getenv("EF_DEDUP_TTL", "600"))
+# Entre o claim e o jobs.store.create ainda há escolha de série (XNAT) e
+# admissão: uma entrada sem job mais nova que isso é um disparo em andamento
+DEDUP_PENDING = float(os.getenv("EF_DEDUP_PENDING", "60"))
+
+KEY_PREFIX = "dedup:"
+
+
+def scan_key(model_name, project, subject, experiment, scan):
+    return (model_name, project, subject, experiment, scan)
+
+
+def pending(entry, now=None):
+    """A entrada acabou de ser reivindicada e o job ainda não foi criado."""
+    return (now or time.time()) - entry["created_at"] < DEDUP_PENDING
+
+
+def _name(key):
+    return KEY_PREFIX + "/".join(key)
+
+
+class IdempotencyCache:
+
+    def __init__(self, ttl=DEDUP_TTL, backend=None):
+        self.ttl = ttl
+        self.backend = backend or state.store
+        self._lock = threading.Lock()
+        self._claims = 0
+        self._saved = 0
+
+    def claim(self, key, job_id, reusable=None):
+        """
+        Retorna (entry, is_new). is_new=False significa que o mesmo pedido
+        já foi disparado dentro do TTL e não deve ser lançado de novo; o
+        entry["job_id"] é o job que o pedido repetido deve acompanhar.
+
+        reusable(entry) permite descartar uma entrada que não serve mais
+        (ex.: o job anterior falhou) e disparar de novo.
+        """
+        name = _name(key)
+        entry = {"key": key, "job_id": job_id, "created_at": time.time()}
+        value = json.dumps({"job_id": job_id, "created_at": entry["created_at"]})
+
+        with self._lock:
+            self._claims += 1
+
+        # Poucas voltas: só repete quando a entrada some entre o add e o get
+        for _ in range(3):
+            if self.backend.add(name, value, ttl=self.ttl):
+                metrics.cache_lookup("dedup", False)
+                return entry, True
+
+            stored = self.backend.get(name)
+            if stored is None:
+                continue
+
+            existing = dict(json.loads(stored), key=key)
+            if reusable is not None and not reusable(existing):
+                self.backend.delete(name)
+                continue
+
+            with self._lock:
+                self._saved += 1
+            metrics.cache_lookup("dedup", True)
+            return existing, False
+
+        # Outro worker disputando a mesma chave o tempo todo: dispara mesmo assim
+        self.backend.set(name, value, ttl=self.ttl)
+        metrics.cache_lookup("dedup", False)
+        return entry, True
+
+    def release(self, key):
+        """Libera a chave quando o disparo não foi aceito (ex.: fila cheia)."""
+        self.backend.delete(_name(key))
+
+    def release_prefix(self, prefix):
+        """Libera todas as chaves que começam com a tupla prefix."""
+        if len(prefix) >= 5:
+            return self.backend.delete(_name(prefix))
+        return self.backend.delete_prefix(_name(prefix) + "/")
+
+    def stats(self):
+        with self._lock:
+            claims, saved = self._claims, self._saved
+
+        return {
+            "ttl_seconds": self.ttl,
+            "tracked": self.backend.count(KEY_PREFIX),
+            "claims": claims,
+            "launches_saved": saved
+        }
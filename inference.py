@@ -0,0 +1,547 @@
+"""
+Lógica das rotas do servidor MONAI Label mock, independente de framework.
+
+monaimockv1.py (Flask / gunicorn gthread) e asgi.py (asyncio / uvicorn)
+chamam as mesmas funções e só traduzem o resultado para a resposta HTTP.
+As funções de infer devolvem (status, body, headers), onde body é um dict
+(JSON), bytes já serializados ou None.
+"""
+import hmac
+import math
+import os
+import threading
+import time
+
+from werkzeug.http import parse_etags
+
+import admission
+import applog
+import diskqueue
+import ef
+import idempotency
+import jobs
+import labels
+import registry
+import results
+import series
+import state
+import tracing
+import warmpool
+import xnat
+
+
+log = applog.get_logger(__name__)
+
+CORS_ORIGINS = [
+    "http://localhost",
+    "http://131.255.22.222",
+    "http://localhost:8000",
+    "https://go.imside.ai"
+]
+
+#------------------------------------
+# CONFIGURAÇÃO DOS MODELOS (models.json, recarregado sem restart)
+# ---------------------------------------------------------
+MODEL_REGISTRY = os.getenv(
+    "MODEL_REGISTRY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.json")
+)
+
+models = registry.HotRegistry(MODEL_REGISTRY)
+
+
+def is_ecs_model(name):
+    model = models.current().get(name)
+    return model is not None and model.get("dispatch") == "ecs"
+
+
+# Pedidos repetidos do mesmo scan dentro do TTL não disparam outra tarefa
+dedup = idempotency.IdempotencyCache()
+
+# Resultados de análises concluídas (store compartilhado)
+result_cache = results.ResultCache()
+
+# DELETE /results e GET /jobs (lista com identificadores de pacientes) exigem
+# Authorization: Bearer <token>; sem token essas rotas ficam desligadas
+ADMIN_TOKEN = os.getenv("EF_ADMIN_TOKEN")
+
+
+def _store_result(job):
+    if job["status"] != jobs.SUCCEEDED:
+        return
+
+    key = results.result_key(
+        job["model"], job["project"], job["subject"], job["experiment"], job["scan"],
+        job["task_definition"]
+    )
+    result_cache.put(key, {
+        "message": f"OK - {job['model']}",
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "task_arn": job["task_arn"],
+        "task_definition": job["task_definition"],
+        "result": job.get("result"),
+        # Arquivo de segmentação enviado pelo worker, se houver (labels.py)
+        "label": job.get("label"),
+        "label_url": labels.label_url(job["job_id"]) if job.get("label") else None,
+        "completed_at": job["updated_at"],
+        "cached": True
+    })
+
+
+def _release_admission(job):
+    if job["status"] in jobs.TERMINAL_STATUSES:
+        admission.controller.release(job["job_id"])
+
+
+def _trace_job(job):
+    """Spans do ciclo de vida do job, no trace do /infer que o criou."""
+    traceparent = job.get("traceparent")
+    if not traceparent:
+        return
+
+    error = (job["error"] or job["stopped_reason"]) if job["status"] == jobs.FAILED else None
+    attributes = {"job_id": job["job_id"], "status": job["status"], "task_arn": job["task_arn"], "worker": job["worker"]}
+    tracing.record_span("job", traceparent, job["created_at"], job["updated_at"], attributes, error)
+
+    ecs_timestamps = job.get("ecs_timestamps") or {}
+    created = ecs_timestamps.get("createdAt")
+    pull_started = ecs_timestamps.get("pullStartedAt")
+    pull_stopped = ecs_timestamps.get("pullStoppedAt")
+    started = ecs_timestamps.get("startedAt")
+    stopped = ecs_timestamps.get("stoppingAt") or ecs_timestamps.get("stoppedAt")
+
+    attributes = {"job_id": job["job_id"], "task_arn": job["task_arn"]}
+    tracing.record_span("ecs.provisioning", traceparent, created, pull_started or started, attributes)
+    tracing.record_span("ecs.image_pull", traceparent, pull_started, pull_stopped, attributes)
+    tracing.record_span(
+        "ef.run", traceparent, started, stopped, dict(attributes, exit_code=job["exit_code"]), error
+    )
+
+
+jobs.store.add_listener(_store_result)
+jobs.store.add_listener(_release_admission)
+jobs.store.add_listener(_trace_job)
+
+
+# =========================================================
+# /info, /datastore, /session
+# =========================================================
+def datastore_info(image_path):
+    parts = image_path.split("/")
+    scan_id = parts[-1] if len(parts) >= 1 else "unknown"
+
+    info = {
+        "id": scan_id,
+        "name": image_path,
+        "size": 1,
+        "status": "READY"
+    }
+
+    if not xnat.enabled() or len(parts) < 4:
+        return info
+
+    try:
+        scan = xnat.client.scan(*parts[:4])
+    except xnat.NotFound:
+        scan = None
+    except xnat.XnatError as e:
+        log.warning("XNAT unavailable, returning default image info", extra={"error": str(e)})
+        return info
+
+    if scan is None:
+        return dict(info, size=0, status="NOT_FOUND")
+
+    resource = xnat.preferred_resource(scan)
+    file_count = resource["file_count"] if resource else 0
+
+    return dict(
+        info,
+        size=resource["file_size"] if resource else 0,
+        status="READY" if file_count else "EMPTY",
+        files=file_count,
+        series_description=scan["series_description"]
+    )
+
+
+def create_session():
+    log.info("MONAILabel session requested")
+
+    return {
+        "session_id": "mock-session",
+        "expiry": 7200,
+        "status": "READY"
+    }
+
+
+# =========================================================
+# /infer
+# =========================================================
+def parse_image(image_path):
+    """'project/subject/experiment/scan' enviado pelo MONAI / OHIF."""
+    parts = image_path.split("/") if image_path else []
+
+    project    = parts[0] if len(parts) > 0 else ""
+    subject    = parts[1] if len(parts) > 1 else ""
+    experiment = parts[2] if len(parts) > 2 else ""
+    scan       = parts[3] if len(parts) > 3 else ""
+
+    return project, subject, experiment, scan
+
+
+# Metadados enviados quando o exame não é conferido no XNAT
+DEFAULT_SCAN_DESCRIPTION = "rEIXO_CURTO"
+DEFAULT_XNAT_HOST = "https://go.imside.ai"
+DEFAULT_EXPERIMENT_TYPE = "MR"
+DEFAULT_RESOURCE_NAME = "DICOM"
+
+
+@tracing.traced("xnat.select_series")
+def select_series(model_name, project, subject, experiment, scan):
+    """
+    Confere (ou escolhe, se scan vier vazio) a série a analisar.
+    Retorna (scan, scan_description, erro), onde erro é (status, body, headers).
+    """
+    matcher = series.MATCHERS.get(models.current().get(model_name).get("series"))
+
+    if matcher is None or not xnat.enabled():
+        return scan, DEFAULT_SCAN_DESCRIPTION, None
+
+    try:
+        scans = xnat.list_scans(project, subject, experiment)
+    except xnat.NotFound:
+        return scan, None, (404, {"error": f"Experiment '{experiment}' not found"}, {})
+    except xnat.XnatError as e:
+        # Sem XNAT não dá para conferir: segue com o scan pedido
+        log.warning("XNAT unavailable, skipping series selection", extra={"error": str(e)})
+        return scan, DEFAULT_SCAN_DESCRIPTION, None
+
+    ranked = matcher.rank_scans(scans)
+
+    if not scan and ranked:
+        best = ranked[0]
+        log.info("Short-axis series selected", extra={
+            "experiment": experiment, "scan": best["ID"], "series_description": best.get("series_description", "")
+        })
+        return best["ID"], best.get("series_description") or best.get("type", ""), None
+
+    for candidate in ranked:
+        if candidate["ID"] == scan:
+            return scan, candidate.get("series_description") or candidate.get("type", ""), None
+
+    error = (
+        f"Scan '{scan}' is not a short-axis cine series" if scan
+        else f"No short-axis cine series in experiment '{experiment}'"
+    )
+    log.info("Series rejected", extra={"experiment": experiment, "scan": scan, "error": error})
+
+    return scan, None, (422, {
+        "error": error,
+        "candidates": [
+            {"scan": candidate["ID"], "series_description": candidate.get("series_description", "")}
+            for candidate in ranked
+        ]
+    }, {})
+
+
+@tracing.traced("xnat.exam_metadata")
+def exam_metadata(project, subject, experiment, scan):
+    """xnathost, experiment_type e resource_name do EXAME_JSON."""
+    metadata = {
+        "xnathost": xnat.client.host or DEFAULT_XNAT_HOST,
+        "experiment_type": DEFAULT_EXPERIMENT_TYPE,
+        "resource_name": DEFAULT_RESOURCE_NAME
+    }
+
+    if not xnat.enabled():
+        return metadata
+
+    try:
+        # Normalmente já está no cache (select_series / datastore_info)
+        experiment_info = xnat.client.experiment(project, subject, experiment)
+    except xnat.XnatError as e:
+        log.warning("XNAT unavailable, using default exam metadata", extra={"error": str(e)})
+        return metadata
+
+    if experiment_info["modality"]:
+        metadata["experiment_type"] = experiment_info["modality"]
+
+    for candidate in experiment_info["scans"]:
+        if candidate["ID"] == scan:
+            resource = xnat.preferred_resource(candidate)
+            if resource and resource["label"]:
+                metadata["resource_name"] = resource["label"]
+            break
+
+    return metadata
+
+
+def _job_reusable(entry):
+    # Um pedido repetido só reaproveita jobs em andamento ou concluídos.
+    # Sem registro ainda: o primeiro pedido está entre o claim e o create
+    job = jobs.store.get(entry["job_id"])
+    if job is None:
+        return idempotency.pending(entry)
+    return job["status"] != jobs.FAILED
+
+
+def _cached_result(body, etag, if_none_match):
+    headers = {"ETag": etag, "X-Cache": "HIT"}
+
+    if if_none_match and parse_etags(if_none_match).contains(etag.strip('"')):
+        return 304, None, headers
+
+    return 200, body, headers
+
+
+def submit_infer(model_name, image_path, use_cache=True, if_none_match=None, user=None, traceparent=None,
+                 proxy_secret=None):
+    """
+    POST /infer de um modelo ECS: (status, body, headers). traceparent é o
+    header W3C do cliente, quando houver (tracing.py). user (X-User) só
+    conta para os limites com o segredo do proxy em proxy_secret.
+    """
+    user = admission.trusted_user(user, proxy_secret)
+    with tracing.continue_trace(
+        f"infer {model_name}", traceparent, kind=tracing.SERVER, root=True,
+        attributes={"model": model_name, "image": image_path, "user": user}
+    ) as span:
+        status, body, headers = _submit_infer(model_name, image_path, use_cache, if_none_match, user)
+
+        span.set_attribute("http.status_code", status)
+        if isinstance(body, dict):
+            span.set_attribute("job_id", body.get("job_id"))
+            span.set_attribute("deduplicated", body.get("deduplicated"))
+        span.set_attribute("cache", headers.get("X-Cache"))
+        if status >= 500:
+            span.set_error(body.get("error") if isinstance(body, dict) else status)
+
+        return status, body, headers
+
+
+def _submit_infer(model_name, image_path, use_cache, if_none_match, user):
+
+    if not is_ecs_model(model_name):
+        return 404, {"error": f"Model '{model_name}' not supported"}, {}
+
+    log.info("Infer request received", extra={"model": model_name, "image": image_path})
+
+    project, subject, experiment, scan = parse_image(image_path)
+    scan_description = None
+
+    # Sem scan no pedido: escolhe a melhor série antes de montar as chaves
+    if not scan:
+        scan, scan_description, error = select_series(model_name, project, subject, experiment, scan)
+        if error:
+            return error
+        if scan:
+            image_path = "/".join((project, subject, experiment, scan))
+
+    if use_cache:
+        cached = result_cache.get(
+            results.result_key(model_name, project, subject, experiment, scan, ef.TASK_DEFINITION)
+        )
+        if cached is not None:
+            log.info("Cached result served", extra={"image": image_path})
+            return _cached_result(*cached, if_none_match)
+
+    key = idempotency.scan_key(model_name, project, subject, experiment, scan)
+    with tracing.start_span("dedup.claim", root=False):
+        entry, is_new = dedup.claim(key, jobs.new_job_id(), reusable=_job_reusable)
+    job_id = entry["job_id"]
+
+    if not is_new:
+        log.info("Duplicate infer request joined existing job", extra={"image": image_path, "job_id": job_id})
+        return 200, {
+            "message": "OK - ef_analysis",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+            "deduplicated": True
+        }, {}
+
+    if scan_description is None:
+        scan, scan_description, error = select_series(model_name, project, subject, experiment, scan)
+        if error:
+            dedup.release(key)
+            return error
+
+    # ECS instável (circuito aberto): recusa na hora em vez de enfileirar mais.
+    # No warm pool os workers já ligados continuam atendendo
+    retry_after = 0 if warmpool.ENABLED else ef.launch_retry_after()
+    if retry_after > 0:
+        dedup.release(key)
+        retry_after = math.ceil(retry_after)
+        log.warning("Infer request shed, ECS circuit is open", extra={"image": image_path, "retry_after": retry_after})
+        return 503, {
+            "error": "ECS is unavailable, launches are suspended",
+            "retry_after": retry_after
+        }, {"Retry-After": str(retry_after)}
+
+    # Limites por projeto / usuário, antes de criar o job e de tocar no ECS
+    try:
+        with tracing.start_span("admission", root=False):
+            admission.controller.admit(project, user, job_id)
+    except admission.Rejected as e:
+        dedup.release(key)
+        return 429, {
+            "error": "Too many requests",
+            "limit": e.key,
+            "reason": e.reason,
+            "retry_after": e.retry_after
+        }, {"Retry-After": str(e.retry_after)}
+
+    jobs.store.create(
+        job_id, model_name, image_path, project, subject, experiment, scan,
+        traceparent=tracing.current_traceparent()
+    )
+
+    metadata = exam_metadata(project, subject, experiment, scan)
+
+    api_data = {
+        "xnathost": metadata["xnathost"],
+        "user": xnat.client.user,
+        "project": project,
+        "subject": subject,
+        "experiment": experiment,
+        "experiment_type": metadata["experiment_type"],
+        "scan": scan,
+        "scan_description": scan_description,
+        "resource_name": metadata["resource_name"],
+        "files": "data"
+    }
+
+    log.debug("API data sent to EF module", extra={"job_id": job_id, "api_data": api_data})
+
+    try:
+        with tracing.start_span("dispatch.enqueue", kind=tracing.PRODUCER, root=False):
+            if warmpool.ENABLED:
+                warmpool.pool.submit(api_data, job_id)
+                log.info("Exam queued for the warm pool", extra={"job_id": job_id})
+            else:
+                ef.run_fargate_task(api_data, job_id)
+                log.info("Fargate task queued", extra={"job_id": job_id})
+    except ef.DispatchQueueFull as e:
+        dedup.release(key)
+        admission.controller.release(job_id)
+        jobs.store.discard(job_id)
+        log.warning("Dispatch queue full", extra={"job_id": job_id, "retry_after": e.retry_after})
+        return 503, {"error": "Server busy, dispatch queue is full"}, {"Retry-After": str(e.retry_after)}
+    except diskqueue.CommitUnknown:
+        # Pode ter sido gravado: job, vaga e chave de dedup ficam, e a
+        # retentativa do cliente acompanha este job em vez de disparar outro
+        log.warning("Dispatch queue commit outcome unknown", extra={"job_id": job_id})
+        return 503, {
+            "error": "Server busy, the dispatch may still run",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}"
+        }, {"Retry-After": str(ef.DISPATCH_RETRY_AFTER)}
+    except Exception:
+        dedup.release(key)
+        admission.controller.release(job_id)
+        jobs.store.discard(job_id)
+        log.exception("Error while calling ef.run_fargate_task", extra={"job_id": job_id})
+        return 500, {"error": "Failed to run ef_analysis"}, {}
+
+    return 200, {
+        "message": "OK - ef_analysis",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}"
+    }, {}
+
+
+# =========================================================
+# /jobs, /results, /health
+# =========================================================
+def _check_admin(authorization, action):
+    """None se authorization traz o EF_ADMIN_TOKEN; senão (status, body, headers)."""
+    if not ADMIN_TOKEN:
+        return 403, {"error": f"{action} is disabled (EF_ADMIN_TOKEN is not set)"}, {}
+
+    if not hmac.compare_digest(authorization or "", f"Bearer {ADMIN_TOKEN}"):
+        return 401, {"error": "Invalid admin token"}, {}
+
+    return None
+
+
+def list_jobs(authorization, project=None, status=None):
+    """
+    GET /jobs: (status, body, headers). Só com o token de admin: a lista
+    traz projeto / sujeito / experimento de todos os pacientes. GET
+    /jobs/<id> continua aberto (o id é aleatório e só quem disparou o tem).
+    """
+    error = _check_admin(authorization, "Job listing")
+    if error:
+        return error
+
+    return 200, jobs.store.list(project=project, status=status), {}
+
+
+def invalidate_results(authorization, model_name, image_path):
+    """DELETE /results/<modelo>: (status, body, headers)."""
+    error = _check_admin(authorization, "Result invalidation")
+    if error:
+        return error
+
+    parts = [part for part in image_path.split("/") if part][:4]
+
+    prefix = "/".join([model_name, *parts])
+    prefix += "@" if len(parts) == 4 else "/"
+
+    removed = result_cache.invalidate(prefix)
+    dedup.release_prefix((model_name, *parts))
+
+    log.info("Results invalidated", extra={"model": model_name, "image": image_path, "removed": removed})
+    return 200, {"invalidated": removed}, {}
+
+
+# Contagens do /health?detail=1 (filas, store, diretório de labels)
+# reaproveitadas por este tempo: sondas frequentes não varrem tudo a cada vez
+HEALTH_DETAIL_TTL = float(os.getenv("EF_HEALTH_DETAIL_TTL", "10"))
+
+_health_lock = threading.Lock()
+_health_detail = None
+_health_detail_at = 0.0
+
+
+def health(detail=False):
+    """
+    Liveness: só contadores em memória, sem tocar em disco nem no store.
+    detail=True junta as contagens das filas, jobs, caches, labels e
+    admissão, calculadas no máximo uma vez a cada HEALTH_DETAIL_TTL.
+    """
+    body = {
+        "status": "READY",
+        "healthy": True,
+        "breaker": ef.breaker.stats(),
+        "launch_targets": ef.targets.stats(),
+        "state": state.store.stats(),
+        "xnat": xnat.client.stats(),
+        "logs": applog.stats(),
+        "tracing": tracing.stats(),
+        "models": {"version": models.current().version, "reloads": models.reloads}
+    }
+
+    if detail:
+        body.update(_cached_health_detail())
+
+    return body
+
+
+def _cached_health_detail():
+    global _health_detail, _health_detail_at
+
+    with _health_lock:
+        now = time.monotonic()
+        if _health_detail is None or now - _health_detail_at >= HEALTH_DETAIL_TTL:
+            _health_detail = {
+                "dispatch": ef.dispatcher.stats(),
+                "pool": warmpool.pool.stats() if warmpool.ENABLED else {"enabled": False},
+                "idempotency": dedup.stats(),
+                "jobs": jobs.store.stats(),
+                "results": result_cache.stats(),
+                "labels": labels.store.stats(),
+                "admission": admission.controller.stats()
+            }
+            _health_detail_at = now
+
+        return _health_detail
@@ -0,0 +1,297 @@
+"""
+Acompanhamento dos jobs de inferência disparados no ECS.
+
+Cada /infer vira um job com id próprio, gravado no store compartilhado
+(state.py): qualquer worker do gunicorn responde GET /jobs/<id>. Um único
+poller por vez (lease no store) atualiza todos os jobs ativos com chamadas
+DescribeTasks em lote (até 100 ARNs por chamada, agrupados por
+região/cluster), então o custo do polling não cresce com o número de jobs
+simultâneos nem com o número de workers.
+
+Chaves: job:<id> (o registro) e active-job:<id> (só os jobs lançados e
+ainda não terminados, o que o poller lê).
+
+No warm pool (warmpool.py) não há tarefa por job: o job fica LAUNCHED
+com o id do worker EF que o alugou (sem task_arn, então o poller não o
+consulta) e termina quando o worker confirma o resultado.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from threading import Thread
+
+import applog
+import ecs
+import metrics
+import state
+import tracing
+
+
+log = applog.get_logger(__name__)
+
+POLL_INTERVAL = float(os.getenv("EF_JOB_POLL_INTERVAL", "5"))
+JOB_RETENTION = float(os.getenv("EF_JOB_RETENTION", "86400"))
+
+QUEUED = "QUEUED"
+LAUNCHED = "LAUNCHED"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+
+TERMINAL_STATUSES = (SUCCEEDED, FAILED)
+
+JOB_PREFIX = "job:"
+ACTIVE_PREFIX = "active-job:"
+POLLER_LEASE = "lease:job-poller"
+
+# Timestamps do DescribeTasks guardados quando a tarefa para (spans do ECS)
+ECS_TIMESTAMPS = ("createdAt", "pullStartedAt", "pullStoppedAt", "startedAt", "stoppingAt", "stoppedAt")
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+class JobStore:
+
+    def __init__(self, poll_interval=POLL_INTERVAL, retention=JOB_RETENTION, backend=None):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.backend = backend or state.store
+        self._lock = threading.Lock()
+        self._pid = None
+        self._polls = 0
+        self._describe_calls = 0
+        self._listeners = []
+
+    # -----------------------------------------------------
+    # Registro
+    # -----------------------------------------------------
+    def _save(self, job):
+        # Terminados somem depois de retention; os demais ficam até terminar
+        ttl = self.retention if job["status"] in TERMINAL_STATUSES else None
+        self.backend.set(JOB_PREFIX + job["job_id"], json.dumps(job), ttl=ttl)
+
+        if job["status"] == LAUNCHED and job["task_arn"]:
+            self.backend.set(ACTIVE_PREFIX + job["job_id"], json.dumps({
+                "task_arn": job["task_arn"], "region": job["region"], "cluster": job["cluster"]
+            }))
+        elif job["status"] in TERMINAL_STATUSES:
+            self.backend.delete(ACTIVE_PREFIX + job["job_id"])
+
+    def create(self, job_id, model, image, project, subject, experiment, scan, traceparent=None):
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "model": model,
+            "image": image,
+            "project": project,
+            "subject": subject,
+            "experiment": experiment,
+            "scan": scan,
+            "status": QUEUED,
+            "ecs_status": None,
+            "task_arn": None,
+            "task_definition": None,
+            "region": None,
+            "cluster": None,
+            "worker": None,
+            "exit_code": None,
+            "stopped_reason": None,
+            "error": None,
+            # Contexto do trace do /infer (tracing.py)
+            "traceparent": traceparent,
+            "created_at": now,
+            "updated_at": now
+        }
+
+        self._save(job)
+        return job
+
+    def discard(self, job_id):
+        """Remove um job que nunca chegou a ser aceito (ex.: fila cheia)."""
+        self.backend.delete(JOB_PREFIX + job_id, ACTIVE_PREFIX + job_id)
+
+    def get(self, job_id):
+        value = self.backend.get(JOB_PREFIX + job_id)
+        if value is None:
+            return None
+
+        job = json.loads(value)
+        if job["status"] == LAUNCHED:
+            # O worker que lançou pode ter morrido: este passa a acompanhar
+            self._ensure_poller()
+        return job
+
+    def list(self, project=None, status=None):
+        jobs = [
+            job for job in (json.loads(value) for _, value in self.backend.scan(JOB_PREFIX))
+            if (project is None or job["project"] == project)
+            and (status is None or job["status"] == status)
+        ]
+
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    def add_listener(self, listener):
+        """listener(job) é chamado quando um job termina (SUCCEEDED / FAILED)."""
+        self._listeners.append(listener)
+
+    def _update(self, job_ids, **fields):
+        # Sem transação entre workers: cada job só é escrito pelo disparo
+        # (QUEUED -> LAUNCHED / FAILED) e depois só pelo poller
+        now = time.time()
+        finished = []
+
+        for job_id in job_ids:
+            job = self.get(job_id)
+            if job is None:
+                continue
+
+            was_terminal = job["status"] in TERMINAL_STATUSES
+            job.update(fields)
+            job["updated_at"] = now
+            self._save(job)
+
+            if not was_terminal and job["status"] in TERMINAL_STATUSES:
+                finished.append(job)
+
+        for job in finished:
+            for listener in self._listeners:
+                try:
+                    listener(job)
+                except Exception:
+                    log.exception("Error in job listener", extra={"job_id": job["job_id"]})
+
+    def mark_launched(self, job_ids, task_arn, region, cluster, task_definition=None, ecs_status=None):
+        self._update(
+            job_ids,
+            status=LAUNCHED,
+            task_arn=task_arn,
+            task_definition=task_definition,
+            region=region,
+            cluster=cluster,
+            ecs_status=ecs_status,
+            launched_at=time.time()
+        )
+        self._ensure_poller()
+
+    def mark_leased(self, job_ids, worker, task_definition=None):
+        """Warm pool: o job foi entregue ao worker EF de id worker."""
+        self._update(
+            job_ids,
+            status=LAUNCHED,
+            worker=worker,
+            task_definition=task_definition,
+            ecs_status="RUNNING",
+            launched_at=time.time()
+        )
+
+    def mark_succeeded(self, job_ids, result=None):
+        self._update(job_ids, status=SUCCEEDED, exit_code=0, result=result)
+
+    def mark_failed(self, job_ids, error):
+        self._update(job_ids, status=FAILED, error=error)
+
+    def set_label(self, job_id, label):
+        """Metadados do arquivo de label enviado pelo worker (labels.py)."""
+        self._update([job_id], label=label)
+
+    # -----------------------------------------------------
+    # Polling em lote
+    # -----------------------------------------------------
+    def _ensure_poller(self):
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            Thread(target=self._poll_loop, name="ef-job-poller", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+
+            try:
+                # Todos os workers têm um poller; só o que pega o lease consulta o ECS
+                if self.backend.add(POLLER_LEASE, f"{os.getpid()}:{uuid.uuid4().hex}", ttl=self.poll_interval * 0.9):
+                    self.poll_once()
+            except Exception as e:
+                log.error("Error polling ECS tasks", extra={"error": str(e)})
+
+    def _active_tasks(self):
+        """ARNs ativos agrupados por (região, cluster) -> {arn: [job_ids]}."""
+        groups = {}
+
+        for key, value in self.backend.scan(ACTIVE_PREFIX):
+            task = json.loads(value)
+            arns = groups.setdefault((task["region"], task["cluster"]), {})
+            arns.setdefault(task["task_arn"], []).append(key[len(ACTIVE_PREFIX):])
+
+        return groups
+
+    def poll_once(self, launcher=None):
+        launcher = launcher or ecs.get_launcher()
+
+        for (region, cluster), arns in self._active_tasks().items():
+            arn_list = list(arns)
+
+            for i in range(0, len(arn_list), ecs.DESCRIBE_TASKS_MAX):
+                chunk = arn_list[i:i + ecs.DESCRIBE_TASKS_MAX]
+                with metrics.launcher_call(launcher, "describe_tasks"):
+                    response = launcher.describe_tasks(region, cluster, chunk)
+
+                with self._lock:
+                    self._describe_calls += 1
+
+                for task in response.get("tasks", []):
+                    self._apply_task(arns.get(task["taskArn"], []), task)
+
+                for failure in response.get("failures", []):
+                    self.mark_failed(arns.get(failure.get("arn"), []), f"ECS: {failure.get('reason')}")
+
+        with self._lock:
+            self._polls += 1
+
+    def _apply_task(self, job_ids, task):
+        last_status = task.get("lastStatus")
+
+        if last_status != "STOPPED":
+            self._update(job_ids, ecs_status=last_status)
+            return
+
+        exit_codes = [c.get("exitCode") for c in task.get("containers", [])]
+        failed_codes = [code for code in exit_codes if code not in (0, None)]
+
+        if failed_codes:
+            exit_code = failed_codes[0]
+        elif exit_codes and all(code == 0 for code in exit_codes):
+            exit_code = 0
+        else:
+            exit_code = None
+
+        self._update(
+            job_ids,
+            status=SUCCEEDED if exit_code == 0 else FAILED,
+            ecs_status=last_status,
+            exit_code=exit_code,
+            stopped_reason=task.get("stoppedReason"),
+            ecs_timestamps={field: tracing.epoch(task.get(field)) for field in ECS_TIMESTAMPS}
+        )
+
+    def stats(self):
+        with self._lock:
+            polls, describe_calls = self._polls, self._describe_calls
+
+        return {
+            "tracked": self.backend.count(JOB_PREFIX),
+            "active": self.backend.count(ACTIVE_PREFIX),
+            "polls": polls,
+            "describe_calls": describe_calls
+        }
+
+
+store = JobStore()
@@ -0,0 +1,384 @@
+"""
+Arquivos de label (segmentação NIfTI) dos jobs, guardados em disco.
+
+Um label de centenas de MB não passa pela memória do Python nem na ida
+nem na volta:
+
+    PUT /jobs/<id>/label?filename=label.nii.gz
+        o worker EF envia o arquivo como corpo cru; os blocos vão direto
+        para um temporário no mesmo diretório, que só vira o label do job
+        (os.replace) quando o upload termina inteiro
+    GET /jobs/<id>/label
+        send_file do Flask (wsgi.file_wrapper -> sendfile no gunicorn) ou
+        FileResponse do Starlette, com Range (206), If-Range,
+        If-None-Match / If-Modified-Since (304) e ETag forte (sha256)
+    POST /infer/<modelo>?output=image
+        como no MONAI Label: resultado já pronto volta como o label, não
+        como JSON (ainda em andamento, continua o 202 com status_url)
+
+Cada label tem um .json ao lado (nome, tipo, tamanho, sha256), então o
+arquivo continua acessível depois que o registro do job expira, enquanto o
+resultado em cache apontar para ele. O arquivo de dados leva o sha256 no
+nome (<job>.<sha256[:16]>.label) e o .json diz qual é o atual: um novo
+upload grava os dados ao lado dos antigos, troca o .json e só então apaga a
+versão anterior, então um GET concorrente nunca serve bytes novos com o
+ETag antigo. Labels mais velhos que
+EF_LABEL_RETENTION somem na próxima gravação (no máximo uma limpeza por
+hora por worker).
+
+O diretório precisa ser compartilhado pelos workers do host (como as filas
+em disco). O PUT exige Authorization: Bearer <EF_LABEL_TOKEN> (padrão:
+EF_POOL_TOKEN, que os workers do pool já recebem); sem token os uploads
+ficam desligados.
+"""
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from werkzeug.http import http_date, parse_date, parse_etags
+
+import applog
+import jobs
+import metrics
+import results
+
+
+log = applog.get_logger(__name__)
+
+LABEL_DIR = os.getenv("EF_LABEL_DIR", os.path.join(tempfile.gettempdir(), "monai-mock-labels"))
+LABEL_MAX_BYTES = int(os.getenv("EF_LABEL_MAX_BYTES", str(2 * 1024 ** 3)))
+# Os labels acompanham o cache de resultados, que aponta para eles
+LABEL_RETENTION = float(os.getenv("EF_LABEL_RETENTION", str(results.RESULT_TTL)))
+LABEL_MAX_AGE = int(os.getenv("EF_LABEL_MAX_AGE", "3600"))
+LABEL_TOKEN = os.getenv("EF_LABEL_TOKEN") or os.getenv("EF_POOL_TOKEN")
+
+CHUNK_SIZE = 1024 * 1024
+PRUNE_INTERVAL = 3600
+# Temporário de um upload que morreu no meio
+STALE_UPLOAD_SECONDS = 3600
+
+DEFAULT_FILENAME = "label.nii.gz"
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+FILENAME = re.compile(r"[\w.-]{1,128}")
+
+
+class LabelTooLarge(Exception):
+    pass
+
+
+class LabelWriter:
+    """Um upload em andamento: write() por bloco, depois commit() ou abort()."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self.size = 0
+        self._digest = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(prefix=f".{job_id}.", suffix=".tmp", dir=store.directory)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.store.max_bytes:
+            raise LabelTooLarge(f"Label larger than {self.store.max_bytes} bytes")
+
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self, filename, content_type):
+        self._file.close()
+
+        label = {
+            "filename": filename,
+            "content_type": content_type,
+            "size": self.size,
+            "sha256": self._digest.hexdigest(),
+            "uploaded_at": time.time()
+        }
+
+        self.store._install(self.job_id, self._tmp_path, label)
+        return label
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class LabelStore:
+
+    def __init__(self, directory=LABEL_DIR, max_bytes=LABEL_MAX_BYTES, retention=LABEL_RETENTION):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.retention = retention
+
+        self._lock = threading.Lock()
+        self._ready = False
+        self._pruned_at = 0.0
+        self._uploads = 0
+        self._uploaded_bytes = 0
+        self._rejected = 0
+        self._pruned = 0
+
+    def _ensure_dir(self):
+        if not self._ready:
+            os.makedirs(self.directory, exist_ok=True)
+            self._ready = True
+
+    def meta_path(self, job_id):
+        return os.path.join(self.directory, job_id + ".json")
+
+    def data_path(self, job_id, label):
+        # Labels gravados antes do versionamento não têm "file"
+        name = label.get("file") or job_id + ".label"
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self, job_id):
+        with open(self.meta_path(job_id)) as f:
+            return json.load(f)
+
+    def _write_meta(self, path, label):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(label, f)
+        os.replace(tmp_path, path)
+
+    def _install(self, job_id, tmp_path, label):
+        """Dados versionados primeiro, depois o .json, por fim a versão antiga."""
+        label["file"] = f"{job_id}.{label['sha256'][:16]}.label"
+        data_path = self.data_path(job_id, label)
+
+        try:
+            previous = self.data_path(job_id, self._read_meta(job_id))
+        except (FileNotFoundError, ValueError):
+            previous = None
+
+        os.replace(tmp_path, data_path)
+        self._write_meta(self.meta_path(job_id), label)
+
+        if previous and previous != data_path:
+            try:
+                os.unlink(previous)
+            except FileNotFoundError:
+                pass
+
+    def writer(self, job_id):
+        self._ensure_dir()
+        self._maybe_prune()
+        return LabelWriter(self, job_id)
+
+    def record_upload(self, label):
+        with self._lock:
+            self._uploads += 1
+            self._uploaded_bytes += label["size"]
+        metrics.LABEL_UPLOADS.labels("ok").inc()
+        metrics.LABEL_UPLOAD_SIZE.observe(label["size"])
+
+    def record_rejected(self, reason):
+        with self._lock:
+            self._rejected += 1
+        metrics.LABEL_UPLOADS.labels(reason).inc()
+
+    def get(self, job_id):
+        """(caminho do arquivo, metadados, os.stat) ou None."""
+        # Um upload concorrente pode apagar a versão que o .json lido ainda
+        # apontava: relê o .json uma vez antes de desistir
+        for _ in range(2):
+            try:
+                label = self._read_meta(job_id)
+                data_path = self.data_path(job_id, label)
+                return data_path, label, os.stat(data_path)
+            except FileNotFoundError:
+                continue
+        return None
+
+    def delete(self, job_id):
+        try:
+            paths = [self.meta_path(job_id), self.data_path(job_id, self._read_meta(job_id))]
+        except (FileNotFoundError, ValueError):
+            paths = [self.meta_path(job_id)]
+
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _maybe_prune(self):
+        now = time.time()
+        with self._lock:
+            if now - self._pruned_at < PRUNE_INTERVAL:
+                return
+            self._pruned_at = now
+
+        try:
+            self.prune(now)
+        except OSError as e:
+            log.warning("Error pruning label files", extra={"error": str(e)})
+
+    def prune(self, now=None):
+        """Remove labels mais velhos que retention (e uploads abandonados)."""
+        now = now or time.time()
+        removed = 0
+
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                max_age = STALE_UPLOAD_SECONDS if entry.name.endswith(".tmp") else self.retention
+                try:
+                    if now - entry.stat().st_mtime > max_age:
+                        os.unlink(entry.path)
+                        removed += entry.name.endswith(".label")
+                except FileNotFoundError:
+                    pass
+
+        if removed:
+            with self._lock:
+                self._pruned += removed
+            log.info("Old label files removed", extra={"removed": removed})
+        return removed
+
+    def stats(self):
+        files = size = 0
+        if os.path.isdir(self.directory):
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".label"):
+                        files += 1
+                        try:
+                            size += entry.stat().st_size
+                        except FileNotFoundError:
+                            pass
+
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "files": files,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "retention_seconds": self.retention,
+                "uploads": self._uploads,
+                "uploaded_bytes": self._uploaded_bytes,
+                "rejected": self._rejected,
+                "pruned": self._pruned
+            }
+
+
+store = LabelStore()
+
+
+# =========================================================
+# Helpers das rotas (monaimockv1.py e asgi.py)
+# =========================================================
+def label_url(job_id):
+    return f"/jobs/{job_id}/label"
+
+
+def begin_upload(authorization, job_id, content_length=None):
+    """PUT /jobs/<id>/label: (LabelWriter, None) ou (None, resposta de erro)."""
+    if not LABEL_TOKEN:
+        return None, (403, {"error": "Label uploads are disabled (EF_LABEL_TOKEN is not set)"}, {})
+
+    if not hmac.compare_digest(authorization or "", f"Bearer {LABEL_TOKEN}"):
+        return None, (401, {"error": "Invalid label token"}, {})
+
+    if not JOB_ID.fullmatch(job_id) or jobs.store.get(job_id) is None:
+        return None, (404, {"error": f"Job '{job_id}' not found"}, {})
+
+    if content_length is not None and content_length > store.max_bytes:
+        store.record_rejected("too_large")
+        return None, (413, {"error": f"Label larger than {store.max_bytes} bytes"}, {})
+
+    return store.writer(job_id), None
+
+
+def finish_upload(writer, filename, content_type):
+    """Confirma o upload e liga o label ao job: (status, body, headers)."""
+    filename = os.path.basename(filename or "")
+    if not FILENAME.fullmatch(filename):
+        filename = DEFAULT_FILENAME
+
+    label = writer.commit(filename, content_type or DEFAULT_CONTENT_TYPE)
+    store.record_upload(label)
+    jobs.store.set_label(writer.job_id, label)
+
+    log.info("Label uploaded", extra={"job_id": writer.job_id, "size": label["size"]})
+    return 201, {"job_id": writer.job_id, "label": label, "label_url": label_url(writer.job_id)}, {}
+
+
+def reject_upload(writer, error):
+    writer.abort()
+    store.record_rejected("too_large")
+    return 413, {"error": str(error)}, {}
+
+
+def upload(authorization, job_id, read, content_length=None, filename=None, content_type=None):
+    """PUT /jobs/<id>/label síncrono: lê read(CHUNK_SIZE) até b""."""
+    writer, error = begin_upload(authorization, job_id, content_length)
+    if error:
+        return error
+
+    try:
+        for chunk in iter(lambda: read(CHUNK_SIZE), b""):
+            writer.write(chunk)
+    except LabelTooLarge as e:
+        return reject_upload(writer, e)
+    except BaseException:
+        writer.abort()
+        raise
+
+    return finish_upload(writer, filename, content_type)
+
+
+def locate(job_id):
+    """GET /jobs/<id>/label: ((caminho, metadados, stat), None) ou (None, resposta de erro)."""
+    found = store.get(job_id) if JOB_ID.fullmatch(job_id) else None
+    if found is None:
+        return None, (404, {"error": f"No label for job '{job_id}'"}, {})
+    return found, None
+
+
+def result_label(status, body):
+    """
+    ?output=image do /infer: (caminho, metadados, stat) do label de um
+    resultado pronto (200), ou None para responder o JSON de sempre.
+    """
+    if status != 200:
+        return None
+
+    document = json.loads(body) if isinstance(body, bytes) else body
+    if not isinstance(document, dict) or not document.get("label") or not document.get("job_id"):
+        return None
+
+    found, _ = locate(document["job_id"])
+    return found
+
+
+def etag(label):
+    return f'"{label["sha256"]}"'
+
+
+def not_modified(label, stat, if_none_match, if_modified_since):
+    """Resposta condicional (304) para o FileResponse, que não trata isso sozinho."""
+    if if_none_match:
+        return parse_etags(if_none_match).contains(label["sha256"])
+
+    since = parse_date(if_modified_since) if if_modified_since else None
+    return since is not None and int(stat.st_mtime) <= since.timestamp()
+
+
+def file_headers(label, stat):
+    return {
+        "ETag": etag(label),
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": f"private, max-age={LABEL_MAX_AGE}",
+        "Accept-Ranges": "bytes"
+    }
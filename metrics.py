@@ -0,0 +1,257 @@
+"""
+Métricas Prometheus do servidor mock (GET /metrics).
+
+Com PROMETHEUS_MULTIPROC_DIR definido (o gunicorn.conf.py define), cada
+worker grava seus valores em arquivos mmap nesse diretório e o /metrics
+de qualquer worker soma todos os processos; o hook child_exit limpa os
+gauges de workers que morreram. Sem a variável (python monaimockv1.py)
+as métricas são só do processo atual.
+
+Razões de acerto dos caches saem das contagens hit/miss, por exemplo:
+
+    sum(rate(monai_mock_cache_lookups_total{result="hit"}[5m])) by (cache)
+      / sum(rate(monai_mock_cache_lookups_total[5m])) by (cache)
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess
+)
+
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Rotas rápidas (/info, preflight) ficam nos primeiros buckets; uploads e
+# chamadas ao backend de IA, nos últimos
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2, 1024 ** 3)
+
+
+# =========================================================
+# HTTP
+# =========================================================
+REQUESTS = Counter(
+    "monai_mock_http_requests_total", "HTTP requests handled",
+    ["route", "method", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "monai_mock_http_request_duration_seconds", "HTTP request latency",
+    ["route", "method"], buckets=LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "monai_mock_http_requests_in_flight", "HTTP requests being handled",
+    ["route"], multiprocess_mode="livesum"
+)
+
+# =========================================================
+# Fila de disparo (ef.Dispatcher)
+# =========================================================
+# A fila em disco é do host: todos os workers veem a mesma profundidade
+DISPATCH_QUEUE_DEPTH = Gauge(
+    "monai_mock_dispatch_queue_depth", "Fargate launches waiting in the dispatch queue",
+    multiprocess_mode="livemax"
+)
+DISPATCH_BUSY = Gauge(
+    "monai_mock_dispatch_workers_busy", "Dispatch threads currently launching",
+    multiprocess_mode="livesum"
+)
+DISPATCH_WAIT = Histogram(
+    "monai_mock_dispatch_wait_seconds", "Time a launch waited in the dispatch queue",
+    buckets=LATENCY_BUCKETS
+)
+DISPATCH_REJECTED = Counter(
+    "monai_mock_dispatch_rejected_total", "Launches rejected because the dispatch queue was full"
+)
+DISPATCH_BATCH_SIZE = Histogram(
+    "monai_mock_dispatch_batch_size", "Exams per RunTask call",
+    buckets=(1, 2, 5, 10, 25, 50, 100)
+)
+DISPATCH_REDELIVERED = Counter(
+    "monai_mock_dispatch_redelivered_total", "Dispatches delivered again after a lost lease or a worker restart"
+)
+DISPATCH_COMMIT_LATENCY = Histogram(
+    "monai_mock_dispatch_queue_commit_seconds", "Dispatch queue group commit (insert + fsync) duration",
+    buckets=LATENCY_BUCKETS
+)
+DISPATCH_COMMIT_SIZE = Histogram(
+    "monai_mock_dispatch_queue_commit_size", "Dispatches written per group commit",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+# =========================================================
+# Warm pool de workers EF (warmpool.py)
+# =========================================================
+# Publicado só pelo worker que escala o pool: vale o valor mais recente
+POOL_WORKERS = Gauge(
+    "monai_mock_pool_workers", "Warm pool EF workers (live, starting, target)",
+    ["state"], multiprocess_mode="livemostrecent"
+)
+POOL_LEASES = Counter(
+    "monai_mock_pool_leases_total", "Work lease requests from pool workers, by outcome",
+    ["outcome"]
+)
+POOL_WAIT = Histogram(
+    "monai_mock_pool_wait_seconds", "Time an exam waited in the work queue until a pool worker took it",
+    buckets=LATENCY_BUCKETS
+)
+POOL_JOB_DURATION = Histogram(
+    "monai_mock_pool_job_duration_seconds", "Time from lease to completion on a pool worker",
+    ["status"], buckets=LATENCY_BUCKETS
+)
+POOL_LAUNCHES = Counter(
+    "monai_mock_pool_launches_total", "Pool worker tasks started by the scaler"
+)
+
+ADMISSION_REJECTED = Counter(
+    "monai_mock_admission_rejected_total", "Infer requests rejected by admission control (429)",
+    ["scope", "reason"]
+)
+
+# =========================================================
+# Launcher ECS (boto3 / aws CLI / fake)
+# =========================================================
+LAUNCHER_LATENCY = Histogram(
+    "monai_mock_launcher_duration_seconds", "ECS API call (or aws CLI subprocess) duration",
+    ["launcher", "operation"], buckets=LATENCY_BUCKETS
+)
+LAUNCHER_CALLS = Counter(
+    "monai_mock_launcher_calls_total", "ECS API calls by outcome (ok, or error / CLI exit code)",
+    ["launcher", "operation", "outcome"]
+)
+
+LAUNCH_RETRIES = Counter(
+    "monai_mock_launch_retries_total", "RunTask calls retried, by failure class",
+    ["reason"]
+)
+LAUNCH_TARGET_CALLS = Counter(
+    "monai_mock_launch_target_calls_total", "RunTask calls per launch target, by outcome (ok or failure class)",
+    ["target", "outcome"]
+)
+LAUNCH_TARGET_LATENCY = Histogram(
+    "monai_mock_launch_target_duration_seconds", "RunTask duration per launch target",
+    ["target"], buckets=LATENCY_BUCKETS
+)
+BREAKER_STATE = Gauge(
+    "monai_mock_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ["breaker"], multiprocess_mode="livemax"
+)
+BREAKER_TRANSITIONS = Counter(
+    "monai_mock_breaker_transitions_total", "Circuit breaker state changes",
+    ["breaker", "state"]
+)
+BREAKER_REJECTED = Counter(
+    "monai_mock_breaker_rejected_total", "Calls refused because the circuit was open",
+    ["breaker"]
+)
+
+# =========================================================
+# Backend de IA (proxy)
+# =========================================================
+BACKEND_LATENCY = Histogram(
+    "monai_mock_backend_request_duration_seconds", "AI backend request duration",
+    buckets=LATENCY_BUCKETS
+)
+BACKEND_REQUESTS = Counter(
+    "monai_mock_backend_requests_total", "AI backend requests by status (or error type)",
+    ["status"]
+)
+BACKEND_BYTES = Counter(
+    "monai_mock_backend_bytes_total", "Bytes exchanged with the AI backend",
+    ["direction"]
+)
+BACKEND_UPLOAD_SIZE = Histogram(
+    "monai_mock_backend_upload_bytes", "Size of uploads forwarded to the AI backend",
+    buckets=BYTES_BUCKETS
+)
+PROXY_RESPONSES = Counter(
+    "monai_mock_proxy_responses_total", "Backend responses relayed to the client, by handling and encoding",
+    ["mode", "encoding"]
+)
+PROXY_RESPONSE_BYTES = Counter(
+    "monai_mock_proxy_response_bytes_total", "Relayed response bytes read from the backend and sent to the client",
+    ["side"]
+)
+
+# =========================================================
+# Arquivos de label (labels.py)
+# =========================================================
+LABEL_UPLOADS = Counter(
+    "monai_mock_label_uploads_total", "Label file uploads from EF workers, by outcome",
+    ["outcome"]
+)
+LABEL_UPLOAD_SIZE = Histogram(
+    "monai_mock_label_upload_bytes", "Size of uploaded label files",
+    buckets=BYTES_BUCKETS
+)
+LABEL_RESPONSES = Counter(
+    "monai_mock_label_responses_total", "Label file responses (full, range, not_modified)",
+    ["outcome"]
+)
+
+# =========================================================
+# Caches
+# =========================================================
+CACHE_LOOKUPS = Counter(
+    "monai_mock_cache_lookups_total", "Cache lookups by cache and result (hit / miss)",
+    ["cache", "result"]
+)
+
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def request_started(route):
+    """route é o template da rota (/infer/<model_name>), não a URL."""
+    IN_FLIGHT.labels(route).inc()
+    return time.perf_counter()
+
+
+def request_finished(route, method, status, started):
+    IN_FLIGHT.labels(route).dec()
+    REQUEST_LATENCY.labels(route, method).observe(time.perf_counter() - started)
+    REQUESTS.labels(route, method, str(status)).inc()
+
+
+@contextmanager
+def launcher_call(launcher, operation):
+    start = time.perf_counter()
+    outcome = "ok"
+
+    try:
+        yield
+    except Exception as e:
+        outcome = str(getattr(e, "code", None) or type(e).__name__)
+        raise
+    finally:
+        LAUNCHER_LATENCY.labels(launcher.name, operation).observe(time.perf_counter() - start)
+        LAUNCHER_CALLS.labels(launcher.name, operation, outcome).inc()
+
+
+def backend_request(seconds, status, sent, received):
+    BACKEND_LATENCY.observe(seconds)
+    BACKEND_REQUESTS.labels(str(status)).inc()
+    BACKEND_BYTES.labels("sent").inc(sent)
+    BACKEND_BYTES.labels("received").inc(received)
+    BACKEND_UPLOAD_SIZE.observe(sent)
+
+
+def proxy_response(mode, encoding, received, sent):
+    PROXY_RESPONSES.labels(mode, encoding).inc()
+    BACKEND_BYTES.labels("received").inc(received)
+    PROXY_RESPONSE_BYTES.labels("backend").inc(received)
+    PROXY_RESPONSE_BYTES.labels("client").inc(sent)
+
+
+def render():
+    """(corpo, content-type) do /metrics."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
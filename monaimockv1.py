@@ -1,33 +1,83 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
-import ef
+import applog
+import http_cache
+import inference
+import jobs
+import labels
+import metrics
+import warmpool
 
 app = Flask(__name__)
 CORS(
     app,
     supports_credentials=True,
-    origins=[
-        "http://localhost",
-        "http://131.255.22.222",
-        "http://localhost:8000",
-        "https://go.imside.ai"
-    ]
+    origins=inference.CORS_ORIGINS,
+    max_age=http_cache.CORS_MAX_AGE
 )
 
 
 
 @app.before_request
 def handle_options():
+    # Template da rota (não a URL) para não explodir a cardinalidade
+    g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_started = metrics.request_started(g.metrics_route)
+
+    # Preflight: o flask-cors completa os cabeçalhos (inclusive Max-Age)
     if request.method == "OPTIONS":
-        return "", 200
+        return "", 204
+
+
+@app.after_request
+def record_metrics(response):
+    if "metrics_started" in g:
+        metrics.request_finished(g.metrics_route, request.method, response.status_code, g.metrics_started)
+    return response
+
+
+def _make_response(status, body, headers):
+    if body is None:
+        response = Response(status=status)
+    elif isinstance(body, bytes):
+        response = Response(body, status=status, mimetype="application/json")
+    else:
+        response = jsonify(body)
+        response.status_code = status
+
+    response.headers.update(headers)
+    return response
+
+
+def _label_response(path, label, stat):
+    # wsgi.file_wrapper (sendfile no gunicorn); Range, If-Range e 304 pelo Werkzeug
+    response = send_file(
+        path,
+        mimetype=label["content_type"],
+        as_attachment=True,
+        download_name=label["filename"],
+        conditional=True,
+        etag=label["sha256"],
+        last_modified=stat.st_mtime,
+        max_age=labels.LABEL_MAX_AGE
+    )
+    response.cache_control.public = False
+    response.cache_control.private = True
+
+    outcome = {206: "range", 304: "not_modified"}.get(response.status_code, "full")
+    metrics.LABEL_RESPONSES.labels(outcome).inc()
+    return response
+
+
+def _precomputed_response(document):
+    if document.not_modified(request.headers.get("If-None-Match")):
+        response = Response(status=304)
+    else:
+        response = Response(document.body, mimetype="application/json")
 
+    response.headers.update(document.headers)
+    return response
 
-#------------------------------------
-# CONFIGURAÇÃO DOS MODELOS
-# ---------------------------------------------------------
-MODEL_TARGETS = {
-    "ef_analysis": "http://ef_analysis:5000"
-}
 
 # =========================================================
 # 1) /info
@@ -35,19 +85,7 @@ MODEL_TARGETS = {
 @app.route("/info", methods=["GET"])
 @app.route("/info/", methods=["GET"])
 def info():
-    return jsonify({
-        "name": "MONAILabel MOCK",
-        "version": "1.0",
-        "description": "MONAI Label mock server (print api_data only)",
-        "labels": ["heart"],
-        "models": {
-            "ef_analysis": {
-                "type": "segmentation",
-                "labels": {"heart": 1},
-                "dimension": 3
-            }
-        }
-    })
+    return _precomputed_response(inference.models.current().rendered_info)
 
 
 # =========================================================
@@ -55,9 +93,7 @@ def info():
 # =========================================================
 @app.route("/info/models", methods=["GET"])
 def info_models():
-    return jsonify([
-        "ef_analysis"
-    ])
+    return _precomputed_response(inference.models.current().rendered_models)
 
 
 # =========================================================
@@ -65,16 +101,12 @@ def info_models():
 # =========================================================
 @app.route("/info/model/<name>", methods=["GET"])
 def info_model(name):
+    model = inference.models.current().rendered_model.get(name)
 
-    if name not in MODEL_TARGETS:
+    if model is None:
         return jsonify({"error": "Model not found"}), 404
 
-    return jsonify({
-        "type": "segmentation",
-        "labels": {"heart": 1},
-        "dimension": 3,
-        "model_state": "READY"
-    })
+    return _precomputed_response(model)
 
 
 # =========================================================
@@ -82,16 +114,7 @@ def info_model(name):
 # =========================================================
 @app.route("/datastore/image/info/", methods=["GET"])
 def datastore_info():
-    image_path = request.args.get("image", "")
-    parts = image_path.split("/")
-    scan_id = parts[-1] if len(parts) >= 1 else "unknown"
-
-    return jsonify({
-        "id": scan_id,
-        "name": image_path,
-        "size": 1,
-        "status": "READY"
-    })
+    return jsonify(inference.datastore_info(request.args.get("image", "")))
 
 
 # =========================================================
@@ -99,13 +122,7 @@ def datastore_info():
 # =========================================================
 @app.route("/session/", methods=["POST", "OPTIONS"])
 def session_create():
-    print("\n✅ MONAILabel Requested Session")
-
-    return jsonify({
-        "session_id": "mock-session",
-        "expiry": 7200,
-        "status": "READY"
-    })
+    return jsonify(inference.create_session())
 
 
 # =========================================================
@@ -113,54 +130,157 @@ def session_create():
 # =========================================================
 @app.route("/infer/<model_name>", methods=["POST"])
 def infer(model_name):
+    status, body, headers = inference.submit_infer(
+        model_name,
+        request.args.get("image", ""),
+        # Cache-Control: no-cache força uma nova análise
+        use_cache="no-cache" not in request.headers.get("Cache-Control", ""),
+        if_none_match=request.headers.get("If-None-Match"),
+        # Usuário autenticado, repassado pelo proxy do XNAT (limites por usuário)
+        user=request.headers.get("X-User"),
+        proxy_secret=request.headers.get("X-Proxy-Secret"),
+        # Contexto W3C de quem chamou, se houver (tracing.py)
+        traceparent=request.headers.get("traceparent")
+    )
+
+    # output=image (MONAI Label): resultado pronto volta como o arquivo de label
+    if request.args.get("output") == "image":
+        found = labels.result_label(status, body)
+        if found is not None:
+            return _label_response(*found)
+
+    return _make_response(status, body, headers)
 
-    if model_name not in MODEL_TARGETS:
-        return jsonify({"error": f"Model '{model_name}' not supported"}), 404
 
-    print(f"\n🚀 Infer request received for model: {model_name}")
+# =========================================================
+# 7) /jobs
+# =========================================================
+@app.route("/jobs", methods=["GET"])
+@app.route("/jobs/", methods=["GET"])
+def list_jobs():
+    """Exige Authorization: Bearer <EF_ADMIN_TOKEN>."""
+    return _make_response(*inference.list_jobs(
+        request.headers.get("Authorization"),
+        project=request.args.get("project"),
+        status=request.args.get("status")
+    ))
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = jobs.store.get(job_id)
+
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
 
-    # Caminho enviado pelo MONAI / OHIF
-    image_path = request.args.get("image", "")
-    parts = image_path.split("/") if image_path else []
+    return jsonify(job)
 
-    project    = parts[0] if len(parts) > 0 else ""
-    subject    = parts[1] if len(parts) > 1 else ""
-    experiment = parts[2] if len(parts) > 2 else ""
-    scan       = parts[3] if len(parts) > 3 else ""
 
-    api_data = {
-        "xnathost": "https://go.imside.ai",
-        "user": "admin",
-        "project": project,
-        "subject": subject,
-        "experiment": experiment,
-        "experiment_type": "MR",
-        "scan": scan,
-        "scan_description": "rEIXO_CURTO",
-        "resource_name": "DICOM",
-        "files": "data"
-    }
+@app.route("/jobs/<job_id>/label", methods=["GET"])
+def get_label(job_id):
+    found, error = labels.locate(job_id)
+    if error:
+        return _make_response(*error)
 
-    print("\n📦 API DATA SENT TO EF MODULE:")
-    print(api_data)
+    return _label_response(*found)
 
-    try:
-        ef.run_fargate_task(api_data)
-        print("✅ Fargate task triggered successfully")
-    except Exception as e:
-        print("❌ Error while calling ef.run_fargate_task:", str(e))
-        return jsonify({"error": "Failed to run ef_analysis"}), 500
-        
 
-    return jsonify({"message": "OK - ef_analysis"}), 200
+@app.route("/jobs/<job_id>/label", methods=["PUT"])
+def upload_label(job_id):
+    """Label do job enviado pelo worker EF: corpo cru, gravado em blocos."""
+    return _make_response(*labels.upload(
+        request.headers.get("Authorization"),
+        job_id,
+        request.stream.read,
+        request.content_length,
+        request.args.get("filename"),
+        request.mimetype
+    ))
 
 
 # =========================================================
-# 7) /health
+# 8) /results (invalidação do cache)
+# =========================================================
+@app.route("/results/<model_name>", methods=["DELETE"])
+def invalidate_results(model_name):
+    """
+    Invalida os resultados de um modelo; ?image= restringe a um projeto,
+    sujeito, experimento ou scan (project/subject/experiment/scan).
+    Exige Authorization: Bearer <EF_ADMIN_TOKEN>.
+    """
+    return _make_response(*inference.invalidate_results(
+        request.headers.get("Authorization"), model_name, request.args.get("image", "")
+    ))
+
+
+# =========================================================
+# 9) /health
 # =========================================================
 @app.route("/health", methods=["GET"])
 def health():
-    return "OK", 200
+    """?detail=1 acrescenta filas, jobs, caches e labels (ver inference.health)."""
+    return jsonify(inference.health(detail=request.args.get("detail") == "1")), 200
+
+
+# =========================================================
+# 10) /logs (buffer em memória do worker)
+# =========================================================
+@app.route("/logs", methods=["GET"])
+@app.route("/logs/", methods=["GET"])
+def logs():
+    """
+    Últimos registros deste worker: ?since=<seq> só os novos, ?level=WARNING,
+    ?lines=N (padrão 200 sem since) e ?follow=1 para acompanhar (NDJSON).
+    """
+    since = request.args.get("since", type=int)
+    level = request.args.get("level")
+
+    if request.args.get("follow") in ("1", "true"):
+        follower = applog.follow(since, level)
+        if follower is None:
+            return jsonify({"error": "Too many log followers on this worker"}), 503, {"Retry-After": "30"}
+        return Response(follower, mimetype="application/x-ndjson")
+
+    return jsonify(applog.read(since, level, request.args.get("lines", type=int)))
+
+
+# =========================================================
+# 11) /metrics (Prometheus, soma de todos os workers)
+# =========================================================
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+# =========================================================
+# 12) /work (warm pool de workers EF, EF_DISPATCH_MODE=pool)
+# =========================================================
+@app.route("/work/lease", methods=["POST"])
+def work_lease():
+    """Long poll do worker: {"worker", "task", "wait"} -> exame, ou 204."""
+    return _make_response(*warmpool.lease(
+        request.headers.get("Authorization"), request.get_json(silent=True) or {}
+    ))
+
+
+@app.route("/work/<lease_id>/heartbeat", methods=["POST"])
+def work_heartbeat(lease_id):
+    return _make_response(*warmpool.heartbeat(
+        request.headers.get("Authorization"), lease_id, request.get_json(silent=True) or {}
+    ))
+
+
+@app.route("/work/<lease_id>/complete", methods=["POST"])
+def work_complete(lease_id):
+    return _make_response(*warmpool.complete(
+        request.headers.get("Authorization"), lease_id, request.get_json(silent=True) or {}
+    ))
+
+
+@app.route("/work/pool", methods=["GET"])
+def work_pool():
+    return _make_response(*warmpool.status())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,250 @@
+"""
+Alvos de lançamento do RunTask (região + cluster + subnets), com pesos.
+
+Um único cluster e uma única subnet esgotam rápido em rajadas: acabam os
+IPs / ENIs da subnet e o ECS limita a taxa de RunTask. EF_LAUNCH_TARGETS
+define vários alvos, como JSON na própria variável ou o caminho de um
+arquivo JSON:
+
+    [
+      {"name": "use2-a", "region": "us-east-2", "cluster": "fe-cluster",
+       "subnets": ["subnet-0a068dd9915049166"], "weight": 2},
+      {"name": "use2-b", "region": "us-east-2", "cluster": "fe-cluster-b",
+       "subnets": ["subnet-0b...", "subnet-0c..."], "security_groups": ["sg-..."]},
+      {"name": "usw2", "region": "us-west-2", "cluster": "fe-cluster", "subnets": ["subnet-0d..."]}
+    ]
+
+region, cluster e subnets têm como padrão EF_REGION / EF_CLUSTER /
+EF_SUBNET_ID (sem a variável, um único alvo com esses valores: o
+comportamento antigo). Para desviar de uma subnet sem IPs, declare cada
+subnet como um alvo próprio.
+
+choose() sorteia um alvo proporcionalmente a weight x health, onde health
+é a média móvel da taxa de sucesso do alvo: quem começa a devolver falta
+de capacidade ou throttling recebe menos lançamentos. Cada alvo tem ainda
+o seu CircuitBreaker (resilience.py): com falhas seguidas ele sai do
+sorteio até o teste half-open. A retentativa de um RunTask vai para outro
+alvo (exclude), e os números por alvo aparecem no /health e no /metrics.
+
+Como os breakers, os números são por worker do gunicorn.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import metrics
+import resilience
+
+
+LAUNCH_TARGETS = os.getenv("EF_LAUNCH_TARGETS", "")
+
+# Peso da última chamada na média móvel de sucesso / latência
+HEALTH_ALPHA = float(os.getenv("EF_TARGET_HEALTH_ALPHA", "0.2"))
+# Mesmo um alvo ruim continua recebendo uma fração mínima (para se recuperar)
+HEALTH_FLOOR = float(os.getenv("EF_TARGET_HEALTH_FLOOR", "0.05"))
+
+TARGET_BREAKER_FAILURES = int(os.getenv("EF_TARGET_BREAKER_FAILURES", "3"))
+TARGET_BREAKER_RESET_SECONDS = float(os.getenv("EF_TARGET_BREAKER_RESET_SECONDS", "30"))
+TARGET_BREAKER_MAX_RESET_SECONDS = float(os.getenv("EF_TARGET_BREAKER_MAX_RESET_SECONDS", "300"))
+
+
+class LaunchTarget:
+
+    def __init__(self, name, region, cluster, subnets, weight=1.0, security_groups=None,
+                 assign_public_ip=True):
+        self.name = name
+        self.region = region
+        self.cluster = cluster
+        self.subnets = list(subnets)
+        self.weight = float(weight)
+        self.security_groups = list(security_groups or [])
+        self.assign_public_ip = assign_public_ip
+
+        self.breaker = resilience.CircuitBreaker(
+            f"target:{name}",
+            failure_threshold=TARGET_BREAKER_FAILURES,
+            reset_timeout=TARGET_BREAKER_RESET_SECONDS,
+            max_reset_timeout=TARGET_BREAKER_MAX_RESET_SECONDS
+        )
+
+        self._lock = threading.Lock()
+        self._health = 1.0
+        self._calls = 0
+        self._succeeded = 0
+        self._tasks = 0
+        self._failures = {}
+        self._latency_ewma = None
+        self._latency_last = 0.0
+        self._latency_total = 0.0
+
+    def place(self, task_request):
+        """task_request (sem rede) -> parâmetros completos do RunTask neste alvo."""
+        network = {
+            "subnets": self.subnets,
+            "assignPublicIp": "ENABLED" if self.assign_public_ip else "DISABLED"
+        }
+        if self.security_groups:
+            network["securityGroups"] = self.security_groups
+
+        return dict(
+            task_request,
+            region=self.region,
+            cluster=self.cluster,
+            network_configuration={"awsvpcConfiguration": network}
+        )
+
+    @property
+    def health(self):
+        return self._health
+
+    def effective_weight(self):
+        return self.weight * max(HEALTH_FLOOR, self._health)
+
+    def _observe(self, ok, seconds):
+        # Chamado com o lock; ok=None não mexe na saúde
+        self._calls += 1
+        if ok is not None:
+            self._health += HEALTH_ALPHA * ((1.0 if ok else 0.0) - self._health)
+        self._latency_last = seconds
+        self._latency_total += seconds
+        self._latency_ewma = seconds if self._latency_ewma is None else (
+            self._latency_ewma + HEALTH_ALPHA * (seconds - self._latency_ewma)
+        )
+
+    def record_success(self, seconds, tasks=1):
+        self.breaker.record_success()
+        with self._lock:
+            self._observe(True, seconds)
+            self._succeeded += 1
+            self._tasks += tasks
+
+        metrics.LAUNCH_TARGET_CALLS.labels(self.name, "ok").inc()
+        metrics.LAUNCH_TARGET_LATENCY.labels(self.name).observe(seconds)
+
+    def record_failure(self, kind, seconds, error=None):
+        fatal = kind == resilience.FATAL
+        if fatal:
+            # Pedido inválido: não diz nada sobre a capacidade do alvo
+            self.breaker.release()
+        else:
+            self.breaker.record_failure(error)
+
+        with self._lock:
+            self._observe(None if fatal else False, seconds)
+            self._failures[kind] = self._failures.get(kind, 0) + 1
+
+        metrics.LAUNCH_TARGET_CALLS.labels(self.name, kind).inc()
+        metrics.LAUNCH_TARGET_LATENCY.labels(self.name).observe(seconds)
+
+    def stats(self):
+        breaker = self.breaker.stats()
+
+        with self._lock:
+            return {
+                "region": self.region,
+                "cluster": self.cluster,
+                "subnets": self.subnets,
+                "weight": self.weight,
+                "health": round(self._health, 3),
+                "calls": self._calls,
+                "succeeded": self._succeeded,
+                "success_rate": round(self._succeeded / self._calls, 4) if self._calls else None,
+                "failures": dict(self._failures),
+                "tasks_launched": self._tasks,
+                "latency_ms": {
+                    "last": round(self._latency_last * 1000, 1),
+                    "avg": round(self._latency_total / self._calls * 1000, 1) if self._calls else 0.0,
+                    "ewma": round(self._latency_ewma * 1000, 1) if self._latency_ewma is not None else 0.0
+                },
+                "breaker": breaker["state"],
+                "retry_after": breaker["retry_after"]
+            }
+
+
+class TargetPool:
+
+    def __init__(self, targets):
+        if not targets:
+            raise ValueError("at least one launch target is required")
+
+        names = [target.name for target in targets]
+        if len(set(names)) != len(names):
+            raise ValueError(f"duplicate launch target names: {names}")
+
+        self.targets = targets
+
+    def choose(self, exclude=()):
+        """
+        Sorteia um alvo disponível (fora de exclude, se houver outro) e
+        reserva a chamada no breaker dele. Levanta resilience.BreakerOpen
+        quando todos estão com o circuito aberto.
+        """
+        candidates = [target for target in self.targets if target.breaker.retry_after() == 0]
+        preferred = [target for target in candidates if target.name not in exclude]
+        candidates = preferred or candidates
+
+        while candidates:
+            weights = [target.effective_weight() for target in candidates]
+            target = random.choices(candidates, weights=weights)[0]
+
+            try:
+                target.breaker.allow()
+            except resilience.BreakerOpen:
+                # Half-open com o teste já em andamento em outra thread
+                candidates.remove(target)
+                continue
+
+            return target
+
+        raise resilience.BreakerOpen("launch targets", self.retry_after() or 1.0)
+
+    def retry_after(self):
+        """Segundos até algum alvo aceitar chamadas (0 se algum já aceita)."""
+        return min(target.breaker.retry_after() for target in self.targets)
+
+    def stats(self):
+        return {target.name: target.stats() for target in self.targets}
+
+
+def _load_config(value):
+    value = value.strip()
+    if not value:
+        return None
+    if value.startswith("["):
+        return json.loads(value)
+
+    with open(value) as f:
+        return json.load(f)
+
+
+def load_targets(value=LAUNCH_TARGETS, region=None, cluster=None, subnet=None):
+    """TargetPool de EF_LAUNCH_TARGETS; region / cluster / subnet são os padrões."""
+    config = _load_config(value)
+
+    if config is None:
+        return TargetPool([LaunchTarget("default", region, cluster, [subnet])])
+
+    targets = []
+    for i, entry in enumerate(config):
+        subnets = entry.get("subnets") or ([entry["subnet"]] if entry.get("subnet") else [subnet])
+        target_region = entry.get("region", region)
+        target_cluster = entry.get("cluster", cluster)
+
+        if not all(subnets) or not target_region or not target_cluster:
+            raise ValueError(f"launch target #{i} needs region, cluster and subnets")
+        if float(entry.get("weight", 1)) <= 0:
+            raise ValueError(f"launch target #{i} needs a positive weight")
+
+        targets.append(LaunchTarget(
+            entry.get("name") or f"{target_region}/{target_cluster}/{subnets[0]}",
+            target_region,
+            target_cluster,
+            subnets,
+            weight=entry.get("weight", 1),
+            security_groups=entry.get("security_groups"),
+            assign_public_ip=entry.get("assign_public_ip", True)
+        ))
+
+    return TargetPool(targets)
@@ -0,0 +1,617 @@
+"""
+Proxy para o backend de IA (AI_BACKEND_URL).
+
+BackendClient mantém uma sessão HTTP com pool de conexões keep-alive por
+worker do gunicorn, em vez de abrir uma conexão TCP por inferência.
+
+Em modo streaming, o corpo do pedido (multipart/form-data ou raw) é
+relido em blocos de CHUNK_SIZE e reenviado ao backend como um multipart
+novo, com os campos "file", "model" e "params" que o backend já espera.
+Nada é gravado em disco e o pico de memória por pedido fica limitado ao
+tamanho do bloco, não ao tamanho do volume.
+
+A resposta 200 do backend volta do mesmo jeito (ResponseRelay), sem
+json() + jsonify: os bytes passam em blocos, comprimidos com a melhor
+codificação que o cliente aceita (zstd, se o pacote zstandard estiver
+instalado, ou gzip). O Accept-Encoding do cliente é repassado ao backend;
+se ele já devolver algo que o cliente aceita, o corpo passa sem
+descomprimir. PROXY_RESPONSE_MODE=json volta ao modo antigo.
+"""
+import os
+import threading
+import time
+import uuid
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+from werkzeug.http import parse_accept_header, parse_options_header
+from werkzeug.sansio.multipart import NEED_DATA, Data, Epilogue, Field, File, MultipartDecoder
+
+try:
+    import zstandard
+except ImportError:  # zstandard é opcional - sem ele só gzip
+    zstandard = None
+
+import metrics
+
+
+CHUNK_SIZE = int(os.getenv("PROXY_CHUNK_SIZE", str(64 * 1024)))
+
+# Campos de arquivo aceitos, na mesma ordem de preferência do modo antigo
+FILE_FIELDS = ("file", "image")
+
+# Limite para os campos de texto (cliques / scribbles dos modelos interativos);
+# acima disso o pedido volta 413
+MAX_FIELD_SIZE = int(os.getenv("PROXY_MAX_FIELD_SIZE", str(1024 * 1024)))
+
+DEFAULT_FILENAME = "upload.nii.gz"
+
+# O pool deve ter pelo menos uma conexão por thread do worker (--threads 4)
+BACKEND_POOL_MAXSIZE = int(os.getenv("BACKEND_POOL_MAXSIZE", "4"))
+BACKEND_POOL_BLOCK = os.getenv("BACKEND_POOL_BLOCK", "0") == "1"
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+BACKEND_READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "300"))
+
+# "stream": repassa a resposta do backend em blocos (ResponseRelay)
+# "json": modo antigo (response.json() -> jsonify)
+RESPONSE_MODE = os.getenv("PROXY_RESPONSE_MODE", "stream")
+
+# Respostas menores que isso (quando o tamanho é conhecido) não são comprimidas
+COMPRESS_MIN_SIZE = int(os.getenv("PROXY_COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("PROXY_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("PROXY_ZSTD_LEVEL", "3"))
+
+# Tipos que valem a pena comprimir; NIfTI (.nii.gz) e afins já vêm comprimidos
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/xml", "text/")
+
+
+# =========================================================
+# Cliente HTTP com pool (um por processo)
+# =========================================================
+class BackendClient:
+
+    def __init__(self, pool_maxsize=BACKEND_POOL_MAXSIZE, pool_block=BACKEND_POOL_BLOCK,
+                 connect_timeout=BACKEND_CONNECT_TIMEOUT, read_timeout=BACKEND_READ_TIMEOUT):
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.timeout = (connect_timeout, read_timeout)
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._adapter = None
+        self._requests = 0
+        self._in_flight = 0
+        self._max_in_flight = 0
+
+    def _get_session(self):
+        # Recriada após fork: sockets não podem ser compartilhados entre workers
+        with self._lock:
+            if self._pid != os.getpid():
+                self._adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=self.pool_block,
+                    max_retries=0
+                )
+                self._session = requests.Session()
+                self._session.mount("http://", self._adapter)
+                self._session.mount("https://", self._adapter)
+                self._pid = os.getpid()
+
+            return self._session
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        session = self._get_session()
+
+        with self._lock:
+            self._requests += 1
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+
+        start = time.perf_counter()
+        status = None
+        sent = received = 0
+
+        try:
+            response = session.post(url, **kwargs)
+            status = response.status_code
+            # stream=True: os bytes recebidos são contados pelo ResponseRelay
+            received = 0 if kwargs.get("stream") else len(response.content)
+            sent = _body_size(kwargs.get("data"), response.request.body)
+            return response
+        except requests.RequestException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            metrics.backend_request(time.perf_counter() - start, status, sent, received)
+
+    def stats(self):
+        with self._lock:
+            opened = 0
+            sent = 0
+            idle = 0
+
+            if self._adapter is not None and self._pid == os.getpid():
+                for key in list(self._adapter.poolmanager.pools.keys()):
+                    pool = self._adapter.poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    opened += pool.num_connections
+                    sent += pool.num_requests
+                    idle += pool.pool.qsize() if pool.pool else 0
+
+            return {
+                "pool_maxsize": self.pool_maxsize,
+                "timeout": {"connect": self.timeout[0], "read": self.timeout[1]},
+                "requests": self._requests,
+                "in_flight": self._in_flight,
+                "max_in_flight": self._max_in_flight,
+                "utilization": round(self._in_flight / self.pool_maxsize, 4) if self.pool_maxsize else 0.0,
+                "connections_opened": opened,
+                "connections_reused": max(0, sent - opened),
+                "idle_slots": idle
+            }
+
+
+def _body_size(data, body):
+    # Upload em streaming conta os bytes enquanto é enviado
+    if hasattr(data, "bytes_sent"):
+        return data.bytes_sent
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return 0
+
+
+backend = BackendClient()
+
+
+# =========================================================
+# Upload em streaming
+# =========================================================
+class NoFileReceived(Exception):
+    """O pedido não trouxe arquivo (nem multipart 'file'/'image', nem corpo raw)."""
+
+
+class FieldTooLarge(Exception):
+    """Um campo de texto do multipart passou de MAX_FIELD_SIZE."""
+
+
+def _header_value(value):
+    """Texto vindo do cliente sem CR/LF nem outros controles."""
+    return "".join(c for c in value if c >= " " and c != "\x7f")
+
+
+def _quote(value):
+    # RFC 7578: quoted-string com " e \ escapados, para o nome do arquivo
+    # vindo do cliente não quebrar o multipart enviado ao backend
+    return _header_value(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class _UploadParser:
+    """
+    Decodifica o corpo do pedido bloco a bloco (feed), gerando eventos
+    ("file", filename, content_type), ("data", bytes) e ("file_end",).
+    Os campos de texto vão para params. Um bloco vazio indica fim do corpo.
+    """
+
+    def __init__(self, mimetype, mimetype_params):
+        self.params = {}
+        self._mimetype = mimetype
+        self._done = False
+        self._started = False
+        self._file_seen = False
+        self._part = None
+        self._field_name = None
+        self._field_data = bytearray()
+
+        if mimetype == "multipart/form-data" and mimetype_params.get("boundary"):
+            self._decoder = MultipartDecoder(mimetype_params["boundary"].encode())
+            self._delimiter = b"--" + mimetype_params["boundary"].encode()
+        else:
+            self._decoder = None
+        self._held = b""
+
+    def feed(self, chunk):
+        if self._done:
+            return []
+
+        if self._decoder is None:
+            return self._feed_raw(chunk)
+
+        return self._feed_multipart(chunk)
+
+    def _feed_raw(self, chunk):
+        events = []
+
+        if chunk:
+            if not self._started:
+                self._started = True
+                events.append(("file", DEFAULT_FILENAME, self._mimetype or None))
+            events.append(("data", chunk))
+        else:
+            self._done = True
+            if self._started:
+                events.append(("file_end",))
+
+        return events
+
+    def _receive(self, chunk):
+        # O MultipartDecoder do Werkzeug devolve a quebra de linha do
+        # delimitador como dado quando o bloco termina logo depois de
+        # "--boundary" (ex.: "\r\n--b-"): o final do bloco a partir da
+        # primeira quebra de linha que ainda pode abrir um delimitador
+        # espera o próximo bloco
+        if not chunk:
+            self._decoder.receive_data(self._held)
+            self._decoder.receive_data(None)
+            return
+
+        data = self._held + chunk
+        window = max(0, len(data) - len(self._delimiter) - 6)
+        split = min((i for i in (data.find(b"\r", window), data.find(b"\n", window)) if i != -1), default=len(data))
+
+        self._held = data[split:]
+        self._decoder.receive_data(data[:split])
+
+    def _feed_multipart(self, chunk):
+        events = []
+        self._receive(chunk)
+
+        while True:
+            event = self._decoder.next_event()
+
+            if event is NEED_DATA:
+                if not chunk:
+                    self._done = True
+                return events
+
+            if isinstance(event, File):
+                if not self._file_seen and event.name in FILE_FIELDS:
+                    self._file_seen = True
+                    self._part = "file"
+                    events.append(("file", event.filename or DEFAULT_FILENAME, event.headers.get("Content-Type")))
+                else:
+                    self._part = None
+
+            elif isinstance(event, Field):
+                self._part = "field"
+                self._field_name = event.name
+                self._field_data.clear()
+
+            elif isinstance(event, Data):
+                if self._part == "file":
+                    if event.data:
+                        events.append(("data", event.data))
+                    if not event.more_data:
+                        self._part = None
+                        events.append(("file_end",))
+
+                elif self._part == "field":
+                    if len(self._field_data) + len(event.data) > MAX_FIELD_SIZE:
+                        self._done = True
+                        raise FieldTooLarge(f"Form field '{self._field_name}' larger than {MAX_FIELD_SIZE} bytes")
+                    self._field_data.extend(event.data)
+                    if not event.more_data:
+                        self._part = None
+                        self.params[self._field_name] = self._field_data.decode("utf-8", "replace")
+
+            elif isinstance(event, Epilogue):
+                self._done = True
+                return events
+
+
+class _UploadEncoder:
+    """Partes do multipart enviado ao backend (file, model, params)."""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.filename = None
+        self.file_content_type = None
+        self.bytes_sent = 0
+        self._boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self._boundary}"
+
+    def _part_header(self, name, filename=None, content_type=None):
+        disposition = f'form-data; name="{_quote(name)}"'
+        if filename is not None:
+            disposition += f'; filename="{_quote(filename) or DEFAULT_FILENAME}"'
+
+        header = f"--{self._boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type and content_type == _header_value(content_type):
+            header += f"Content-Type: {content_type}\r\n"
+
+        return (header + "\r\n").encode()
+
+    def _field(self, name, value):
+        return self._part_header(name) + value.encode() + b"\r\n"
+
+    def _opening(self):
+        return self._part_header("file", self.filename, self.file_content_type)
+
+    def _closing(self, params):
+        return b"".join([
+            b"\r\n",
+            self._field("model", self.model_name),
+            self._field("params", str(params)),
+            f"--{self._boundary}--\r\n".encode()
+        ])
+
+
+class StreamingUpload(_UploadEncoder):
+    """
+    Corpo de pedido para o requests (data=upload), lido sob demanda.
+
+    prepare() lê só até o início do arquivo, para poder responder 400 sem
+    abrir conexão com o backend; o resto do corpo passa direto do cliente
+    para o backend enquanto o requests itera o objeto.
+    """
+
+    def __init__(self, stream, mimetype, mimetype_params, model_name, chunk_size=CHUNK_SIZE):
+        super().__init__(model_name)
+        self.chunk_size = chunk_size
+        self._stream = stream
+        self._parser = _UploadParser(mimetype, mimetype_params)
+        self._events = self._read_events()
+
+    @property
+    def params(self):
+        return self._parser.params
+
+    @classmethod
+    def from_request(cls, request, model_name):
+        return cls(request.stream, request.mimetype, request.mimetype_params, model_name)
+
+    def _read_events(self):
+        while True:
+            chunk = self._stream.read(self.chunk_size)
+            yield from self._parser.feed(chunk)
+            if not chunk:
+                return
+
+    def prepare(self):
+        for event in self._events:
+            if event[0] == "file":
+                self.filename = event[1]
+                self.file_content_type = event[2]
+                return
+
+        raise NoFileReceived()
+
+    def drain(self):
+        """Consome o resto do corpo (ex.: para ler os params no fallback)."""
+        for _ in self._events:
+            pass
+
+    def __iter__(self):
+        yield self._opening()
+
+        for event in self._events:
+            if event[0] == "file_end":
+                break
+            if event[0] == "data":
+                self.bytes_sent += len(event[1])
+                yield event[1]
+
+        # Campos que vierem depois do arquivo ainda entram em params
+        self.drain()
+
+        yield self._closing(self.params)
+
+
+class AsyncStreamingUpload(_UploadEncoder):
+    """
+    Versão asyncio do StreamingUpload (asgi.py): lê de um iterador
+    assíncrono de blocos e é enviado com httpx (content=upload).
+    """
+
+    def __init__(self, chunks, mimetype, mimetype_params, model_name):
+        super().__init__(model_name)
+        self._chunks = chunks.__aiter__()
+        self._parser = _UploadParser(mimetype, mimetype_params)
+        self._events = self._read_events()
+
+    @property
+    def params(self):
+        return self._parser.params
+
+    async def _read_events(self):
+        while True:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                chunk = b""
+
+            for event in self._parser.feed(chunk):
+                yield event
+
+            if not chunk:
+                return
+
+    async def prepare(self):
+        async for event in self._events:
+            if event[0] == "file":
+                self.filename = event[1]
+                self.file_content_type = event[2]
+                return
+
+        raise NoFileReceived()
+
+    async def drain(self):
+        async for _ in self._events:
+            pass
+
+    async def __aiter__(self):
+        yield self._opening()
+
+        async for event in self._events:
+            if event[0] == "file_end":
+                break
+            if event[0] == "data":
+                self.bytes_sent += len(event[1])
+                yield event[1]
+
+        await self.drain()
+
+        yield self._closing(self.params)
+
+
+# =========================================================
+# Resposta em streaming
+# =========================================================
+def response_headers(accept_encoding):
+    """
+    Headers extras do POST ao backend no modo stream: o Accept-Encoding do
+    cliente, para o backend já responder em algo que passe direto.
+    """
+    if RESPONSE_MODE != "stream":
+        return {}
+    return {"Accept-Encoding": accept_encoding or "identity"}
+
+
+def _encodings():
+    # Ordem de preferência quando o cliente aceita várias com o mesmo q
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def _compressible(content_type):
+    mimetype = parse_options_header(content_type)[0].lower()
+    return mimetype.endswith("+json") or any(mimetype.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+
+def choose_encoding(accept, content_type, length=None):
+    """Codificação para comprimir aqui (zstd / gzip), ou None."""
+    if not _compressible(content_type):
+        return None
+    if length is not None and length < COMPRESS_MIN_SIZE:
+        return None
+
+    candidates = [encoding for encoding in _encodings() if accept.quality(encoding) > 0]
+    if not candidates:
+        return None
+
+    return max(candidates, key=accept.quality)
+
+
+def _compressor(encoding):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    # wbits=31: formato gzip (cabeçalho + CRC), não zlib cru
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+class _RelayPlan:
+    """
+    O que fazer com o corpo do backend, dado o Accept-Encoding do cliente:
+
+        passthrough   bytes do backend como vieram (já codificados em algo
+                      que o cliente aceita, ou não compressíveis)
+        compress      backend sem codificação; comprime aqui
+        decode        backend codificado em algo que o cliente não aceita;
+                      descomprime (e comprime de novo, se der)
+    """
+
+    def __init__(self, backend_headers, accept_encoding):
+        accept = parse_accept_header(accept_encoding)
+        content_type = backend_headers.get("Content-Type", "application/json")
+        backend_encoding = (backend_headers.get("Content-Encoding") or "identity").strip().lower()
+        length = backend_headers.get("Content-Length")
+        length = int(length) if length and length.isdigit() else None
+
+        self.headers = {"Content-Type": content_type, "Vary": "Accept-Encoding"}
+
+        if backend_encoding != "identity" and accept.quality(backend_encoding) > 0:
+            self.decode, self.encoding = False, None
+            self.mode = "passthrough"
+            self.headers["Content-Encoding"] = backend_encoding
+        else:
+            self.decode = backend_encoding != "identity"
+            # Descomprimido o tamanho final não é conhecido
+            self.encoding = choose_encoding(accept, content_type, None if self.decode else length)
+            self.mode = "decode" if self.decode else ("compress" if self.encoding else "passthrough")
+            if self.encoding:
+                self.headers["Content-Encoding"] = self.encoding
+
+        if self.mode == "passthrough" and length is not None:
+            self.headers["Content-Length"] = str(length)
+
+
+class ResponseRelay:
+    """
+    Corpo de uma resposta do requests (stream=True) repassado ao cliente
+    em blocos de CHUNK_SIZE: iterável para o Response do Flask, com os
+    headers a usar em headers. Fecha a conexão com o backend no fim (ou
+    quando o cliente desconecta).
+    """
+
+    def __init__(self, response, accept_encoding, chunk_size=CHUNK_SIZE):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.plan = _RelayPlan(response.headers, accept_encoding)
+        self.headers = self.plan.headers
+
+    def __iter__(self):
+        compressor = _compressor(self.plan.encoding) if self.plan.encoding else None
+        sent = 0
+
+        try:
+            for chunk in self.response.raw.stream(self.chunk_size, decode_content=self.plan.decode):
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    sent += len(chunk)
+                    yield chunk
+
+            if compressor is not None:
+                chunk = compressor.flush()
+                sent += len(chunk)
+                yield chunk
+        finally:
+            self.response.close()
+            # tell(): bytes lidos do socket, antes de descomprimir
+            metrics.proxy_response(
+                self.plan.mode, self.plan.encoding or self.headers.get("Content-Encoding", "identity"),
+                self.response.raw.tell(), sent
+            )
+
+
+class AsyncResponseRelay:
+    """Versão asyncio do ResponseRelay, para respostas do httpx (stream=True)."""
+
+    def __init__(self, response, accept_encoding, chunk_size=CHUNK_SIZE):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.plan = _RelayPlan(response.headers, accept_encoding)
+        self.headers = self.plan.headers
+
+    async def __aiter__(self):
+        compressor = _compressor(self.plan.encoding) if self.plan.encoding else None
+        sent = 0
+
+        if self.plan.decode:
+            chunks = self.response.aiter_bytes(self.chunk_size)
+        else:
+            chunks = self.response.aiter_raw(self.chunk_size)
+
+        try:
+            async for chunk in chunks:
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    sent += len(chunk)
+                    yield chunk
+
+            if compressor is not None:
+                chunk = compressor.flush()
+                sent += len(chunk)
+                yield chunk
+        finally:
+            await self.response.aclose()
+            metrics.proxy_response(
+                self.plan.mode, self.plan.encoding or self.headers.get("Content-Encoding", "identity"),
+                self.response.num_bytes_downloaded, sent
+            )
@@ -0,0 +1,198 @@
+"""
+Registro de modelos carregado de um arquivo JSON de configuração.
+
+Cada carga gera um Registry imutável, indexado por nome, tipo e label,
+com as respostas de /info já serializadas (http_cache). HotRegistry
+confere o mtime do arquivo no máximo uma vez por RELOAD_INTERVAL e troca
+a referência atomicamente quando ele muda: cada worker do gunicorn
+recarrega sozinho, sem restart e sem derrubar inferências em andamento.
+
+Formato:
+
+    {
+      "name": "...", "version": "...", "description": "...",
+      "labels": [...],                      # opcional (senão: união dos labels)
+      "models": {
+        "<nome>": {
+          "type": "segmentation", "labels": {"heart": 1}, "dimension": 3,
+          "description": "...",             # opcional
+          "model_state": "READY",           # só em /info/model/<nome>
+          "dispatch": "ecs",                # não publicado
+          "series": "short_axis",           # não publicado (series.MATCHERS)
+          "target": "http://..."            # não publicado
+        }
+      }
+    }
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+
+import applog
+import http_cache
+
+
+log = applog.get_logger(__name__)
+
+RELOAD_INTERVAL = float(os.getenv("MODEL_REGISTRY_RELOAD_INTERVAL", "1"))
+
+# Campos de configuração interna, fora das respostas de /info
+PRIVATE_FIELDS = ("model_state", "dispatch", "series", "target")
+
+
+class RegistryError(Exception):
+    """Arquivo de modelos inválido."""
+
+
+class Registry:
+
+    def __init__(self, config, version):
+        if not isinstance(config, dict):
+            raise RegistryError("top level must be an object")
+
+        models = config.get("models")
+        if not isinstance(models, dict) or not models:
+            raise RegistryError("'models' must be a non-empty object")
+
+        if not isinstance(config.get("labels") or [], list):
+            raise RegistryError("'labels' must be a list")
+
+        for name, model in models.items():
+            if not isinstance(model, dict):
+                raise RegistryError(f"model '{name}' must be an object")
+            for field in ("type", "labels", "dimension"):
+                if field not in model:
+                    raise RegistryError(f"model '{name}' is missing '{field}'")
+            if not isinstance(model["type"], str):
+                raise RegistryError(f"model '{name}': 'type' must be a string")
+            if not isinstance(model["labels"], dict):
+                raise RegistryError(f"model '{name}': 'labels' must be an object")
+
+        self.version = version
+        self.names = tuple(models)
+
+        by_type = {}
+        by_label = {}
+        for name, model in models.items():
+            by_type.setdefault(model["type"], []).append(name)
+            for label in model["labels"]:
+                by_label.setdefault(label, []).append(name)
+
+        self._models = MappingProxyType({
+            name: MappingProxyType(dict(model, labels=MappingProxyType(dict(model["labels"]))))
+            for name, model in models.items()
+        })
+        self.by_type = MappingProxyType({key: tuple(value) for key, value in by_type.items()})
+        self.by_label = MappingProxyType({key: tuple(value) for key, value in by_label.items()})
+
+        labels = config.get("labels") or list(by_label)
+        info = {
+            "name": config.get("name", "MONAILabel"),
+            "version": config.get("version", ""),
+            "description": config.get("description", ""),
+            "labels": labels,
+            "models": {
+                name: {k: v for k, v in model.items() if k not in PRIVATE_FIELDS}
+                for name, model in models.items()
+            }
+        }
+
+        self.rendered_info = http_cache.PrecomputedJSON(info)
+        self.rendered_models = http_cache.PrecomputedJSON(list(self.names))
+        self.rendered_model = MappingProxyType({
+            name: http_cache.PrecomputedJSON(self._model_document(model))
+            for name, model in models.items()
+        })
+
+    @staticmethod
+    def _model_document(model):
+        document = {k: v for k, v in model.items() if k not in PRIVATE_FIELDS}
+        document["model_state"] = model.get("model_state", "READY")
+        return document
+
+    def __contains__(self, name):
+        return name in self._models
+
+    def get(self, name):
+        return self._models.get(name)
+
+    def labels(self, name):
+        model = self._models.get(name)
+        return dict(model["labels"]) if model else {}
+
+    def names_by_type(self, model_type):
+        return self.by_type.get(model_type, ())
+
+    def names_by_label(self, label):
+        return self.by_label.get(label, ())
+
+
+def load(path):
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    try:
+        config = json.loads(raw)
+    except ValueError as e:
+        raise RegistryError(f"{path}: {e}")
+
+    try:
+        return Registry(config, hashlib.sha1(raw).hexdigest()[:12])
+    except RegistryError as e:
+        raise RegistryError(f"{path}: {e}")
+    except Exception as e:
+        # Formato que a validação não previu: nunca derruba o request
+        raise RegistryError(f"{path}: {e.__class__.__name__}: {e}")
+
+
+class HotRegistry:
+
+    def __init__(self, path, reload_interval=RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._stat = self._file_stat()
+        self._checked_at = time.monotonic()
+        self._current = load(path)
+        self.reloads = 0
+
+    def _file_stat(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def current(self):
+        now = time.monotonic()
+
+        if now - self._checked_at >= self.reload_interval and self._lock.acquire(blocking=False):
+            try:
+                self._checked_at = now
+                self._maybe_reload()
+            finally:
+                self._lock.release()
+
+        return self._current
+
+    def _maybe_reload(self):
+        try:
+            stat = self._file_stat()
+        except OSError as e:
+            log.error("Model registry unavailable, keeping previous version", extra={"error": str(e)})
+            return
+
+        if stat == self._stat:
+            return
+
+        try:
+            registry = load(self.path)
+        except (OSError, RegistryError) as e:
+            # Provavelmente um arquivo no meio da escrita: tenta de novo depois
+            log.error("Invalid model registry, keeping previous version", extra={"error": str(e)})
+            return
+
+        self._current = registry
+        self._stat = stat
+        self.reloads += 1
+        log.info("Model registry reloaded", extra={"version": registry.version, "models": list(registry.names)})
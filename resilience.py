@@ -0,0 +1,241 @@
+"""
+Retentativas e circuit breaker para as chamadas ao ECS.
+
+classify() separa as falhas do RunTask em:
+
+    THROTTLED   o ECS limitou a taxa (ThrottlingException...)
+    CAPACITY    faltou capacidade Fargate / recursos no cluster
+    TRANSIENT   timeout, erro 5xx, conexão perdida
+    FATAL       validação, permissão, cluster inexistente: repetir não
+                adianta, o job falha na hora
+
+As três primeiras são repetidas com backoff exponencial e jitter
+(backoff()). O CircuitBreaker conta falhas repetíveis seguidas: passando
+de failure_threshold ele abre e corta os disparos (e os /infer novos) por
+reset_timeout segundos, em vez de todo mundo continuar martelando um ECS
+que já está limitando. Depois disso deixa passar uma única chamada de
+teste (half-open): sucesso fecha o circuito, falha reabre com o dobro do
+tempo (até max_reset_timeout).
+
+O estado do breaker é por worker do gunicorn e aparece no /health e no
+/metrics (monai_mock_breaker_state).
+"""
+import random
+import re
+import threading
+import time
+
+import applog
+import metrics
+
+
+log = applog.get_logger(__name__)
+
+THROTTLED = "throttled"
+CAPACITY = "capacity"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+RETRYABLE = (THROTTLED, CAPACITY, TRANSIENT)
+
+THROTTLING_CODES = {
+    "ThrottlingException", "Throttling", "RequestLimitExceeded", "TooManyRequestsException",
+    "RequestThrottled", "RequestThrottledException", "SlowDown"
+}
+TRANSIENT_CODES = {
+    "ServerException", "ServiceUnavailable", "ServiceUnavailableException", "InternalFailure",
+    "InternalError", "Timeout", "RequestTimeout", "RequestTimeoutException",
+    "ConnectTimeoutError", "ReadTimeoutError", "EndpointConnectionError", "ConnectionClosedError"
+}
+# Trechos do "reason" das failures do RunTask
+CAPACITY_REASONS = ("capacity is unavailable", "resource:", "insufficient")
+
+# aws CLI: "An error occurred (ThrottlingException) when calling the RunTask operation: ..."
+CLI_ERROR_CODE = re.compile(r"An error occurred \((\w+)\)")
+
+
+def classify_failure_reason(reason):
+    """reason de uma failure da resposta do RunTask."""
+    text = (reason or "").lower()
+
+    if any(marker in text for marker in CAPACITY_REASONS):
+        return CAPACITY
+    if "throttl" in text or "rate exceeded" in text:
+        return THROTTLED
+    return FATAL
+
+
+def classify(error):
+    """Classe de uma exceção levantada pelo launcher (ecs.LaunchError ou outra)."""
+    code = getattr(error, "code", None)
+    message = str(error)
+
+    if not isinstance(code, str):
+        # aws CLI: o código vem só no stderr
+        match = CLI_ERROR_CODE.search(message)
+        code = match.group(1) if match else None
+
+    if code in THROTTLING_CODES:
+        return THROTTLED
+    if code in TRANSIENT_CODES:
+        return TRANSIENT
+
+    lowered = message.lower()
+    if "capacity is unavailable" in lowered:
+        return CAPACITY
+    if "rate exceeded" in lowered or "throttl" in lowered:
+        return THROTTLED
+    if code is None and ("could not connect" in lowered or "timed out" in lowered):
+        return TRANSIENT
+
+    return FATAL
+
+
+def backoff(attempt, base, cap):
+    """Full jitter: uniforme em [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RetryLater(Exception):
+    """Falha repetível que esgotou as tentativas imediatas; tentar de novo em delay segundos."""
+
+    def __init__(self, message, delay, kind):
+        super().__init__(message)
+        self.delay = delay
+        self.kind = kind
+
+
+# =========================================================
+# Circuit breaker
+# =========================================================
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class BreakerOpen(Exception):
+    """Circuito aberto: a chamada nem foi feita."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"circuit '{name}' is open, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=300.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._open_for = reset_timeout
+        self._probing = False
+
+        self._opens = 0
+        self._rejected = 0
+        self._last_error = None
+
+        metrics.BREAKER_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    def _transition(self, state):
+        # Chamado com o lock
+        if state == self._state:
+            return
+
+        log.warning("Circuit breaker state changed", extra={
+            "breaker": self.name, "from": self._state, "to": state,
+            "open_for": round(self._open_for, 1), "last_error": self._last_error
+        })
+        self._state = state
+        metrics.BREAKER_STATE.labels(self.name).set(STATE_VALUES[state])
+        metrics.BREAKER_TRANSITIONS.labels(self.name, state).inc()
+
+    def _refresh(self, now):
+        if self._state == OPEN and now - self._opened_at >= self._open_for:
+            self._transition(HALF_OPEN)
+            self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def retry_after(self):
+        """Segundos até o circuito aceitar uma chamada de teste (0 se fechado)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            if self._state == OPEN:
+                return max(0.0, self._open_for - (now - self._opened_at))
+            return 0.0
+
+    def allow(self):
+        """Reserva uma chamada ou levanta BreakerOpen (no half-open, só uma por vez)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                log.info("Circuit breaker probe", extra={"breaker": self.name})
+                return
+
+            self._rejected += 1
+            retry_after = max(0.0, self._open_for - (now - self._opened_at)) if self._state == OPEN else 1.0
+
+        metrics.BREAKER_REJECTED.labels(self.name).inc()
+        raise BreakerOpen(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._open_for = self.reset_timeout
+            self._transition(CLOSED)
+
+    def record_failure(self, error=None):
+        """Só para falhas do ECS (repetíveis); erros de validação não contam."""
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error)[:200] if error is not None else None
+
+            if self._state == HALF_OPEN:
+                # O teste falhou: volta a abrir, por mais tempo
+                self._open_for = min(self.max_reset_timeout, self._open_for * 2)
+            elif self._state != CLOSED or self._failures < self.failure_threshold:
+                return
+
+            self._probing = False
+            self._opened_at = time.monotonic()
+            self._opens += 1
+            self._transition(OPEN)
+
+    def release(self):
+        """Devolve uma reserva de teste que não chegou a chamar o ECS."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "retry_after": round(max(0.0, self._open_for - (now - self._opened_at)), 1) if self._state == OPEN else 0.0,
+                "opens": self._opens,
+                "rejected": self._rejected,
+                "last_error": self._last_error
+            }
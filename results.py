@@ -0,0 +1,160 @@
+"""
+Cache de resultados de análises concluídas.
+
+Chave: modelo + scan (project/subject/experiment/scan) + versão da task
+definition, para que uma nova versão do modelo não sirva resultado antigo.
+
+Os resultados ficam no store compartilhado (state.py), com o corpo JSON
+já serializado e o ETag prontos: todos os workers do gunicorn veem o mesmo
+cache, uma invalidação vale para todos e nada precisa ser reaquecido por
+worker. Com o backend SQLite (em disco) o cache também sobrevive a
+restarts.
+
+Despejo por TTL (EF_RESULT_TTL) e por LRU: cada put confere o total do
+cache e, acima de EF_RESULT_CACHE_SIZE entradas ou EF_RESULT_CACHE_BYTES
+bytes de corpo, apaga as entradas usadas há mais tempo. O "último uso" é
+regravado no máximo a cada TOUCH_INTERVAL por entrada, para um hit não
+virar uma escrita no store.
+
+O LRU em memória por worker e o arquivo por chave em EF_RESULT_CACHE_DIR
+saíram: o LRU servia resultado invalidado por outro worker até conferir o
+disco, e o disco só valia para um host. EF_RESULT_CACHE_DIR é ignorada
+(com aviso no log) e o diretório antigo pode ser apagado.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import applog
+import metrics
+import state
+
+
+log = applog.get_logger(__name__)
+
+RESULT_TTL = float(os.getenv("EF_RESULT_TTL", str(7 * 86400)))
+RESULT_CACHE_SIZE = int(os.getenv("EF_RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_BYTES = int(os.getenv("EF_RESULT_CACHE_BYTES", str(64 * 1024 ** 2)))
+
+# Intervalo mínimo entre regravações do último uso de uma entrada
+TOUCH_INTERVAL = 60.0
+
+# Configuração do antigo nível em disco, substituído pelo store
+OBSOLETE_SETTINGS = ("EF_RESULT_CACHE_DIR",)
+
+KEY_PREFIX = "result:"
+
+
+def result_key(model_name, project, subject, experiment, scan, task_definition):
+    return f"{model_name}/{project}/{subject}/{experiment}/{scan}@{task_definition}"
+
+
+def make_etag(body):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _warn_obsolete_settings():
+    for name in OBSOLETE_SETTINGS:
+        if os.getenv(name):
+            log.warning("Setting ignored, results live in the shared state store", extra={
+                "setting": name, "state_backend": state.store.backend
+            })
+
+
+_warn_obsolete_settings()
+
+
+class ResultCache:
+
+    def __init__(self, ttl=RESULT_TTL, max_size=RESULT_CACHE_SIZE, max_bytes=RESULT_CACHE_BYTES, backend=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.backend = backend or state.store
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+
+    def get(self, key):
+        """Retorna (body, etag) ou None."""
+        value = self.backend.get(KEY_PREFIX + key)
+        hit = value is not None
+
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+        metrics.cache_lookup("results", hit)
+
+        if not hit:
+            return None
+
+        entry = json.loads(value)
+        now = time.time()
+        if now - entry.get("used_at", 0) > TOUCH_INTERVAL and entry.get("expires_at", 0) > now:
+            entry["used_at"] = now
+            self.backend.set(KEY_PREFIX + key, json.dumps(entry), ttl=entry["expires_at"] - now)
+
+        return entry["body"].encode(), entry["etag"]
+
+    def put(self, key, document):
+        body = json.dumps(document, separators=(",", ":"), sort_keys=True).encode()
+        etag = make_etag(body)
+        now = time.time()
+
+        entry = {"body": body.decode(), "etag": etag, "used_at": now, "expires_at": now + self.ttl}
+        self.backend.set(KEY_PREFIX + key, json.dumps(entry), ttl=self.ttl)
+
+        # Um put por job concluído: a varredura não fica no caminho dos hits
+        self.evict()
+        return body, etag
+
+    def evict(self):
+        """Apaga as entradas menos usadas até caber nos limites; retorna quantas."""
+        entries, total = [], 0
+        for name, value in self.backend.scan(KEY_PREFIX):
+            entry = json.loads(value)
+            size = len(entry["body"])
+            entries.append((entry.get("used_at", 0), name, size))
+            total += size
+
+        if len(entries) <= self.max_size and total <= self.max_bytes:
+            return 0
+
+        entries.sort()
+        victims = []
+        for used_at, name, size in entries:
+            if len(entries) - len(victims) <= self.max_size and total <= self.max_bytes:
+                break
+            victims.append(name)
+            total -= size
+
+        removed = self.backend.delete(*victims)
+        with self._lock:
+            self._evicted += removed
+        log.info("Result cache entries evicted", extra={"evicted": removed})
+        return removed
+
+    def invalidate(self, prefix=""):
+        """Remove todas as chaves que começam com prefix; retorna quantas."""
+        return self.backend.delete_prefix(KEY_PREFIX + prefix)
+
+    def stats(self):
+        with self._lock:
+            hits, misses, evicted = self._hits, self._misses, self._evicted
+
+        lookups = hits + misses
+        return {
+            "ttl_seconds": self.ttl,
+            "entries": self.backend.count(KEY_PREFIX),
+            "max_entries": self.max_size,
+            "max_bytes": self.max_bytes,
+            "evicted": evicted,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0
+        }
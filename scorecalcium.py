@@ -6,25 +6,11 @@ import json
 import subprocess
 import datetime
 
+import series
 
 
-desired_descriptions = [
-    "CINE EC 2",
-    "rEIXO_CURTO",
-    "SHORT_AXIS",
-    "SHORT AXIS",
-    "SA CINE",
-    "CINE SA",
-    "CINE_SHORT_AXIS",
-    "CINE SA 2",
-    "EIXO_CURTO",
-    "EIXO_CURTO_CINE",
-    "EC EIXO_CURTO",
-    "R_EIXO_CURTO",
-    "R EIXO CURTO",
-    "SX CINE SA",
-    "CINE EC SHORT AXIS"
-]
+
+desired_descriptions = series.SHORT_AXIS_DESCRIPTIONS
 
 
 
@@ -0,0 +1,138 @@
+"""
+Seleção de séries de eixo curto (cine short-axis) para o EF.
+
+As descrições vêm de vários fabricantes e protocolos ("CINE_SA", "cine sa",
+"rEIXO_CURTO", "Eixo Curto Cine"...). Todas são normalizadas (maiúsculas,
+sem acentos, separadores viram espaço) e comparadas com os padrões de
+SHORT_AXIS_DESCRIPTIONS compilados em uma única regex. Ranking:
+
+    0 - descrição igual a um padrão
+    1 - padrão aparece como palavra dentro da descrição
+    2 - fallback: tokens de eixo curto + tokens de cine
+
+Dentro do mesmo rank ganha o padrão que aparece antes na lista.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+
+SHORT_AXIS_DESCRIPTIONS = [
+    "CINE EC 2",
+    "rEIXO_CURTO",
+    "SHORT_AXIS",
+    "SHORT AXIS",
+    "SA CINE",
+    "CINE SA",
+    "CINE_SHORT_AXIS",
+    "CINE SA 2",
+    "EIXO_CURTO",
+    "EIXO_CURTO_CINE",
+    "EC EIXO_CURTO",
+    "R_EIXO_CURTO",
+    "R EIXO CURTO",
+    "SX CINE SA",
+    "CINE EC SHORT AXIS"
+]
+
+# Séries que nunca são cine de eixo curto, mesmo citando "SA" / "EIXO CURTO"
+EXCLUDED_TOKENS = {
+    "LOC", "LOCALIZER", "SCOUT", "SURVEY", "LGE", "PSIR", "DE", "DELAYED",
+    "PERF", "PERFUSION", "MOLLI", "SHMOLLI", "MAP", "MAPPING", "T1", "T2",
+    "T2STAR", "TAG", "TAGGING", "FLOW", "PC"
+}
+
+SHORT_AXIS_TOKENS = ({"SA"}, {"SAX"}, {"EC"}, {"EIXO", "CURTO"}, {"SHORT", "AXIS"})
+CINE_TOKENS = {"CINE", "SSFP", "FIESTA", "TRUEFISP", "BTFE", "TFE"}
+
+RANK_EXACT = 0
+RANK_CONTAINS = 1
+RANK_FALLBACK = 2
+
+_SEPARATORS = re.compile(r"[^A-Z0-9]+")
+
+
+@lru_cache(maxsize=4096)
+def normalize(description):
+    text = unicodedata.normalize("NFKD", description or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).upper()
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=16)
+def _compile(patterns):
+    """(prioridade por padrão, regex) de uma tupla de padrões normalizados."""
+    priority = {pattern: i for i, pattern in enumerate(patterns)}
+
+    # Alternância única, do padrão mais longo ao mais curto, com
+    # fronteira de palavra: "CINE SA" não casa dentro de "CINE SAG"
+    alternatives = sorted(patterns, key=len, reverse=True)
+    regex = re.compile(
+        r"(?<![A-Z0-9])(?:" + "|".join(re.escape(p) for p in alternatives) + r")(?![A-Z0-9])"
+    )
+    return priority, regex
+
+
+@lru_cache(maxsize=4096)
+def classify(patterns, description):
+    """Retorna (rank, prioridade) ou None se não for eixo curto."""
+    normalized = normalize(description)
+    if not normalized:
+        return None
+
+    priority, regex = _compile(patterns)
+    if normalized in priority:
+        return (RANK_EXACT, priority[normalized])
+
+    tokens = set(normalized.split())
+    if tokens & EXCLUDED_TOKENS:
+        return None
+
+    matches = [priority[m.group(0)] for m in regex.finditer(normalized)]
+    if matches:
+        return (RANK_CONTAINS, min(matches))
+
+    if tokens & CINE_TOKENS and any(group <= tokens for group in SHORT_AXIS_TOKENS):
+        return (RANK_FALLBACK, len(patterns))
+
+    return None
+
+
+class SeriesMatcher:
+
+    def __init__(self, patterns=SHORT_AXIS_DESCRIPTIONS):
+        # Normalizados e sem repetição, na ordem de prioridade
+        self.patterns = tuple(dict.fromkeys(normalize(pattern) for pattern in patterns))
+
+    def classify(self, description):
+        # Cache no nível do módulo (por tupla de padrões), não no método:
+        # lru_cache em método guarda self junto com cada chave
+        return classify(self.patterns, description)
+
+    def rank_scans(self, scans):
+        """
+        Classifica todas as séries de um experimento de uma vez.
+        scans: dicts do XNAT (ID, series_description, type).
+        Retorna só as de eixo curto, da melhor para a pior.
+        """
+        ranked = []
+
+        for position, scan in enumerate(scans):
+            score = self.classify(scan.get("series_description") or scan.get("type") or "")
+            if score is not None:
+                ranked.append((score, position, scan))
+
+        ranked.sort(key=lambda item: (item[0], item[1]))
+        return [scan for _, _, scan in ranked]
+
+    def best_scan(self, scans):
+        ranked = self.rank_scans(scans)
+        return ranked[0] if ranked else None
+
+
+short_axis = SeriesMatcher()
+
+# Valor de "series" no models.json -> classificador usado no /infer
+MATCHERS = {
+    "short_axis": short_axis
+}
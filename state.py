@@ -0,0 +1,442 @@
+"""
+Estado compartilhado entre os workers do gunicorn (e entre servidores).
+
+Jobs, chaves de deduplicação e resultados em cache ficam em um store
+chave -> valor (texto, normalmente JSON) com TTL opcional, em vez da
+memória de cada worker: um GET /jobs/<id> ou uma retentativa que cai em
+outro worker enxerga o mesmo estado.
+
+EF_STATE_URL escolhe o backend:
+
+    sqlite:///tmp/monai-mock-state.sqlite3   (padrão) arquivo local em WAL,
+                                             bom para um único host
+    redis://[:senha@]host:6379/0             qualquer servidor que fale o
+                                             protocolo do Redis (RESP)
+
+O cliente Redis é mínimo (só os comandos usados aqui, sem dependência
+extra); fake_redis.py sobe um servidor compatível local para testes.
+
+Operações:
+
+    get(key) / set(key, value, ttl)     leitura e escrita simples
+    add(key, value, ttl) -> bool        grava só se a chave não existe
+                                        (ou expirou): "claim" atômico;
+                                        value deve ser único por chamada
+    delete(*keys) / delete_prefix(p)    remoção
+    scan(prefix) / count(prefix)        varredura ordenada por chave
+"""
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+import applog
+
+
+log = applog.get_logger(__name__)
+
+STATE_URL = os.getenv(
+    "EF_STATE_URL",
+    "sqlite://" + os.path.join(tempfile.gettempdir(), "monai-mock-state.sqlite3")
+)
+STATE_TIMEOUT = float(os.getenv("EF_STATE_TIMEOUT", "5"))
+
+# Prefixo de todas as chaves no Redis (o servidor pode ser compartilhado)
+STATE_NAMESPACE = os.getenv("EF_STATE_NAMESPACE", "monai-mock:")
+
+# Intervalo mínimo entre limpezas de chaves expiradas no SQLite
+PURGE_INTERVAL = 60.0
+
+# Chaves por SCAN / MGET / DEL no Redis
+REDIS_BATCH = 500
+
+
+class StateError(Exception):
+    """Falha no backend de estado compartilhado."""
+
+
+class ReplyLost(StateError):
+    """O comando foi enviado mas a resposta não chegou: pode ter sido aplicado."""
+
+
+def _prefix_end(prefix):
+    # Menor string maior que todas as que começam com prefix
+    if not prefix:
+        return chr(0x10FFFF)
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+# =========================================================
+# SQLite (WAL)
+# =========================================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at) WHERE expires_at IS NOT NULL;
+"""
+
+
+class SqliteStore:
+    """Arquivo SQLite em WAL: leituras não bloqueiam escritas de outros workers."""
+
+    backend = "sqlite"
+
+    def __init__(self, path, timeout=STATE_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = None
+        self._purged_at = time.monotonic()
+        self._reads = 0
+        self._writes = 0
+
+    def _connection(self):
+        # Uma conexão por thread; recriadas depois do fork do gunicorn
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._local = threading.local()
+                    self._pid = os.getpid()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+
+        return conn
+
+    def _execute(self, sql, params=(), write=False):
+        try:
+            cursor = self._connection().execute(sql, params)
+        except sqlite3.Error as e:
+            raise StateError(str(e))
+
+        with self._lock:
+            if write:
+                self._writes += 1
+            else:
+                self._reads += 1
+            purge = write and time.monotonic() - self._purged_at > PURGE_INTERVAL
+            if purge:
+                self._purged_at = time.monotonic()
+
+        if purge:
+            self.purge()
+
+        return cursor
+
+    @staticmethod
+    def _expires_at(ttl):
+        return time.time() + ttl if ttl else None
+
+    def get(self, key):
+        row = self._execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row[0]
+
+    def set(self, key, value, ttl=None):
+        self._execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, self._expires_at(ttl)), write=True
+        )
+
+    def add(self, key, value, ttl=None):
+        cursor = self._execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?",
+            (key, value, self._expires_at(ttl), time.time()), write=True
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            removed += self._execute("DELETE FROM kv WHERE key = ?", (key,), write=True).rowcount
+        return removed
+
+    def delete_prefix(self, prefix):
+        return self._execute(
+            "DELETE FROM kv WHERE key >= ? AND key < ?", (prefix, _prefix_end(prefix)), write=True
+        ).rowcount
+
+    def scan(self, prefix):
+        """[(key, value)] das chaves válidas que começam com prefix."""
+        return self._execute(
+            "SELECT key, value FROM kv WHERE key >= ? AND key < ? "
+            "AND (expires_at IS NULL OR expires_at > ?) ORDER BY key",
+            (prefix, _prefix_end(prefix), time.time())
+        ).fetchall()
+
+    def count(self, prefix):
+        (total,) = self._execute(
+            "SELECT COUNT(*) FROM kv WHERE key >= ? AND key < ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, _prefix_end(prefix), time.time())
+        ).fetchone()
+        return total
+
+    def purge(self):
+        removed = self._connection().execute(
+            "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        ).rowcount
+        if removed:
+            log.debug("Expired state keys purged", extra={"removed": removed})
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend, "path": self.path, "reads": self._reads, "writes": self._writes}
+
+
+# =========================================================
+# Redis (RESP)
+# =========================================================
+def _encode_command(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def _glob_escape(text):
+    return "".join("\\" + c if c in "*?[]\\" else c for c in text)
+
+
+class RespConnection:
+    """Uma conexão TCP com o servidor; um comando por vez."""
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def call(self, *args):
+        self.sock.sendall(_encode_command(args))
+        return self._read()
+
+    def _read(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("State server closed the connection")
+
+        kind, payload = line[:1], line[1:-2]
+
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise StateError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            data = self.reader.read(size + 2)
+            if len(data) != size + 2:
+                raise ConnectionError("State server closed the connection")
+            return data[:-2].decode()
+        if kind == b"*":
+            size = int(payload)
+            return None if size < 0 else [self._read() for _ in range(size)]
+
+        raise StateError(f"Unexpected reply from state server: {line[:40]!r}")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisStore:
+
+    backend = "redis"
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None,
+                 timeout=STATE_TIMEOUT, namespace=STATE_NAMESPACE):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.namespace = namespace
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = None
+        self._connects = 0
+        self._reads = 0
+        self._writes = 0
+
+    def _connect(self):
+        conn = RespConnection(self.host, self.port, self.timeout)
+        try:
+            if self.password:
+                conn.call("AUTH", self.password)
+            if self.db:
+                conn.call("SELECT", self.db)
+        except BaseException:
+            conn.close()
+            raise
+
+        with self._lock:
+            self._connects += 1
+        return conn
+
+    def _call(self, *args, write=False, idempotent=True):
+        """
+        Envia um comando. Com a conexão caída, reconecta e repete uma vez,
+        mas só se o comando for idempotente (leituras, SET, DEL): um SET NX
+        que foi aplicado e perdeu a resposta voltaria nil na repetição.
+        """
+        # Uma conexão por thread; sockets não atravessam o fork do gunicorn
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._local = threading.local()
+                    self._pid = os.getpid()
+
+        with self._lock:
+            if write:
+                self._writes += 1
+            else:
+                self._reads += 1
+
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            sent = False
+
+            try:
+                if conn is None:
+                    conn = self._local.conn = self._connect()
+                sent = True
+                return conn.call(*args)
+            except (OSError, ConnectionError) as e:
+                # Conexão velha (servidor reiniciou): uma nova tentativa
+                if conn is not None:
+                    conn.close()
+                self._local.conn = None
+                if sent and not idempotent:
+                    raise ReplyLost(f"No reply from state server {self.host}:{self.port} to {args[0]}: {e}")
+                if attempt == 1:
+                    raise StateError(f"State server {self.host}:{self.port} unavailable: {e}")
+
+    def _key(self, key):
+        return self.namespace + key
+
+    def get(self, key):
+        return self._call("GET", self._key(key))
+
+    def set(self, key, value, ttl=None):
+        args = ["SET", self._key(key), value]
+        if ttl:
+            args += ["PX", max(1, int(ttl * 1000))]
+        self._call(*args, write=True)
+
+    def add(self, key, value, ttl=None):
+        args = ["SET", self._key(key), value, "NX"]
+        if ttl:
+            args += ["PX", max(1, int(ttl * 1000))]
+
+        try:
+            return self._call(*args, write=True, idempotent=False) == "OK"
+        except ReplyLost as e:
+            # O valor é único por chamada: se é o que está lá, o claim é nosso
+            owned = self.get(key) == value
+            log.warning("State add reply lost", extra={"key": key, "owned": owned, "error": str(e)})
+            return owned
+
+    def delete(self, *keys):
+        if not keys:
+            return 0
+        return self._call("DEL", *(self._key(key) for key in keys), write=True)
+
+    def _scan_keys(self, prefix):
+        pattern = _glob_escape(self._key(prefix)) + "*"
+        cursor, keys = "0", set()
+
+        while True:
+            cursor, batch = self._call("SCAN", cursor, "MATCH", pattern, "COUNT", REDIS_BATCH)
+            keys.update(batch)
+            if cursor == "0":
+                return sorted(keys)
+
+    def delete_prefix(self, prefix):
+        keys = self._scan_keys(prefix)
+        removed = 0
+        for i in range(0, len(keys), REDIS_BATCH):
+            removed += self._call("DEL", *keys[i:i + REDIS_BATCH], write=True)
+        return removed
+
+    def scan(self, prefix):
+        keys = self._scan_keys(prefix)
+        skip = len(self.namespace)
+        items = []
+
+        for i in range(0, len(keys), REDIS_BATCH):
+            chunk = keys[i:i + REDIS_BATCH]
+            for key, value in zip(chunk, self._call("MGET", *chunk)):
+                # Expirou entre o SCAN e o MGET
+                if value is not None:
+                    items.append((key[skip:], value))
+
+        return items
+
+    def count(self, prefix):
+        return len(self._scan_keys(prefix))
+
+    def purge(self):
+        # O próprio servidor expira as chaves
+        return 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "address": f"{self.host}:{self.port}/{self.db}",
+                "connects": self._connects,
+                "reads": self._reads,
+                "writes": self._writes
+            }
+
+
+def open_store(url=STATE_URL):
+    parsed = urlsplit(url)
+
+    if parsed.scheme == "sqlite":
+        path = url[len("sqlite://"):]
+        if not path:
+            raise ValueError(f"EF_STATE_URL without a database path: {url}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SqliteStore(path)
+
+    if parsed.scheme == "redis":
+        db = parsed.path.strip("/")
+        return RedisStore(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(db) if db else 0,
+            password=unquote(parsed.password) if parsed.password else None
+        )
+
+    raise ValueError(f"Unsupported EF_STATE_URL scheme: {url}")
+
+
+store = open_store()
@@ -0,0 +1,45 @@
+"""
+Configuração comum dos testes.
+
+Os módulos leem o ambiente na importação, então os arquivos de estado
+(SQLite, filas em disco, labels) apontam para um diretório temporário antes
+de qualquer import do projeto, e o ECS é sempre o launcher fake.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="monai-mock-tests-")
+
+os.environ.setdefault("EF_LAUNCHER", "fake")
+os.environ.setdefault("EF_STATE_URL", "sqlite://" + os.path.join(_TMP, "state.sqlite3"))
+os.environ.setdefault("EF_ADMISSION_DB", os.path.join(_TMP, "admission.sqlite3"))
+os.environ.setdefault("EF_DISPATCH_QUEUE_DB", os.path.join(_TMP, "dispatch.sqlite3"))
+os.environ.setdefault("EF_WORK_QUEUE_DB", os.path.join(_TMP, "work.sqlite3"))
+os.environ.setdefault("EF_LABEL_DIR", os.path.join(_TMP, "labels"))
+
+import pytest
+
+import state
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Store SQLite isolado por teste."""
+    return state.SqliteStore(str(tmp_path / "state.sqlite3"))
+
+
+@pytest.fixture
+def new_job():
+    """Cria um job no jobs.store global e devolve o id."""
+    import jobs
+
+    def create(scan="3"):
+        job_id = jobs.new_job_id()
+        jobs.store.create(job_id, "ef_analysis", f"P1/S1/E1/{scan}", "P1", "S1", "E1", scan)
+        return job_id
+
+    return create
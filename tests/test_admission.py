@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+
+import admission
+
+
+def _controller(tmp_path, project=None, user=None, overrides=None):
+    off = {"rate": 0, "burst": 0, "max_concurrent": 0}
+    return admission.AdmissionController(
+        path=str(tmp_path / "admission.sqlite3"),
+        project_limits=dict(off, **(project or {})),
+        user_limits=dict(off, **(user or {})),
+        overrides=overrides or {}
+    )
+
+
+def test_default_limits_are_disabled():
+    for limits in (admission.PROJECT_LIMITS, admission.USER_LIMITS):
+        assert not limits["rate"]
+        assert not limits["max_concurrent"]
+
+
+def test_no_limits_admits_everything(tmp_path):
+    controller = _controller(tmp_path)
+
+    for i in range(50):
+        controller.admit("P1", "alice", f"job-{i}")
+
+    assert controller.stats()["admitted"] == 50
+
+
+def test_rate_limit_with_burst(tmp_path):
+    controller = _controller(tmp_path, project={"rate": 0.01, "burst": 2})
+    controller.admit("P1", None, "job-1")
+    controller.admit("P1", None, "job-2")
+
+    with pytest.raises(admission.Rejected) as e:
+        controller.admit("P1", None, "job-3")
+
+    assert e.value.key == "project:P1"
+    assert e.value.reason == "rate limit exceeded"
+    assert e.value.retry_after > 0
+    # Outro projeto tem o próprio bucket
+    controller.admit("P2", None, "job-4")
+
+
+def test_concurrency_limit_and_release(tmp_path):
+    controller = _controller(tmp_path, user={"max_concurrent": 1})
+    controller.admit("P1", "alice", "job-1")
+
+    with pytest.raises(admission.Rejected) as e:
+        controller.admit("P1", "alice", "job-2")
+    assert e.value.key == "user:alice"
+    assert e.value.retry_after == admission.CONCURRENCY_RETRY_AFTER
+
+    controller.release("job-1")
+    controller.admit("P1", "alice", "job-2")
+    assert controller.usage() == {"user:alice": 1}
+
+
+def test_rejected_request_consumes_nothing(tmp_path):
+    controller = _controller(tmp_path, project={"rate": 0.01, "burst": 1}, user={"max_concurrent": 1})
+    controller.admit("P1", "alice", "job-1")
+
+    # Projeto sem token: a vaga do usuário bob não fica presa
+    with pytest.raises(admission.Rejected):
+        controller.admit("P1", "bob", "job-2")
+
+    assert controller.usage() == {"user:alice": 1}
+
+
+def test_overrides(tmp_path):
+    controller = _controller(
+        tmp_path, project={"max_concurrent": 1},
+        overrides={"project:CLINICO": {"max_concurrent": 0}}
+    )
+
+    for i in range(3):
+        controller.admit("CLINICO", None, f"job-{i}")
+
+    controller.admit("P1", None, "job-a")
+    with pytest.raises(admission.Rejected):
+        controller.admit("P1", None, "job-b")
+
+
+def test_stats_on_fresh_controller_does_not_deadlock(tmp_path):
+    # Primeira chamada do worker: _connection() pega o lock para registrar
+    # o pid, então stats() não pode abrir a conexão segurando o mesmo lock
+    controller = _controller(tmp_path, project={"max_concurrent": 5})
+    result = {}
+
+    thread = threading.Thread(target=lambda: result.update(controller.stats()), daemon=True)
+    thread.start()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert result["in_progress"] == {}
+
+
+# ---------------------------------------------------------
+# X-User só com o segredo do proxy
+# ---------------------------------------------------------
+@pytest.mark.parametrize("secret, user, proxy_secret, expected", [
+    (None, "alice", None, None),
+    (None, "alice", "anything", None),
+    ("s3cret", "alice", None, None),
+    ("s3cret", "alice", "wrong", None),
+    ("s3cret", "alice", "s3cretç", None),
+    ("s3cret", "alice", "s3cret", "alice"),
+    ("s3cret", None, "s3cret", None),
+])
+def test_trusted_user(monkeypatch, secret, user, proxy_secret, expected):
+    monkeypatch.setattr(admission, "PROXY_SECRET", secret)
+
+    assert admission.trusted_user(user, proxy_secret) == expected
+
+
+@pytest.mark.parametrize("proxy_secret, user", [(None, None), ("s3cret", "alice")])
+def test_infer_limits_user_only_from_proxy(monkeypatch, proxy_secret, user):
+    import inference
+
+    admitted = []
+
+    def admit(project, user, job_id):
+        admitted.append((project, user))
+        raise admission.Rejected(f"project:{project}", "rate limit exceeded", 1)
+
+    monkeypatch.setattr(admission, "PROXY_SECRET", "s3cret")
+    monkeypatch.setattr(admission.controller, "admit", admit)
+
+    status, _, _ = inference.submit_infer(
+        "ef_analysis", "P1/S1/E1/3", user="alice", proxy_secret=proxy_secret
+    )
+
+    assert status == 429
+    assert admitted == [("P1", user)]
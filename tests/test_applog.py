@@ -0,0 +1,51 @@
+import pytest
+
+import applog
+
+
+@pytest.fixture
+def follow_max(monkeypatch):
+    monkeypatch.setattr(applog, "LOG_FOLLOW_MAX", 1)
+
+
+def test_follow_streams_new_entries(follow_max):
+    follower = applog.follow(timeout=5, heartbeat=0.05)
+    try:
+        applog.get_logger("tests").warning("followed entry")
+        lines = []
+        for line in follower:
+            lines.append(line)
+            if "followed entry" in line:
+                break
+    finally:
+        follower.close()
+
+    assert any("followed entry" in line for line in lines)
+
+
+def test_follow_is_limited_per_worker(follow_max):
+    first = applog.follow(timeout=5)
+    try:
+        assert applog.follow(timeout=5) is None
+        assert applog.stats()["followers"] == 1
+    finally:
+        first.close()
+
+    # close() devolve a vaga, mesmo sem o gerador ter começado
+    second = applog.follow(timeout=5)
+    assert second is not None
+    second.close()
+    second.close()
+    assert applog.stats()["followers"] == 0
+
+
+def test_read_since_returns_only_new_entries():
+    last_seq = applog.read(lines=1)["last_seq"]
+    applog.get_logger("tests").warning("read entry")
+
+    # O registro chega ao buffer pela thread do QueueListener
+    applog.buffer.wait(last_seq, 5)
+    result = applog.read(since=last_seq)
+
+    assert [entry["message"] for entry in result["entries"]] == ["read entry"]
+    assert result["last_seq"] > last_seq
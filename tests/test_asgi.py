@@ -0,0 +1,96 @@
+import asyncio
+import warnings
+
+import pytest
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    from starlette.testclient import TestClient
+
+import asgi
+import inference
+import jobs
+import labels
+
+
+@pytest.fixture
+def client():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return TestClient(asgi.app)
+
+
+def _off_loop(function):
+    """Envolve function e registra se ela rodou no event loop."""
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            calls.append("loop")
+        except RuntimeError:
+            calls.append("thread")
+        return function(*args, **kwargs)
+
+    return wrapper, calls
+
+
+@pytest.mark.parametrize("target, attribute, url", [
+    (inference, "list_jobs", "/jobs"),
+    (jobs.store, "get", "/jobs/0123"),
+    (labels, "locate", "/jobs/0123/label"),
+    (inference, "health", "/health"),
+    (inference, "datastore_info", "/datastore/image/info/?image=P1/S1/E1/3"),
+])
+def test_blocking_routes_run_in_threadpool(client, monkeypatch, target, attribute, url):
+    wrapper, calls = _off_loop(getattr(target, attribute))
+    monkeypatch.setattr(target, attribute, wrapper)
+
+    response = client.get(url)
+
+    assert response.status_code < 500
+    assert calls == ["thread"]
+
+
+def test_get_job(client, new_job):
+    job_id = new_job()
+
+    assert client.get(f"/jobs/{job_id}").json()["job_id"] == job_id
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_list_jobs_requires_admin_token(client, new_job, monkeypatch):
+    job_id = new_job()
+
+    monkeypatch.setattr(inference, "ADMIN_TOKEN", None)
+    assert client.get("/jobs").status_code == 403
+
+    monkeypatch.setattr(inference, "ADMIN_TOKEN", "secret")
+    assert client.get("/jobs").status_code == 401
+    assert client.get("/jobs", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    response = client.get("/jobs?status=QUEUED", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert job_id in [job["job_id"] for job in response.json()]
+    # O job em si continua acessível pelo id
+    assert client.get(f"/jobs/{job_id}").status_code == 200
+
+
+def test_health_is_cheap_and_detail_is_cached(client, monkeypatch):
+    calls = []
+    stats = jobs.store.stats
+    monkeypatch.setattr(jobs.store, "stats", lambda: calls.append(1) or stats())
+    monkeypatch.setattr(inference, "_health_detail", None)
+
+    body = client.get("/health").json()
+    assert body["healthy"] is True
+    assert "jobs" not in body
+    assert calls == []
+
+    for _ in range(3):
+        assert "active" in client.get("/health?detail=1").json()["jobs"]
+    assert len(calls) == 1
+
+    monkeypatch.setattr(inference, "HEALTH_DETAIL_TTL", 0)
+    client.get("/health?detail=1")
+    assert len(calls) == 2
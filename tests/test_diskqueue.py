@@ -0,0 +1,230 @@
+import threading
+import time
+
+import pytest
+
+import diskqueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return diskqueue.DiskQueue(str(tmp_path / "queue.sqlite3"), visibility_timeout=60, timeout=2)
+
+
+def _payloads(messages):
+    return [message.payload for message in messages]
+
+
+def test_put_get_ack(queue):
+    queue.put("a")
+    queue.put("b")
+
+    messages = queue.get(max_items=10, timeout=1)
+
+    assert _payloads(messages) == ["a", "b"]
+    assert queue.counts() == {"ready": 0, "leased": 2}
+    assert queue.ack(messages) == 2
+    assert queue.counts() == {"ready": 0, "leased": 0}
+
+
+def test_unacked_message_is_redelivered(tmp_path):
+    queue = diskqueue.DiskQueue(str(tmp_path / "queue.sqlite3"), visibility_timeout=0.1)
+    queue.put("a")
+    assert queue.get(timeout=1)[0].attempts == 1
+
+    time.sleep(0.15)
+    (message,) = queue.get(timeout=1)
+
+    assert message.payload == "a"
+    assert message.attempts == 2
+
+
+def test_release_with_delay(queue):
+    queue.put("a")
+    queue.release(queue.get(timeout=1), delay=0.2, count_attempt=False)
+
+    assert queue.get(timeout=0) == []
+    (message,) = queue.get(timeout=1)
+    assert message.attempts == 1
+
+
+def test_ack_and_release_ignore_lost_leases(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    first = diskqueue.DiskQueue(path, visibility_timeout=0.1)
+    second = diskqueue.DiskQueue(path, visibility_timeout=60)
+    first.put("a")
+
+    stale = first.get(timeout=1)
+    time.sleep(0.15)
+    current = second.get(timeout=1)
+    assert _payloads(current) == ["a"]
+
+    # O primeiro perdeu o aluguel: nem apaga nem devolve a mensagem do segundo
+    assert first.ack(stale) == 0
+    assert first.release(stale) == 0
+    assert second.counts() == {"ready": 0, "leased": 1}
+    assert second.ack(current) == 1
+
+
+def test_remote_lease_extend_and_complete(queue):
+    queue.put("a")
+    (message,) = queue.get(owner="worker-1", timeout=1)
+
+    assert queue.extend(message.id, "worker-1", 60)
+    assert not queue.extend(message.id, "worker-2", 60)
+    assert queue.complete(message.id, "worker-2") is None
+    assert queue.complete(message.id, "worker-1") == "a"
+
+
+def test_put_timeout_before_commit_drops_item(tmp_path):
+    # O writer ainda está na janela de group commit quando o put desiste
+    queue = diskqueue.DiskQueue(str(tmp_path / "queue.sqlite3"), commit_window=0.5, timeout=0.1)
+
+    with pytest.raises(diskqueue.QueueError) as e:
+        queue.put("a")
+    assert not isinstance(e.value, diskqueue.CommitUnknown)
+
+    time.sleep(0.6)
+    assert queue.get(timeout=0.2) == []
+
+
+class _SlowConnection:
+    """Conexão do writer que segura o INSERT até release ser setado."""
+
+    def __init__(self, conn, release):
+        self._conn = conn
+        self._release = release
+
+    def executemany(self, *args):
+        self._release.wait(5)
+        return self._conn.executemany(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def test_put_timeout_during_commit_is_unknown(queue, monkeypatch):
+    release = threading.Event()
+    open_connection = queue._open
+    monkeypatch.setattr(queue, "_open", lambda synchronous: _SlowConnection(open_connection(synchronous), release))
+    queue.timeout = 0.1
+
+    with pytest.raises(diskqueue.CommitUnknown):
+        queue.put("a")
+
+    # O item estava na transação: continua sendo entregue
+    release.set()
+    assert _payloads(queue.get(timeout=2)) == ["a"]
+
+
+def test_replay_returns_leases_of_dead_processes(queue, monkeypatch):
+    queue.put("a")
+    (message,) = queue.get(timeout=1)
+    conn = queue._connection()
+    conn.execute("UPDATE messages SET owner = ? WHERE id = ?", ("999999999:dead", message.id))
+    monkeypatch.setattr(diskqueue, "_pid_alive", lambda pid: False)
+
+    assert queue.replay() == 1
+    assert _payloads(queue.get(timeout=1)) == ["a"]
+
+
+# ---------------------------------------------------------
+# ROLLBACK que falha depois de um erro
+# ---------------------------------------------------------
+class _FailingConnection:
+    """Conexão em que os comandos que começam com fail e o ROLLBACK falham."""
+
+    def __init__(self, conn, *fail):
+        self._conn = conn
+        self._fail = fail
+
+    def execute(self, sql, *args):
+        if sql.startswith(self._fail) or sql == "ROLLBACK":
+            raise diskqueue.sqlite3.OperationalError(f"disk I/O error ({sql.split()[0]})")
+        return self._conn.execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        if sql.startswith(self._fail):
+            raise diskqueue.sqlite3.OperationalError(f"disk I/O error ({sql.split()[0]})")
+        return self._conn.executemany(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def test_failed_rollback_keeps_original_error(queue):
+    queue.put("a")
+    messages = queue.get(timeout=1)
+    queue._local.conn = _FailingConnection(queue._connection(), "DELETE")
+
+    with pytest.raises(diskqueue.QueueError, match=r"\(DELETE\)"):
+        queue.ack(messages)
+
+    # A conexão presa na transação foi trocada por outra
+    assert queue.ack(messages) == 1
+
+
+def test_failed_rollback_in_lease_and_complete(queue):
+    queue.put("a")
+    queue._local.conn = _FailingConnection(queue._connection(), "SELECT id")
+
+    with pytest.raises(diskqueue.QueueError, match=r"\(SELECT\)"):
+        queue.get(timeout=1)
+
+    (message,) = queue.get(owner="worker-1", timeout=1)
+    queue._local.conn = _FailingConnection(queue._connection(), "SELECT payload")
+
+    with pytest.raises(diskqueue.QueueError, match=r"\(SELECT\)"):
+        queue.complete(message.id, "worker-1")
+    assert queue.complete(message.id, "worker-1") == "a"
+
+
+def test_writer_survives_failed_rollback(queue, monkeypatch):
+    open_connection = queue._open
+    opened = []
+
+    def failing_open(synchronous):
+        conn = open_connection(synchronous)
+        opened.append(conn)
+        return _FailingConnection(conn, "INSERT") if len(opened) == 1 else conn
+
+    monkeypatch.setattr(queue, "_open", failing_open)
+
+    with pytest.raises(diskqueue.QueueError, match=r"\(INSERT\)"):
+        queue.put("a")
+    queue.put("b")
+
+    assert len(opened) == 2
+    assert _payloads(queue.get(max_items=10, timeout=1)) == ["b"]
+
+
+# ---------------------------------------------------------
+# Profundidade sem COUNT(*) a cada commit
+# ---------------------------------------------------------
+def test_depth_follows_commits_and_acks(queue):
+    for payload in "abcd":
+        queue.put(payload)
+    assert queue.depth == 4
+
+    first, second, third = queue.get(max_items=3, timeout=1)
+    queue.ack([first, second])
+    assert queue.depth == 2
+
+    # Devolvida continua no arquivo
+    queue.release([third])
+    assert queue.depth == 2
+
+    (remote,) = queue.get(owner="worker-1", timeout=1)
+    queue.complete(remote.id, "worker-1")
+    assert queue.depth == 1
+
+
+def test_depth_of_other_processes_after_counts(queue):
+    other = diskqueue.DiskQueue(queue.path, timeout=2)
+    other.put("a")
+    other.put("b")
+    assert queue.depth == 0
+
+    queue.counts()
+
+    assert queue.depth == 2
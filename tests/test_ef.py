@@ -0,0 +1,196 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import ef
+import jobs
+
+
+API_DATA = {"project": "P1", "subject": "S1", "experiment": "E1", "scan": "3"}
+
+
+def test_launch_chunk_marks_jobs_launched(new_job):
+    job_id = new_job()
+
+    ef._launch_chunk([job_id], API_DATA)
+
+    job = jobs.store.get(job_id)
+    assert job["status"] == jobs.LAUNCHED
+    assert job["task_arn"]
+
+
+def test_launch_chunk_unexpected_error_fails_jobs(new_job, monkeypatch):
+    job_id = new_job()
+
+    def run_task(launcher, task_request):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(ef, "_run_task", run_task)
+
+    ef._launch_chunk([job_id], API_DATA)
+
+    job = jobs.store.get(job_id)
+    assert job["status"] == jobs.FAILED
+    assert job["error"] == "boom"
+
+
+def test_launch_chunk_postponed_keeps_jobs_queued(new_job, monkeypatch):
+    job_id = new_job()
+
+    def run_task(launcher, task_request):
+        raise ef.resilience.RetryLater("throttled", 1.0, "throttled")
+
+    monkeypatch.setattr(ef, "_run_task", run_task)
+
+    with pytest.raises(ef.resilience.RetryLater):
+        ef._launch_chunk([job_id], API_DATA)
+
+    assert jobs.store.get(job_id)["status"] == jobs.QUEUED
+
+
+def test_split_batch_respects_size_limit():
+    batch = [(str(i), dict(API_DATA, scan=str(i)), None) for i in range(10)]
+
+    chunks = ef.split_batch(batch, max_bytes=200)
+
+    assert [item for chunk in chunks for item in chunk] == batch
+    assert all(len(chunk) < len(batch) for chunk in chunks)
+
+
+def _exame_json_size(chunk):
+    api_data = [api_data for _, api_data, _ in chunk]
+    return len(json.dumps(api_data[0] if len(api_data) == 1 else api_data, separators=(",", ":")).encode())
+
+
+def test_split_batch_over_exame_json_limit():
+    # ~300 bytes por exame: o lote inteiro passa bem do limite padrão
+    batch = [(str(i), dict(API_DATA, scan=str(i), notes="x" * 250), None) for i in range(60)]
+    assert _exame_json_size(batch) > ef.EXAME_JSON_MAX_BYTES
+
+    chunks = ef.split_batch(batch)
+
+    assert len(chunks) > 1
+    assert [item for chunk in chunks for item in chunk] == batch
+    assert all(_exame_json_size(chunk) <= ef.EXAME_JSON_MAX_BYTES for chunk in chunks)
+    # Cada lote vai até onde cabe: juntar o primeiro exame do seguinte passaria
+    assert all(_exame_json_size(chunk + [after[0]]) >= ef.EXAME_JSON_MAX_BYTES
+               for chunk, after in zip(chunks, chunks[1:]))
+
+
+def test_split_batch_isolates_oversize_item():
+    big = ("big", dict(API_DATA, notes="x" * 500), None)
+    batch = [("a", API_DATA, None), ("b", API_DATA, None), big, ("c", API_DATA, None)]
+
+    chunks = ef.split_batch(batch, max_bytes=300)
+
+    # Sozinho no próprio RunTask: se falhar, não leva os vizinhos junto
+    assert [[job_id for job_id, _, _ in chunk] for chunk in chunks] == [["a", "b"], ["big"], ["c"]]
+
+
+def test_split_batch_small_and_empty():
+    batch = [(str(i), dict(API_DATA, scan=str(i)), None) for i in range(3)]
+
+    assert ef.split_batch(batch) == [batch]
+    assert ef.split_batch([]) == []
+
+
+def test_launch_sends_each_chunk_in_order(monkeypatch):
+    launched = []
+    monkeypatch.setattr(ef, "_launch_chunk", lambda job_ids, api_data, traceparent=None: launched.append(
+        (job_ids, api_data)
+    ))
+    batch = [(str(i), dict(API_DATA, scan=str(i), notes="x" * 250), None) for i in range(60)]
+
+    assert ef._launch(batch) == []
+
+    assert [job_id for job_ids, _ in launched for job_id in job_ids] == [str(i) for i in range(60)]
+    assert all(isinstance(api_data, list) for _, api_data in launched)
+
+
+# ---------------------------------------------------------
+# RunTask: retentativas e circuit breaker
+# ---------------------------------------------------------
+class StubLauncher:
+    """Launcher que devolve (ou levanta) as respostas na ordem dada."""
+
+    name = "stub"
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def run_task(self, **request):
+        self.calls.append(request)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def _task(arn="arn:aws:ecs:task/1"):
+    return {"taskArn": arn, "lastStatus": "PROVISIONING"}
+
+
+@pytest.fixture
+def launch(monkeypatch):
+    """Breaker e alvo novos, sem backoff entre tentativas."""
+    breaker = ef.resilience.CircuitBreaker("test", failure_threshold=3)
+    monkeypatch.setattr(ef, "breaker", breaker)
+    monkeypatch.setattr(ef, "targets", ef.placement.load_targets("", "us-east-2", "cluster", "subnet-1"))
+    monkeypatch.setattr(ef, "LAUNCH_ATTEMPTS", 3)
+    monkeypatch.setattr(ef.time, "sleep", lambda seconds: None)
+
+    def run(*responses):
+        launcher = StubLauncher(*responses)
+        return launcher, ef._run_task(launcher, ef.build_run_task_request(API_DATA))
+
+    return breaker, run
+
+
+def test_run_task_retries_transient_errors(launch):
+    breaker, run = launch
+    throttled = ef.ecs.LaunchError("slow down", code="ThrottlingException")
+
+    launcher, (response, target) = run(throttled, {"tasks": [_task()], "failures": []})
+
+    assert len(launcher.calls) == 2
+    assert response["tasks"][0]["taskArn"] == "arn:aws:ecs:task/1"
+    assert breaker.state == ef.resilience.CLOSED
+
+
+def test_run_task_gives_up_with_retry_later(launch):
+    _, run = launch
+    throttled = ef.ecs.LaunchError("slow down", code="ThrottlingException")
+
+    with pytest.raises(ef.resilience.RetryLater) as e:
+        run(throttled, throttled, throttled)
+
+    assert e.value.kind == ef.resilience.THROTTLED
+
+
+def test_fatal_error_does_not_reset_breaker(launch):
+    breaker, run = launch
+    throttled = ef.ecs.LaunchError("slow down", code="ThrottlingException")
+    invalid = {"tasks": [], "failures": [{"reason": "invalid task definition"}]}
+
+    breaker.record_failure(throttled)
+    with pytest.raises(ef.ecs.LaunchError):
+        run(invalid)
+
+    # A falha anterior continua contando: mais duas abrem o circuito
+    assert breaker.stats()["consecutive_failures"] == 1
+    breaker.record_failure(throttled)
+    breaker.record_failure(throttled)
+    assert breaker.state == ef.resilience.OPEN
+
+
+def test_launch_attempts_is_at_least_one():
+    code = "import ef; print(ef.LAUNCH_ATTEMPTS)"
+    env = dict(os.environ, EF_LAUNCH_ATTEMPTS="0")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], env=env, cwd=root, capture_output=True, text=True, check=True)
+
+    assert output.stdout.split()[-1] == "1"
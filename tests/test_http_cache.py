@@ -0,0 +1,98 @@
+import warnings
+
+import pytest
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    from starlette.testclient import TestClient
+
+import asgi
+import http_cache
+import inference
+import monaimockv1
+
+
+ORIGIN = inference.CORS_ORIGINS[0]
+
+
+@pytest.fixture(params=["asgi", "flask"])
+def client(request):
+    if request.param == "flask":
+        return monaimockv1.app.test_client()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return TestClient(asgi.app)
+
+
+# ---------------------------------------------------------
+# PrecomputedJSON
+# ---------------------------------------------------------
+def test_body_and_etag_computed_once():
+    document = http_cache.PrecomputedJSON({"b": [1, 2], "a": "ç"}, max_age=10)
+
+    assert document.body == b'{"b":[1,2],"a":"\\u00e7"}'
+    assert document.etag == http_cache.PrecomputedJSON({"b": [1, 2], "a": "ç"}).etag
+    assert document.etag != http_cache.PrecomputedJSON({"b": [1, 2]}).etag
+    assert document.headers == {"ETag": document.etag, "Cache-Control": "public, max-age=10, must-revalidate"}
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    (None, False),
+    ("", False),
+    ('"other"', False),
+    ("{etag}", True),
+    ('"other", {etag}', True),
+    ("W/{etag}", True),
+    ("*", True),
+])
+def test_not_modified(if_none_match, expected):
+    document = http_cache.PrecomputedJSON({"a": 1})
+
+    assert document.not_modified(if_none_match and if_none_match.format(etag=document.etag)) is expected
+
+
+# ---------------------------------------------------------
+# /info com ETag / If-None-Match
+# ---------------------------------------------------------
+@pytest.mark.parametrize("url", ["/info/", "/info/models", "/info/model/ef_analysis"])
+def test_info_revalidates_with_304(client, url):
+    response = client.get(url)
+    etag = response.headers["ETag"]
+
+    assert response.status_code == 200
+    assert "max-age" in response.headers["Cache-Control"]
+
+    cached = client.get(url, headers={"If-None-Match": etag})
+
+    assert cached.status_code == 304
+    assert (cached.content if hasattr(cached, "content") else cached.data) == b""
+    assert cached.headers["ETag"] == etag
+    assert client.get(url, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_info_follows_model_reload(client, monkeypatch):
+    etag = client.get("/info/").headers["ETag"]
+    current = inference.models.current()
+    reloaded = http_cache.PrecomputedJSON({"name": "reloaded"})
+    monkeypatch.setattr(current, "rendered_info", reloaded)
+
+    response = client.get("/info/", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] == reloaded.etag
+
+
+# ---------------------------------------------------------
+# Preflight CORS reaproveitado pelo navegador
+# ---------------------------------------------------------
+def test_preflight_is_cacheable(client):
+    response = client.options("/infer/ef_analysis", headers={
+        "Origin": ORIGIN,
+        "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "content-type"
+    })
+
+    assert response.status_code in (200, 204)
+    assert response.headers["Access-Control-Allow-Origin"] == ORIGIN
+    assert response.headers["Access-Control-Max-Age"] == str(http_cache.CORS_MAX_AGE)
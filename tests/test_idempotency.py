@@ -0,0 +1,141 @@
+import time
+
+import idempotency
+
+
+KEY = idempotency.scan_key("ef_analysis", "P1", "S1", "E1", "3")
+
+
+def test_first_claim_is_new(store):
+    cache = idempotency.IdempotencyCache(ttl=60, backend=store)
+
+    entry, is_new = cache.claim(KEY, "job-1")
+
+    assert is_new
+    assert entry["job_id"] == "job-1"
+
+
+def test_repeated_claim_reuses_first_job(store):
+    cache = idempotency.IdempotencyCache(ttl=60, backend=store)
+    cache.claim(KEY, "job-1")
+
+    entry, is_new = cache.claim(KEY, "job-2")
+
+    assert not is_new
+    assert entry["job_id"] == "job-1"
+    assert entry["key"] == KEY
+    assert cache.stats()["launches_saved"] == 1
+
+
+def test_claim_is_shared_between_caches(store):
+    # Dois workers, mesmo store
+    first = idempotency.IdempotencyCache(ttl=60, backend=store)
+    second = idempotency.IdempotencyCache(ttl=60, backend=store)
+    first.claim(KEY, "job-1")
+
+    entry, is_new = second.claim(KEY, "job-2")
+
+    assert not is_new
+    assert entry["job_id"] == "job-1"
+
+
+def test_other_scan_is_not_deduplicated(store):
+    cache = idempotency.IdempotencyCache(ttl=60, backend=store)
+    cache.claim(KEY, "job-1")
+
+    other = idempotency.scan_key("ef_analysis", "P1", "S1", "E1", "4")
+    _, is_new = cache.claim(other, "job-2")
+
+    assert is_new
+
+
+def test_unreusable_entry_is_replaced(store):
+    cache = idempotency.IdempotencyCache(ttl=60, backend=store)
+    cache.claim(KEY, "job-1")
+
+    entry, is_new = cache.claim(KEY, "job-2", reusable=lambda existing: existing["job_id"] != "job-1")
+
+    assert is_new
+    assert entry["job_id"] == "job-2"
+    _, is_new = cache.claim(KEY, "job-3")
+    assert not is_new
+
+
+def test_claim_expires_after_ttl(store):
+    cache = idempotency.IdempotencyCache(ttl=0.05, backend=store)
+    cache.claim(KEY, "job-1")
+    time.sleep(0.1)
+
+    entry, is_new = cache.claim(KEY, "job-2")
+
+    assert is_new
+    assert entry["job_id"] == "job-2"
+
+
+def test_release_allows_new_launch(store):
+    cache = idempotency.IdempotencyCache(ttl=60, backend=store)
+    cache.claim(KEY, "job-1")
+
+    cache.release(KEY)
+
+    _, is_new = cache.claim(KEY, "job-2")
+    assert is_new
+
+
+def test_release_prefix(store):
+    cache = idempotency.IdempotencyCache(ttl=60, backend=store)
+    cache.claim(KEY, "job-1")
+    cache.claim(idempotency.scan_key("ef_analysis", "P1", "S1", "E2", "3"), "job-2")
+    cache.claim(idempotency.scan_key("ef_analysis", "P2", "S1", "E1", "3"), "job-3")
+
+    cache.release_prefix(("ef_analysis", "P1"))
+
+    assert cache.stats()["tracked"] == 1
+
+
+# ---------------------------------------------------------
+# Reaproveitamento de jobs (inference._job_reusable)
+# ---------------------------------------------------------
+def _create_job(job_id):
+    import jobs
+    jobs.store.create(job_id, "ef_analysis", "P1/S1/E1/3", "P1", "S1", "E1", "3")
+
+
+def test_claim_without_job_record_is_in_flight(store):
+    import inference
+    cache = idempotency.IdempotencyCache(ttl=60, backend=store)
+    first, _ = cache.claim(KEY, "a" * 32, reusable=inference._job_reusable)
+
+    # Segundo pedido antes do jobs.store.create do primeiro
+    entry, is_new = cache.claim(KEY, "b" * 32, reusable=inference._job_reusable)
+
+    assert not is_new
+    assert entry["job_id"] == first["job_id"]
+
+
+def test_stale_claim_without_job_record_is_replaced(store, monkeypatch):
+    import inference
+    monkeypatch.setattr(idempotency, "DEDUP_PENDING", 0)
+    cache = idempotency.IdempotencyCache(ttl=60, backend=store)
+    cache.claim(KEY, "c" * 32, reusable=inference._job_reusable)
+
+    entry, is_new = cache.claim(KEY, "d" * 32, reusable=inference._job_reusable)
+
+    assert is_new
+    assert entry["job_id"] == "d" * 32
+
+
+def test_failed_job_is_not_reused(store):
+    import inference
+    import jobs
+    cache = idempotency.IdempotencyCache(ttl=60, backend=store)
+    cache.claim(KEY, "e" * 32, reusable=inference._job_reusable)
+    _create_job("e" * 32)
+
+    _, is_new = cache.claim(KEY, "f" * 32, reusable=inference._job_reusable)
+    assert not is_new
+
+    jobs.store.mark_failed(["e" * 32], "boom")
+    entry, is_new = cache.claim(KEY, "f" * 32, reusable=inference._job_reusable)
+    assert is_new
+    assert entry["job_id"] == "f" * 32
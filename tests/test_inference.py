@@ -0,0 +1,80 @@
+import pytest
+
+import diskqueue
+import ef
+import idempotency
+import inference
+import jobs
+import results
+
+
+@pytest.fixture
+def dispatched(store, monkeypatch):
+    """Disparos gravados em uma lista, com dedup e cache de resultados isolados."""
+    monkeypatch.setattr(inference, "dedup", idempotency.IdempotencyCache(ttl=60, backend=store))
+    monkeypatch.setattr(inference, "result_cache", results.ResultCache(ttl=60, backend=store))
+    monkeypatch.setattr(inference.warmpool, "ENABLED", False)
+    calls = []
+    monkeypatch.setattr(ef, "run_fargate_task", lambda api_data, job_id=None: calls.append(job_id))
+    return calls
+
+
+def _submit(image="P1/S1/E1/3", model="ef_analysis"):
+    return inference.submit_infer(model, image)
+
+
+def test_submit_creates_job_and_dispatches(dispatched):
+    status, body, _ = _submit()
+
+    assert status == 200
+    assert dispatched == [body["job_id"]]
+    assert jobs.store.get(body["job_id"])["status"] == jobs.QUEUED
+
+
+def test_repeated_submit_joins_job(dispatched):
+    _, first, _ = _submit()
+    status, body, _ = _submit()
+
+    assert status == 200
+    assert body["job_id"] == first["job_id"]
+    assert body["deduplicated"]
+    assert len(dispatched) == 1
+
+
+def test_unknown_model(dispatched):
+    status, _, _ = _submit(model="missing")
+
+    assert status == 404
+    assert dispatched == []
+
+
+def test_dispatch_error_releases_dedup(dispatched, monkeypatch):
+    def fail(api_data, job_id=None):
+        raise diskqueue.QueueError("disk full")
+
+    monkeypatch.setattr(ef, "run_fargate_task", fail)
+    status, _, _ = _submit()
+    assert status == 500
+
+    monkeypatch.setattr(ef, "run_fargate_task", lambda api_data, job_id=None: dispatched.append(job_id))
+    status, body, _ = _submit()
+    assert status == 200
+    assert not body.get("deduplicated")
+
+
+def test_unknown_commit_keeps_job_for_retries(dispatched, monkeypatch):
+    def unknown(api_data, job_id=None):
+        raise diskqueue.CommitUnknown("slow commit")
+
+    monkeypatch.setattr(ef, "run_fargate_task", unknown)
+    status, body, headers = _submit()
+
+    assert status == 503
+    assert "Retry-After" in headers
+    assert jobs.store.get(body["job_id"]) is not None
+
+    # A retentativa acompanha o mesmo job em vez de disparar de novo
+    status, retry, _ = _submit()
+    assert status == 200
+    assert retry["job_id"] == body["job_id"]
+    assert retry["deduplicated"]
@@ -0,0 +1,154 @@
+import json
+import os
+import time
+
+import pytest
+
+import ecs
+import jobs
+
+
+class RecordingLauncher(ecs.FakeEcsLauncher):
+    """ECS falso que guarda cada DescribeTasks (região, cluster, nº de ARNs)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(latency=0, **kwargs)
+        self.calls = []
+
+    def describe_tasks(self, region, cluster, task_arns):
+        self.calls.append((region, cluster, len(task_arns)))
+        return super().describe_tasks(region, cluster, task_arns)
+
+
+class StubLauncher:
+    name = "stub"
+
+    def __init__(self, response):
+        self.response = response
+
+    def describe_tasks(self, region, cluster, task_arns):
+        return self.response
+
+
+@pytest.fixture
+def job_store(store):
+    job_store = jobs.JobStore(backend=store)
+    # Sem thread de polling: os testes chamam poll_once
+    job_store._pid = os.getpid()
+    return job_store
+
+
+@pytest.fixture
+def launcher(store):
+    return RecordingLauncher(backend=store)
+
+
+def _launch(job_store, launcher, region, cluster, count, jobs_per_task=1, age=0.0):
+    """count tarefas no ECS falso, cada uma com jobs_per_task jobs."""
+    job_ids = []
+    for _ in range(count):
+        task = launcher.run_task(region, cluster, "ef:1", {}, {}, "test")["tasks"][0]
+        if age:
+            task["createdAt"] -= age
+            launcher.backend.set(launcher.KEY_PREFIX + task["taskArn"], json.dumps(task))
+
+        ids = [jobs.new_job_id() for _ in range(jobs_per_task)]
+        for job_id in ids:
+            job_store.create(job_id, "ef_analysis", "P1/S1/E1/3", "P1", "S1", "E1", "3")
+        job_store.mark_launched(ids, task["taskArn"], region, cluster)
+        job_ids += ids
+    return job_ids
+
+
+def _stopped(*exit_codes, **fields):
+    return dict({
+        "lastStatus": "STOPPED",
+        "stoppedReason": "Essential container in task exited",
+        "containers": [{"name": f"c{i}", "exitCode": code} for i, code in enumerate(exit_codes)]
+    }, **fields)
+
+
+# ---------------------------------------------------------
+# DescribeTasks em lote
+# ---------------------------------------------------------
+def test_poll_chunks_by_region_and_cluster(job_store, launcher):
+    east = _launch(job_store, launcher, "us-east-2", "fe-cluster", 250)
+    west = _launch(job_store, launcher, "us-west-2", "fe-cluster", 30)
+    other = _launch(job_store, launcher, "us-east-2", "other", 1)
+
+    job_store.poll_once(launcher)
+
+    assert sorted(launcher.calls) == [
+        ("us-east-2", "fe-cluster", 50), ("us-east-2", "fe-cluster", 100), ("us-east-2", "fe-cluster", 100),
+        ("us-east-2", "other", 1), ("us-west-2", "fe-cluster", 30)
+    ]
+    assert all(job_store.get(job_id)["ecs_status"] == "PROVISIONING" for job_id in east + west + other)
+    assert job_store.stats()["describe_calls"] == 5
+
+
+def test_batched_task_updates_all_its_jobs(job_store, launcher):
+    job_ids = _launch(job_store, launcher, "us-east-2", "fe-cluster", 1, jobs_per_task=3, age=3600)
+
+    job_store.poll_once(launcher)
+
+    assert launcher.calls == [("us-east-2", "fe-cluster", 1)]
+    assert {job_store.get(job_id)["status"] for job_id in job_ids} == {jobs.SUCCEEDED}
+    assert job_store.stats()["active"] == 0
+
+
+def test_missing_task_fails_its_jobs(job_store, launcher):
+    (gone,) = _launch(job_store, launcher, "us-east-2", "fe-cluster", 1)
+    (running,) = _launch(job_store, launcher, "us-east-2", "fe-cluster", 1)
+    launcher.backend.delete(launcher.KEY_PREFIX + job_store.get(gone)["task_arn"])
+
+    job_store.poll_once(launcher)
+
+    assert job_store.get(gone)["status"] == jobs.FAILED
+    assert job_store.get(gone)["error"] == "ECS: MISSING"
+    assert job_store.get(running)["status"] == jobs.LAUNCHED
+    assert job_store.stats()["active"] == 1
+
+
+def test_finished_jobs_leave_the_poll(job_store, launcher):
+    _launch(job_store, launcher, "us-east-2", "fe-cluster", 2, age=3600)
+
+    job_store.poll_once(launcher)
+    job_store.poll_once(launcher)
+
+    assert len(launcher.calls) == 1
+
+
+# ---------------------------------------------------------
+# Tarefa STOPPED -> status e exit code do job
+# ---------------------------------------------------------
+@pytest.mark.parametrize("exit_codes, status, exit_code", [
+    ((0,), jobs.SUCCEEDED, 0),
+    ((0, 0), jobs.SUCCEEDED, 0),
+    ((0, 137), jobs.FAILED, 137),
+    ((None, 2), jobs.FAILED, 2),
+    # Container sem exit code (não chegou a rodar)
+    ((0, None), jobs.FAILED, None),
+    ((), jobs.FAILED, None),
+])
+def test_stopped_exit_codes(job_store, launcher, exit_codes, status, exit_code):
+    (job_id,) = _launch(job_store, launcher, "us-east-2", "fe-cluster", 1)
+    arn = job_store.get(job_id)["task_arn"]
+    stopped = _stopped(*exit_codes, taskArn=arn, startedAt=time.time() - 10, stoppedAt=time.time())
+
+    job_store.poll_once(StubLauncher({"tasks": [stopped], "failures": []}))
+
+    job = job_store.get(job_id)
+    assert (job["status"], job["exit_code"]) == (status, exit_code)
+    assert job["ecs_status"] == "STOPPED"
+    assert job["stopped_reason"] == "Essential container in task exited"
+    assert job["ecs_timestamps"]["stoppedAt"] == pytest.approx(stopped["stoppedAt"])
+
+
+def test_running_task_only_updates_ecs_status(job_store, launcher):
+    (job_id,) = _launch(job_store, launcher, "us-east-2", "fe-cluster", 1)
+    arn = job_store.get(job_id)["task_arn"]
+
+    job_store.poll_once(StubLauncher({"tasks": [{"taskArn": arn, "lastStatus": "RUNNING"}]}))
+
+    job = job_store.get(job_id)
+    assert (job["status"], job["ecs_status"], job["exit_code"]) == (jobs.LAUNCHED, "RUNNING", None)
@@ -0,0 +1,98 @@
+import io
+import os
+
+import pytest
+
+import labels
+
+
+@pytest.fixture
+def label_store(tmp_path, monkeypatch):
+    store = labels.LabelStore(directory=str(tmp_path), max_bytes=1024)
+    monkeypatch.setattr(labels, "store", store)
+    monkeypatch.setattr(labels, "LABEL_TOKEN", "secret")
+    return store
+
+
+def _upload(job_id, data, authorization="Bearer secret"):
+    return labels.upload(authorization, job_id, io.BytesIO(data).read, len(data), "label.nii.gz")
+
+
+def test_upload_and_locate(label_store, new_job):
+    job_id = new_job()
+    status, body, _ = _upload(job_id, b"abc")
+    assert status == 201
+
+    (path, label, stat), error = labels.locate(job_id)
+    assert error is None
+    assert open(path, "rb").read() == b"abc"
+    assert stat.st_size == label["size"] == 3
+
+
+# ---------------------------------------------------------
+# Token
+# ---------------------------------------------------------
+def test_upload_requires_token(label_store, new_job):
+    job_id = new_job()
+    assert _upload(job_id, b"abc", authorization=None)[0] == 401
+    assert _upload(job_id, b"abc", authorization="Bearer other")[0] == 401
+
+
+def test_upload_disabled_without_token(label_store, new_job, monkeypatch):
+    monkeypatch.setattr(labels, "LABEL_TOKEN", None)
+    status, body, _ = _upload(new_job(), b"abc", authorization="Bearer ")
+    assert status == 403
+    assert "EF_LABEL_TOKEN" in body["error"]
+
+
+# ---------------------------------------------------------
+# Novo upload por cima de um label existente
+# ---------------------------------------------------------
+def test_reupload_keeps_data_and_etag_consistent(label_store, new_job):
+    job_id = new_job()
+    _upload(job_id, b"old")
+    (old_path, old_label, _), _ = labels.locate(job_id)
+
+    _upload(job_id, b"new")
+    (path, label, _), _ = labels.locate(job_id)
+
+    assert path != old_path
+    assert not os.path.exists(old_path)
+    assert open(path, "rb").read() == b"new"
+    assert labels.etag(label) != labels.etag(old_label)
+    assert label_store.stats()["files"] == 1
+
+
+def test_data_is_not_replaced_before_metadata(label_store, new_job, monkeypatch):
+    job_id = new_job()
+    _upload(job_id, b"old")
+
+    # Um GET entre a gravação dos dados e a do .json ainda vê o par antigo
+    seen = []
+    write_meta = label_store._write_meta
+
+    def spy(path, label):
+        (data_path, current, _), _ = labels.locate(job_id)
+        seen.append((open(data_path, "rb").read(), current["sha256"]))
+        write_meta(path, label)
+
+    monkeypatch.setattr(label_store, "_write_meta", spy)
+    _upload(job_id, b"new")
+
+    (content, sha256), = seen
+    assert content == b"old"
+    assert sha256 == labels.hashlib.sha256(b"old").hexdigest()
+
+
+def test_legacy_unversioned_label(label_store):
+    job_id = "0" * 32
+    with open(os.path.join(label_store.directory, job_id + ".label"), "wb") as f:
+        f.write(b"abc")
+    label_store._write_meta(label_store.meta_path(job_id), {"size": 3, "sha256": "x"})
+
+    path, _, _ = label_store.get(job_id)
+    assert path.endswith(job_id + ".label")
+
+    label_store.delete(job_id)
+    assert label_store.get(job_id) is None
+    assert os.listdir(label_store.directory) == []
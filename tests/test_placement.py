@@ -0,0 +1,190 @@
+import json
+import random
+from collections import Counter
+
+import pytest
+
+import ef
+import placement
+import resilience
+
+
+THROTTLED = ef.ecs.LaunchError("slow down", code="ThrottlingException")
+API_DATA = {"project": "P1", "subject": "S1", "experiment": "E1", "scan": "3"}
+
+
+def _pool(*weights):
+    return placement.load_targets(json.dumps([
+        {"name": f"t{i}", "region": "us-east-2", "cluster": f"c{i}", "subnets": [f"subnet-{i}"], "weight": weight}
+        for i, weight in enumerate(weights)
+    ]))
+
+
+def _choose(pool, rounds, **kwargs):
+    counts = Counter()
+    for _ in range(rounds):
+        target = pool.choose(**kwargs)
+        target.breaker.release()
+        counts[target.name] += 1
+    return counts
+
+
+# ---------------------------------------------------------
+# Configuração
+# ---------------------------------------------------------
+def test_default_target_from_environment():
+    pool = placement.load_targets("", "us-east-2", "fe-cluster", "subnet-1")
+
+    (target,) = pool.targets
+    request = target.place({"taskDefinition": "ef:1"})
+    assert request["cluster"] == "fe-cluster"
+    assert request["network_configuration"]["awsvpcConfiguration"]["subnets"] == ["subnet-1"]
+
+
+@pytest.mark.parametrize("config", [
+    [{"name": "a", "region": "r", "cluster": "c", "subnets": ["s"], "weight": 0}],
+    [{"name": "a", "cluster": "c", "subnets": ["s"]}],
+    [{"name": "a", "region": "r", "cluster": "c", "subnets": ["s"]}] * 2,
+])
+def test_invalid_targets(config):
+    with pytest.raises(ValueError):
+        placement.load_targets(json.dumps(config))
+
+
+# ---------------------------------------------------------
+# Sorteio ponderado
+# ---------------------------------------------------------
+def test_choose_follows_weights():
+    random.seed(1)
+    counts = _choose(_pool(3, 1), 4000)
+
+    assert 0.7 < counts["t0"] / 4000 < 0.8
+
+
+def test_failures_lower_effective_weight():
+    random.seed(2)
+    pool = _pool(1, 1)
+    bad = pool.targets[0]
+    for _ in range(5):
+        bad.record_failure(resilience.CAPACITY, 0.1, THROTTLED)
+        # Só a saúde: o breaker do alvo fica fechado
+        bad.breaker.record_success()
+
+    assert bad.health < pool.targets[1].health
+    counts = _choose(pool, 4000)
+    assert counts["t0"] < counts["t1"] / 2
+
+
+def test_fatal_failure_does_not_change_health():
+    target = _pool(1).targets[0]
+    target.record_failure(resilience.THROTTLED, 0.1, THROTTLED)
+    health = target.health
+
+    target.breaker.allow()
+    target.record_failure(resilience.FATAL, 0.1, ef.ecs.LaunchError("invalid", code="InvalidParameterException"))
+
+    assert target.health == health
+    assert target.stats()["failures"] == {resilience.THROTTLED: 1, resilience.FATAL: 1}
+    assert target.stats()["calls"] == 2
+
+
+def test_health_floor_keeps_some_traffic():
+    target = _pool(2).targets[0]
+    for _ in range(50):
+        target._observe(False, 0.1)
+
+    assert target.effective_weight() == pytest.approx(2 * placement.HEALTH_FLOOR)
+
+
+# ---------------------------------------------------------
+# Breaker por alvo
+# ---------------------------------------------------------
+def test_open_target_leaves_the_draw():
+    pool = _pool(100, 1)
+    bad = pool.targets[0]
+    for _ in range(placement.TARGET_BREAKER_FAILURES):
+        bad.record_failure(resilience.THROTTLED, 0.1, THROTTLED)
+
+    assert bad.breaker.state == resilience.OPEN
+    assert set(_choose(pool, 50)) == {"t1"}
+    assert pool.retry_after() == 0
+
+
+def test_all_targets_open():
+    pool = _pool(1, 1)
+    for target in pool.targets:
+        for _ in range(placement.TARGET_BREAKER_FAILURES):
+            target.record_failure(resilience.THROTTLED, 0.1, THROTTLED)
+
+    with pytest.raises(resilience.BreakerOpen):
+        pool.choose()
+    assert pool.retry_after() > 0
+
+
+def test_exclude_prefers_other_targets():
+    pool = _pool(100, 1)
+
+    assert set(_choose(pool, 50, exclude={"t0"})) == {"t1"}
+    # Sem outro alvo disponível, o excluído ainda serve
+    assert set(_choose(pool, 5, exclude={"t0", "t1"})) <= {"t0", "t1"}
+
+
+# ---------------------------------------------------------
+# Failover no RunTask (ef._run_task)
+# ---------------------------------------------------------
+class StubLauncher:
+    name = "stub"
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.clusters = []
+
+    def run_task(self, **request):
+        self.clusters.append(request["cluster"])
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def run_task(monkeypatch):
+    pool = _pool(1, 1, 1)
+    monkeypatch.setattr(ef, "targets", pool)
+    monkeypatch.setattr(ef, "breaker", resilience.CircuitBreaker("test", failure_threshold=10))
+    monkeypatch.setattr(ef, "LAUNCH_ATTEMPTS", 3)
+    monkeypatch.setattr(ef.time, "sleep", lambda seconds: None)
+
+    def run(*responses):
+        launcher = StubLauncher(*responses)
+        try:
+            return launcher, ef._run_task(launcher, ef.build_run_task_request(API_DATA))
+        except Exception as e:
+            return launcher, e
+
+    return pool, run
+
+
+def test_retries_go_to_a_different_target(run_task):
+    pool, run = run_task
+    ok = {"tasks": [{"taskArn": "arn:task/1"}], "failures": []}
+
+    launcher, (_, target) = run(THROTTLED, THROTTLED, ok)
+
+    assert len(set(launcher.clusters)) == 3
+    assert target.cluster == launcher.clusters[-1]
+    assert [pool.targets[int(c[1:])].stats()["failures"] for c in launcher.clusters[:2]] == [
+        {resilience.THROTTLED: 1}, {resilience.THROTTLED: 1}
+    ]
+
+
+def test_fatal_stops_failover(run_task):
+    pool, run = run_task
+    invalid = {"tasks": [], "failures": [{"reason": "invalid task definition"}]}
+
+    launcher, error = run(invalid)
+
+    assert isinstance(error, ef.ecs.LaunchError)
+    assert len(launcher.clusters) == 1
+    assert all(target.health == 1.0 for target in pool.targets)
+    assert all(target.breaker.stats()["consecutive_failures"] == 0 for target in pool.targets)
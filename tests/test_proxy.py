@@ -0,0 +1,357 @@
+import asyncio
+import gzip
+import io
+import json
+
+import pytest
+import requests
+import urllib3
+from requests.structures import CaseInsensitiveDict
+from werkzeug.formparser import parse_form_data
+from werkzeug.http import parse_accept_header, parse_options_header
+from werkzeug.test import create_environ
+
+import proxy
+
+
+BOUNDARY = "test-boundary"
+
+
+def _multipart(*parts):
+    body = b""
+    for headers, data in parts:
+        body += f"--{BOUNDARY}\r\n{headers}\r\n\r\n".encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def _field(name, value):
+    return f'Content-Disposition: form-data; name="{name}"', value
+
+
+def _file(data, filename="ct.nii.gz", name="file"):
+    disposition = f'Content-Disposition: form-data; name="{name}"'
+    if filename is not None:
+        disposition += f'; filename="{filename}"'
+    return disposition + "\r\nContent-Type: application/gzip", data
+
+
+def _upload(body, chunk_size=proxy.CHUNK_SIZE):
+    return proxy.StreamingUpload(
+        io.BytesIO(body), "multipart/form-data", {"boundary": BOUNDARY}, "ef_analysis", chunk_size
+    )
+
+
+def _decode(upload):
+    """Corpo enviado ao backend, lido de volta como o backend leria."""
+    body = b"".join(upload)
+    mimetype, options = parse_options_header(upload.content_type)
+    environ = create_environ(
+        method="POST", input_stream=io.BytesIO(body), content_length=len(body),
+        content_type=f"{mimetype}; boundary={options['boundary']}"
+    )
+    _, form, files = parse_form_data(environ)
+    return form, files
+
+
+# ---------------------------------------------------------
+# Ida e volta: pedido do cliente -> multipart novo para o backend
+# ---------------------------------------------------------
+@pytest.mark.parametrize("chunk_size", [*range(1, 24), 64, proxy.CHUNK_SIZE])
+def test_round_trip_field_and_file(chunk_size):
+    data = bytes(range(256)) * 40 + b"\r\n--" + BOUNDARY.encode()[:-1]
+    upload = _upload(_multipart(_field("label", b"heart"), _file(data), _field("after", b"1")), chunk_size)
+
+    upload.prepare()
+    form, files = _decode(upload)
+
+    assert files["file"].read() == data
+    assert files["file"].filename == "ct.nii.gz"
+    assert files["file"].content_type == "application/gzip"
+    assert form["model"] == "ef_analysis"
+    assert form["params"] == str({"label": "heart", "after": "1"})
+    assert upload.bytes_sent == len(data)
+
+
+def test_image_field_and_empty_filename():
+    upload = _upload(_multipart(_file(b"abc", filename="", name="image")))
+
+    upload.prepare()
+    _, files = _decode(upload)
+
+    assert files["file"].filename == proxy.DEFAULT_FILENAME
+    assert files["file"].read() == b"abc"
+
+
+def test_raw_body_is_the_file():
+    upload = proxy.StreamingUpload(io.BytesIO(b"raw-bytes"), "application/octet-stream", {}, "m", 4)
+
+    upload.prepare()
+    _, files = _decode(upload)
+
+    assert files["file"].read() == b"raw-bytes"
+
+
+def test_no_file_received():
+    with pytest.raises(proxy.NoFileReceived):
+        _upload(_multipart(_field("label", b"heart"))).prepare()
+
+
+def test_file_part_without_filename_is_a_field():
+    # Como o request.files do modo antigo: sem filename não é arquivo
+    with pytest.raises(proxy.NoFileReceived):
+        _upload(_multipart(_file(b"abc", filename=None))).prepare()
+
+
+def test_filename_cannot_inject_headers():
+    upload = _upload(b"")
+    upload.filename = 'a"b\\c\r\nX-Injected: 1.nii.gz'
+    upload.file_content_type = "application/gzip\r\nX-Injected: 1"
+
+    header = upload._opening()
+
+    assert header.count(b"\r\n") == 3
+    assert b'filename="a\\"b\\\\cX-Injected: 1.nii.gz"' in header
+    assert b"Content-Type" not in header
+
+
+def test_quoted_filename_round_trip():
+    upload = _upload(_multipart(_file(b"abc", filename='a\\"b.nii.gz')))
+
+    upload.prepare()
+    _, files = _decode(upload)
+
+    assert files["file"].filename == 'a"b.nii.gz'
+
+
+# ---------------------------------------------------------
+# Campos de texto acima de MAX_FIELD_SIZE
+# ---------------------------------------------------------
+def test_oversize_field_before_file(monkeypatch):
+    monkeypatch.setattr(proxy, "MAX_FIELD_SIZE", 10)
+    upload = _upload(_multipart(_field("points", b"x" * 11), _file(b"abc")), chunk_size=4)
+
+    with pytest.raises(proxy.FieldTooLarge):
+        upload.prepare()
+
+
+def test_oversize_field_after_file(monkeypatch):
+    monkeypatch.setattr(proxy, "MAX_FIELD_SIZE", 10)
+    upload = _upload(_multipart(_file(b"abc"), _field("points", b"x" * 11)), chunk_size=4)
+    upload.prepare()
+
+    with pytest.raises(proxy.FieldTooLarge):
+        b"".join(upload)
+
+
+def test_field_at_the_limit_is_kept(monkeypatch):
+    monkeypatch.setattr(proxy, "MAX_FIELD_SIZE", 10)
+    upload = _upload(_multipart(_field("points", b"x" * 10), _file(b"abc")), chunk_size=3)
+
+    upload.prepare()
+    upload.drain()
+
+    assert upload.params == {"points": "x" * 10}
+
+
+# ---------------------------------------------------------
+# 413 no modo ASGI
+# ---------------------------------------------------------
+@pytest.fixture
+def asgi_backend(monkeypatch):
+    import warnings
+
+    import httpx
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        from starlette.testclient import TestClient
+
+    import asgi
+
+    received = []
+
+    async def handler(request):
+        received.append(await request.aread())
+        # Corpo ainda não lido: o relay do modo stream lê com aiter_raw
+        return httpx.Response(200, headers={"Content-Type": "application/json"}, stream=httpx.ByteStream(b'{"ok": true}'))
+
+    monkeypatch.setattr(asgi, "AI_BACKEND_URL", "http://backend.test/infer")
+    monkeypatch.setattr(proxy, "MAX_FIELD_SIZE", 10)
+    with TestClient(asgi.app) as client:
+        monkeypatch.setattr(asgi, "_backend", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        yield client, received
+
+
+@pytest.mark.parametrize("parts", [
+    [_field("points", b"x" * 11), _file(b"abc")],
+    [_file(b"abc" * 100000), _field("points", b"x" * 11)],
+])
+def test_asgi_rejects_oversize_field(asgi_backend, parts):
+    client, received = asgi_backend
+
+    response = client.post(
+        "/infer/deepgrow", content=_multipart(*parts),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    )
+
+    assert response.status_code == 413
+    assert "points" in response.json()["error"]
+
+
+def test_asgi_streams_upload(asgi_backend):
+    client, received = asgi_backend
+
+    response = client.post(
+        "/infer/deepgrow", content=_multipart(_field("points", b"[1]"), _file(b"abc")),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert b"abc" in received[0]
+
+
+# ---------------------------------------------------------
+# Resposta: negociação do Accept-Encoding (_RelayPlan)
+# ---------------------------------------------------------
+BODY = json.dumps({"label": "heart", "points": list(range(500))}).encode()
+SMALL = b'{"ok": true}'
+
+
+def _headers(content_type="application/json", encoding=None, length=None):
+    headers = CaseInsensitiveDict({"Content-Type": content_type})
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if length is not None:
+        headers["Content-Length"] = str(length)
+    return headers
+
+
+@pytest.fixture
+def with_zstd(monkeypatch):
+    """Escolha da codificação como se o zstandard estivesse instalado."""
+    monkeypatch.setattr(proxy, "zstandard", proxy.zstandard or object())
+
+
+def test_passthrough_when_client_accepts_backend_encoding():
+    plan = proxy._RelayPlan(_headers(encoding="gzip", length=300), "br, GZIP;q=0.5")
+
+    assert (plan.mode, plan.decode, plan.encoding) == ("passthrough", False, None)
+    assert plan.headers["Content-Encoding"] == "gzip"
+    assert plan.headers["Content-Length"] == "300"
+    assert plan.headers["Vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize("headers, accept", [
+    (_headers(length=len(SMALL)), "gzip"),                              # abaixo do mínimo
+    (_headers("application/octet-stream", length=len(BODY)), "gzip"),   # não compressível
+    (_headers(length=len(BODY)), "gzip;q=0, identity"),                 # q=0
+    (_headers(length=len(BODY)), ""),                                   # cliente sem Accept-Encoding
+])
+def test_identity_passthrough(headers, accept):
+    plan = proxy._RelayPlan(headers, accept)
+
+    assert (plan.mode, plan.encoding) == ("passthrough", None)
+    assert "Content-Encoding" not in plan.headers
+    assert plan.headers["Content-Length"] == headers["Content-Length"]
+
+
+def test_compress_identity_backend():
+    plan = proxy._RelayPlan(_headers("application/fhir+json", length=len(BODY)), "gzip")
+
+    assert (plan.mode, plan.encoding) == ("compress", "gzip")
+    assert plan.headers["Content-Encoding"] == "gzip"
+    # O tamanho comprimido não é conhecido antes
+    assert "Content-Length" not in plan.headers
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, zstd", "zstd"),
+    ("zstd;q=0.5, gzip", "gzip"),
+    ("zstd;q=0, *", "gzip"),
+    ("*", "zstd"),
+    ("br", None),
+])
+def test_zstd_preferred_at_same_quality(with_zstd, accept, expected):
+    assert proxy.choose_encoding(parse_accept_header(accept), "application/json", len(BODY)) == expected
+
+
+def test_gzip_only_without_zstandard(monkeypatch):
+    monkeypatch.setattr(proxy, "zstandard", None)
+
+    assert proxy.choose_encoding(parse_accept_header("zstd, gzip;q=0.1"), "application/json") == "gzip"
+    assert proxy.choose_encoding(parse_accept_header("zstd"), "application/json") is None
+
+
+def test_decode_when_client_refuses_backend_encoding():
+    plan = proxy._RelayPlan(_headers(encoding="gzip", length=300), "gzip;q=0, identity")
+
+    assert (plan.mode, plan.decode, plan.encoding) == ("decode", True, None)
+    assert "Content-Encoding" not in plan.headers
+    assert "Content-Length" not in plan.headers
+
+
+def test_decode_and_recompress(with_zstd):
+    # Backend em zstd, cliente só aceita gzip; o tamanho final é
+    # desconhecido, então comprime mesmo com Content-Length pequeno
+    plan = proxy._RelayPlan(_headers(encoding="zstd", length=10), "gzip")
+
+    assert (plan.mode, plan.decode, plan.encoding) == ("decode", True, "gzip")
+    assert plan.headers["Content-Encoding"] == "gzip"
+
+
+# ---------------------------------------------------------
+# Resposta: corpo repassado (ResponseRelay / AsyncResponseRelay)
+# ---------------------------------------------------------
+def _backend_response(body, **headers):
+    headers = _headers(**headers)
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = headers
+    response.raw = urllib3.HTTPResponse(
+        body=io.BytesIO(body), headers=dict(headers), status=200, preload_content=False
+    )
+    return response
+
+
+def test_relay_passthrough_keeps_backend_bytes():
+    compressed = gzip.compress(BODY)
+    response = _backend_response(compressed, encoding="gzip", length=len(compressed))
+
+    relay = proxy.ResponseRelay(response, "gzip", chunk_size=100)
+
+    assert b"".join(relay) == compressed
+    assert response.raw.closed
+
+
+def test_relay_compresses_identity_body():
+    relay = proxy.ResponseRelay(_backend_response(BODY, length=len(BODY)), "gzip", chunk_size=100)
+
+    body = b"".join(relay)
+
+    assert relay.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body) == BODY
+    assert len(body) < len(BODY)
+
+
+def test_relay_decodes_for_client_without_gzip():
+    compressed = gzip.compress(BODY)
+    relay = proxy.ResponseRelay(_backend_response(compressed, encoding="gzip", length=len(compressed)), "identity")
+
+    assert b"".join(relay) == BODY
+    assert "Content-Encoding" not in relay.headers
+
+
+def test_async_relay_decodes_for_client_without_gzip():
+    import httpx
+
+    compressed = gzip.compress(BODY)
+    response = httpx.Response(
+        200, headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        stream=httpx.ByteStream(compressed)
+    )
+
+    async def relay(accept):
+        return b"".join([chunk async for chunk in proxy.AsyncResponseRelay(response, accept, chunk_size=100)])
+
+    assert asyncio.run(relay("identity")) == BODY
@@ -0,0 +1,92 @@
+import json
+import os
+
+import pytest
+
+import registry
+
+
+CONFIG = {
+    "name": "MONAILabel MOCK",
+    "labels": ["heart"],
+    "models": {
+        "ef_analysis": {
+            "type": "segmentation",
+            "labels": {"heart": 1},
+            "dimension": 3,
+            "dispatch": "ecs",
+            "target": "http://ef_analysis:5000"
+        }
+    }
+}
+
+
+def _write(path, config, mtime=None):
+    path.write_text(config if isinstance(config, str) else json.dumps(config))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_load(tmp_path):
+    path = tmp_path / "models.json"
+    _write(path, CONFIG)
+
+    models = registry.load(str(path))
+
+    assert "ef_analysis" in models
+    assert models.names_by_type("segmentation") == ("ef_analysis",)
+    assert models.names_by_label("heart") == ("ef_analysis",)
+    # Campos internos ficam fora do /info
+    assert b"dispatch" not in models.rendered_info.body
+    assert json.loads(models.rendered_model["ef_analysis"].body)["model_state"] == "READY"
+
+
+@pytest.mark.parametrize("config", [
+    "{not json",
+    [],
+    {"models": []},
+    {"models": {}},
+    {"models": {"m": "segmentation"}},
+    {"models": {"m": {"type": "segmentation", "dimension": 3}}},
+    {"models": {"m": {"type": ["segmentation"], "labels": {}, "dimension": 3}}},
+    {"models": {"m": {"type": "segmentation", "labels": ["heart"], "dimension": 3}}},
+    {"labels": "heart", "models": {"m": {"type": "segmentation", "labels": {}, "dimension": 3}}},
+])
+def test_invalid_config_raises_registry_error(tmp_path, config):
+    path = tmp_path / "models.json"
+    _write(path, config)
+
+    with pytest.raises(registry.RegistryError):
+        registry.load(str(path))
+
+
+def test_hot_reload(tmp_path):
+    path = tmp_path / "models.json"
+    _write(path, CONFIG, mtime=1000)
+    hot = registry.HotRegistry(str(path), reload_interval=0)
+    first = hot.current()
+
+    changed = dict(CONFIG, models={"other": dict(CONFIG["models"]["ef_analysis"])})
+    _write(path, changed, mtime=2000)
+
+    assert "other" in hot.current()
+    assert hot.current().version != first.version
+    assert hot.reloads == 1
+
+
+@pytest.mark.parametrize("config", ["{", {"models": {"m": {"type": "x", "labels": [1], "dimension": 3}}}, []])
+def test_bad_reload_keeps_previous_version(tmp_path, config):
+    path = tmp_path / "models.json"
+    _write(path, CONFIG, mtime=1000)
+    hot = registry.HotRegistry(str(path), reload_interval=0)
+    first = hot.current()
+
+    _write(path, config, mtime=2000)
+
+    assert hot.current() is first
+    assert hot.reloads == 0
+
+    # Arquivo corrigido: recarrega na próxima verificação
+    _write(path, CONFIG, mtime=3000)
+    hot.current()
+    assert hot.reloads == 1
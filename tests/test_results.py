@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+import inference
+import results
+
+
+def _key(scan="3", task_definition="ef:1"):
+    return results.result_key("ef_analysis", "P1", "S1", "E1", scan, task_definition)
+
+
+def test_put_and_get(store):
+    cache = results.ResultCache(ttl=60, backend=store)
+    body, etag = cache.put(_key(), {"job_id": "j1"})
+
+    assert cache.get(_key()) == (body, etag)
+    assert etag == results.make_etag(body)
+    assert cache.get(_key(task_definition="ef:2")) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_evicts_least_recently_used_over_max_size(store, monkeypatch):
+    cache = results.ResultCache(ttl=60, max_size=2, backend=store)
+    monkeypatch.setattr(results, "TOUCH_INTERVAL", 0)
+
+    cache.put(_key("1"), {"job_id": "j1"})
+    cache.put(_key("2"), {"job_id": "j2"})
+    assert cache.get(_key("1")) is not None
+    cache.put(_key("3"), {"job_id": "j3"})
+
+    assert cache.get(_key("2")) is None
+    assert cache.get(_key("1")) is not None
+    assert cache.get(_key("3")) is not None
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evicted"] == 1
+
+
+def test_evicts_over_max_bytes(store):
+    cache = results.ResultCache(ttl=60, max_bytes=100, backend=store)
+
+    cache.put(_key("1"), {"data": "x" * 60})
+    cache.put(_key("2"), {"data": "y" * 60})
+
+    assert cache.get(_key("1")) is None
+    assert cache.get(_key("2")) is not None
+
+
+def test_hit_keeps_remaining_ttl(store, monkeypatch):
+    cache = results.ResultCache(ttl=0.2, backend=store)
+    monkeypatch.setattr(results, "TOUCH_INTERVAL", 0)
+    cache.put(_key(), {"job_id": "j1"})
+
+    time.sleep(0.1)
+    assert cache.get(_key()) is not None
+    time.sleep(0.15)
+    assert cache.get(_key()) is None
+
+
+def test_invalidate_prefix(store):
+    cache = results.ResultCache(ttl=60, backend=store)
+    cache.put(_key("3"), {"job_id": "j1"})
+    cache.put(_key("4"), {"job_id": "j2"})
+
+    assert cache.invalidate("ef_analysis/P1/S1/E1/3@") == 1
+    assert cache.get(_key("3")) is None
+    assert cache.get(_key("4")) is not None
+
+
+# ---------------------------------------------------------
+# DELETE /results/<modelo>
+# ---------------------------------------------------------
+@pytest.fixture
+def result_cache(store, monkeypatch):
+    cache = results.ResultCache(ttl=60, backend=store)
+    monkeypatch.setattr(inference, "result_cache", cache)
+    return cache
+
+
+def test_invalidation_disabled_without_token(result_cache, monkeypatch):
+    monkeypatch.setattr(inference, "ADMIN_TOKEN", None)
+    result_cache.put(_key(), {"job_id": "j1"})
+
+    status, _, _ = inference.invalidate_results(None, "ef_analysis", "")
+
+    assert status == 403
+    assert result_cache.get(_key()) is not None
+
+
+def test_invalidation_rejects_wrong_token(result_cache, monkeypatch):
+    monkeypatch.setattr(inference, "ADMIN_TOKEN", "secret")
+    result_cache.put(_key(), {"job_id": "j1"})
+
+    status, _, _ = inference.invalidate_results("Bearer wrong", "ef_analysis", "")
+
+    assert status == 401
+    assert result_cache.get(_key()) is not None
+
+
+def test_invalidation_with_token(result_cache, monkeypatch):
+    monkeypatch.setattr(inference, "ADMIN_TOKEN", "secret")
+    result_cache.put(_key("3"), {"job_id": "j1"})
+    result_cache.put(_key("4"), {"job_id": "j2"})
+
+    status, body, _ = inference.invalidate_results("Bearer secret", "ef_analysis", "P1/S1/E1/3")
+
+    assert status == 200
+    assert body == {"invalidated": 1}
+    assert result_cache.get(_key("4")) is not None
+
+
+def test_obsolete_tier_settings_are_reported(monkeypatch):
+    monkeypatch.setenv("EF_RESULT_CACHE_DIR", "/tmp/monai-mock-results")
+    calls = []
+    monkeypatch.setattr(results.log, "warning", lambda message, extra: calls.append(extra["setting"]))
+
+    results._warn_obsolete_settings()
+
+    assert calls == ["EF_RESULT_CACHE_DIR"]
@@ -0,0 +1,122 @@
+import gc
+import weakref
+
+import pytest
+
+import inference
+import series
+import xnat
+
+
+def _scan(scan_id, description):
+    return {"ID": scan_id, "series_description": description, "type": description}
+
+
+# ---------------------------------------------------------
+# Classificação de descrições reais
+# ---------------------------------------------------------
+@pytest.mark.parametrize("description", [
+    "CINE_SA", "cine sa", "SA CINE", "CINE SA 2", "sx_cine_sa", "rEIXO_CURTO", "R EIXO CURTO",
+    "Eixo Curto Cine", "EIXO_CURTO_CINE", "CINE EC 2", "SHORT AXIS", "cine_short_axis",
+    "B-TFE_BH SA", "CINE_SA_SSFP 10 slices", "tf2d15_retro_iPAT SAX CINE"
+])
+def test_short_axis_cine_variants(description):
+    assert series.short_axis.classify(description) is not None
+
+
+@pytest.mark.parametrize("description", [
+    "Cine Eixo Curto", "CINE EIXO CURTO", "cine eixo_curto", "Cine_Eixo_Curto_Retrospectivo",
+    "Eíxo Curto Cine", "EIXO CURTO - CINE", "ÉIXO_CÚRTO"
+])
+def test_accented_portuguese(description):
+    assert series.short_axis.classify(description) is not None
+
+
+@pytest.mark.parametrize("description", [
+    "LOCALIZER", "3-plane loc", "SA T1 MAP", "MOLLI SA", "ShMOLLI_192i_SAX", "T2 MAP SA",
+    "T2* eixo curto", "DE SA", "LGE_PSIR_SA", "Realce tardio PSIR eixo curto", "PERFUSION SA",
+    "flow_pc_aorta", "TAGGING SA", "CINE 4CH", "CINE 2CH", "CINE LVOT", "CINE SAG", "", None
+])
+def test_not_short_axis_cine(description):
+    assert series.short_axis.classify(description) is None
+
+
+def test_rank_exact_before_contains_before_fallback():
+    scans = [
+        _scan("10", "CINE SSFP SAX"),
+        _scan("11", "sa cine fiesta"),
+        _scan("12", "LGE SA"),
+        _scan("13", "Cine SA"),
+        _scan("14", "CINE 4CH")
+    ]
+
+    assert [scan["ID"] for scan in series.short_axis.rank_scans(scans)] == ["13", "11", "10"]
+    assert series.short_axis.best_scan(scans)["ID"] == "13"
+
+
+def test_same_rank_prefers_earlier_pattern_then_position():
+    scans = [_scan("1", "SHORT AXIS"), _scan("2", "rEIXO_CURTO"), _scan("3", "r eixo curto")]
+
+    # rEIXO_CURTO vem antes de SHORT AXIS na lista; R EIXO CURTO depois dos dois
+    assert [scan["ID"] for scan in series.short_axis.rank_scans(scans)] == ["2", "1", "3"]
+
+
+def test_type_used_without_series_description():
+    assert series.short_axis.rank_scans([{"ID": "5", "type": "CINE_SA"}])[0]["ID"] == "5"
+
+
+def test_matcher_is_not_kept_alive_by_the_cache():
+    matcher = series.SeriesMatcher(["MY CINE"])
+    assert matcher.classify("my_cine") == (series.RANK_EXACT, 0)
+
+    collected = []
+    weakref.finalize(matcher, collected.append, True)
+    del matcher
+    gc.collect()
+
+    assert collected == [True]
+
+
+# ---------------------------------------------------------
+# Escolha da série no /infer
+# ---------------------------------------------------------
+@pytest.fixture
+def experiment(monkeypatch):
+    scans = []
+    monkeypatch.setattr(xnat, "enabled", lambda: True)
+    monkeypatch.setattr(xnat, "list_scans", lambda project, subject, experiment: scans)
+    return scans
+
+
+def test_select_series_picks_best_scan(experiment):
+    experiment += [_scan("1", "LOCALIZER"), _scan("2", "Cine Eixo Curto"), _scan("3", "CINE_SA")]
+
+    scan, description, error = inference.select_series("ef_analysis", "P1", "S1", "E1", "")
+
+    assert error is None
+    assert (scan, description) == ("3", "CINE_SA")
+
+
+def test_select_series_accepts_requested_short_axis_scan(experiment):
+    experiment += [_scan("2", "Cine Eixo Curto"), _scan("3", "CINE_SA")]
+
+    assert inference.select_series("ef_analysis", "P1", "S1", "E1", "2")[:2] == ("2", "Cine Eixo Curto")
+
+
+def test_select_series_422_when_nothing_matches(experiment):
+    experiment += [_scan("1", "LOCALIZER"), _scan("4", "LGE_PSIR_SA"), _scan("5", "CINE 4CH")]
+
+    _, _, (status, body, _) = inference.select_series("ef_analysis", "P1", "S1", "E1", "")
+
+    assert status == 422
+    assert body["candidates"] == []
+    assert "No short-axis cine series" in body["error"]
+
+
+def test_select_series_422_for_non_short_axis_scan(experiment):
+    experiment += [_scan("3", "CINE_SA"), _scan("4", "T1 MAP SA")]
+
+    _, _, (status, body, _) = inference.select_series("ef_analysis", "P1", "S1", "E1", "4")
+
+    assert status == 422
+    assert body["candidates"] == [{"scan": "3", "series_description": "CINE_SA"}]
@@ -0,0 +1,125 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import fake_redis
+import state
+
+
+class DropReplyHandler(fake_redis.RespHandler):
+    """Aplica o comando e derruba a conexão antes de responder."""
+
+    drop = set()
+
+    def handle(self):
+        session = {"db": 0}
+        while True:
+            args = self._read_command()
+            if not args:
+                return
+            with fake_redis._lock:
+                reply = fake_redis.encode(fake_redis.execute(session, args[0], args[1:]))
+            if args[0].upper() in self.drop:
+                self.drop.discard(args[0].upper())
+                return
+            self.wfile.write(reply)
+
+
+@pytest.fixture
+def redis_server():
+    fake_redis._databases.clear()
+    DropReplyHandler.drop = set()
+    server = fake_redis.Server(("127.0.0.1", 0), DropReplyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis_store(redis_server):
+    return state.RedisStore("127.0.0.1", redis_server.server_address[1], timeout=2)
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def any_store(request, store):
+    return store if request.param == "sqlite" else request.getfixturevalue("redis_store")
+
+
+def test_get_set_delete(any_store):
+    assert any_store.get("a") is None
+    any_store.set("a", "1")
+    any_store.set("a", "2")
+    assert any_store.get("a") == "2"
+    assert any_store.delete("a", "missing") == 1
+    assert any_store.get("a") is None
+
+
+def test_add_only_when_missing_or_expired(any_store):
+    assert any_store.add("lease", "w1", ttl=0.05)
+    assert not any_store.add("lease", "w2", ttl=0.05)
+    assert any_store.get("lease") == "w1"
+
+    time.sleep(0.1)
+    assert any_store.get("lease") is None
+    assert any_store.add("lease", "w2")
+    assert any_store.get("lease") == "w2"
+
+
+def test_scan_count_and_delete_prefix(any_store):
+    for key in ("job:b", "job:a", "job:c", "jobs", "other:a"):
+        any_store.set(key, key.upper())
+    any_store.set("job:expired", "X", ttl=0.01)
+    time.sleep(0.05)
+
+    assert any_store.scan("job:") == [("job:a", "JOB:A"), ("job:b", "JOB:B"), ("job:c", "JOB:C")]
+    assert any_store.count("job:") == 3
+    assert any_store.delete_prefix("job:") >= 3
+    assert any_store.count("job") == 1
+
+
+def test_redis_namespace_and_glob_characters(redis_store):
+    redis_store.set("dedup:a*b", "1")
+    redis_store.set("dedup:axb", "2")
+
+    assert redis_store.scan("dedup:a*") == [("dedup:a*b", "1")]
+    assert set(fake_redis._db(0)) == {"monai-mock:dedup:a*b", "monai-mock:dedup:axb"}
+
+
+# ---------------------------------------------------------
+# Reconexão
+# ---------------------------------------------------------
+def test_reconnects_after_dropped_connection(redis_store):
+    redis_store.set("a", "1")
+    # Como um servidor que reiniciou: a conexão guardada não serve mais
+    redis_store._local.conn.sock.shutdown(socket.SHUT_RDWR)
+
+    assert redis_store.get("a") == "1"
+    assert redis_store.stats()["connects"] == 2
+
+
+def test_add_resolves_lost_reply_from_stored_value(redis_store):
+    DropReplyHandler.drop = {"SET"}
+
+    # O SET NX foi aplicado e a resposta se perdeu: o claim continua nosso
+    assert redis_store.add("claim", "token-1")
+    assert redis_store.get("claim") == "token-1"
+    assert not redis_store.add("claim", "token-2")
+
+
+def test_add_lost_reply_of_someone_elses_claim(redis_store):
+    redis_store.add("claim", "token-1")
+    DropReplyHandler.drop = {"SET"}
+
+    assert not redis_store.add("claim", "token-2")
+
+
+def test_unavailable_server_raises_state_error(redis_server):
+    port = redis_server.server_address[1]
+    redis_server.shutdown()
+    redis_server.server_close()
+
+    with pytest.raises(state.StateError):
+        state.RedisStore("127.0.0.1", port, timeout=0.5).get("a")
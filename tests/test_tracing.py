@@ -0,0 +1,184 @@
+import json
+
+import pytest
+
+import ef
+import idempotency
+import inference
+import jobs
+import results
+import tracing
+
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SPAN_ID = "00f067aa0ba902b7"
+TRACEPARENT = f"00-{TRACE_ID}-{SPAN_ID}-01"
+
+
+@pytest.fixture
+def spans(monkeypatch):
+    """Spans terminados, em vez de irem para o exportador."""
+    ended = []
+    monkeypatch.setattr(tracing.exporter, "submit", ended.append)
+    return ended
+
+
+# ---------------------------------------------------------
+# traceparent
+# ---------------------------------------------------------
+def test_parse_and_emit_round_trip():
+    context = tracing.SpanContext.parse(TRACEPARENT)
+
+    assert (context.trace_id, context.span_id, context.sampled) == (TRACE_ID, SPAN_ID, True)
+    assert context.traceparent == TRACEPARENT
+    assert tracing.SpanContext.parse(f"  00-{TRACE_ID.upper()}-{SPAN_ID}-00 ").sampled is False
+
+
+@pytest.mark.parametrize("traceparent", [
+    None,
+    "",
+    "garbage",
+    f"ff-{TRACE_ID}-{SPAN_ID}-01",                  # versão inválida
+    f"0-{TRACE_ID}-{SPAN_ID}-01",
+    f"zz-{TRACE_ID}-{SPAN_ID}-01",
+    f"00-{TRACE_ID}-{SPAN_ID}-01-extra",            # versão 00 tem 4 campos
+    f"00-{'0' * 32}-{SPAN_ID}-01",                  # trace id só com zeros
+    f"00-{TRACE_ID}-{'0' * 16}-01",                 # span id só com zeros
+    f"00-{TRACE_ID[:-1]}-{SPAN_ID}-01",
+    f"00-{TRACE_ID}-{SPAN_ID}x-01",
+    f"00-{TRACE_ID[:-1]}g-{SPAN_ID}-01",
+    f"00-{TRACE_ID}-{SPAN_ID}-1",
+    f"00-{TRACE_ID}-{SPAN_ID}-0x",
+])
+def test_parse_rejects_invalid(traceparent):
+    assert tracing.SpanContext.parse(traceparent) is None
+
+
+def test_parse_accepts_future_version_with_extra_fields():
+    context = tracing.SpanContext.parse(f"01-{TRACE_ID}-{SPAN_ID}-01-what-comes-next")
+
+    assert context.trace_id == TRACE_ID
+
+
+def test_continue_trace_follows_parent(spans):
+    with tracing.continue_trace("work", TRACEPARENT) as span:
+        with tracing.start_span("child", root=False) as child:
+            pass
+
+    assert span.context.trace_id == child.context.trace_id == TRACE_ID
+    assert span.parent_id == SPAN_ID
+    assert child.parent_id == span.context.span_id
+    assert [s.name for s in spans] == ["child", "work"]
+
+
+def test_unsampled_or_invalid_parent_records_nothing(spans, monkeypatch):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+
+    assert not tracing.continue_trace("work", f"00-{TRACE_ID}-{SPAN_ID}-00", root=True).recording
+    assert not tracing.continue_trace("work", "garbage").recording
+    # Contexto inválido com root=True começa um trace novo
+    assert tracing.continue_trace("work", "garbage", root=True).recording
+
+
+# ---------------------------------------------------------
+# /infer -> registro do job -> RunTask -> fim do job
+# ---------------------------------------------------------
+@pytest.fixture
+def dispatched(store, monkeypatch):
+    monkeypatch.setattr(inference, "dedup", idempotency.IdempotencyCache(ttl=60, backend=store))
+    monkeypatch.setattr(inference, "result_cache", results.ResultCache(ttl=60, backend=store))
+    monkeypatch.setattr(inference.warmpool, "ENABLED", False)
+    calls = []
+    monkeypatch.setattr(ef, "run_fargate_task", lambda api_data, job_id=None: calls.append(
+        (job_id, tracing.current_traceparent())
+    ))
+    return calls
+
+
+def test_job_record_carries_trace_context(dispatched, spans):
+    status, body, _ = inference.submit_infer("ef_analysis", "P1/S1/E1/3", traceparent=TRACEPARENT)
+
+    assert status == 200
+    job = jobs.store.get(body["job_id"])
+    context = tracing.SpanContext.parse(job["traceparent"])
+    assert context.trace_id == TRACE_ID
+
+    # O disparo (fila) fica no mesmo trace, abaixo do span do /infer
+    (job_id, enqueued), = dispatched
+    assert job_id == body["job_id"]
+    assert tracing.SpanContext.parse(enqueued).trace_id == TRACE_ID
+
+    infer_span = next(s for s in spans if s.name == "infer ef_analysis")
+    assert infer_span.parent_id == SPAN_ID
+
+
+def test_untraced_request_stores_no_context(dispatched, spans):
+    _, body, _ = inference.submit_infer("ef_analysis", "P1/S1/E1/4")
+
+    assert jobs.store.get(body["job_id"])["traceparent"] is None
+    assert spans == []
+
+
+def test_launch_passes_context_to_the_task(monkeypatch, spans):
+    requests = []
+    monkeypatch.setattr(ef, "_launch_chunk", lambda job_ids, api_data, traceparent=None: requests.append(
+        ef.build_run_task_request(api_data, traceparent)
+    ))
+
+    ef._launch([("j1", {"project": "P1", "subject": "S1", "experiment": "E1", "scan": "3"}, TRACEPARENT)])
+
+    environment = {e["name"]: e["value"] for e in requests[0]["overrides"]["containerOverrides"][0]["environment"]}
+    task_context = tracing.SpanContext.parse(environment["TRACEPARENT"])
+    (launch_span,) = spans
+
+    assert launch_span.name == "ecs.launch"
+    assert launch_span.parent_id == SPAN_ID
+    assert task_context.trace_id == TRACE_ID
+    assert task_context.span_id == launch_span.context.span_id
+
+
+def test_finished_job_records_ecs_stages(spans):
+    job_id = jobs.new_job_id()
+    jobs.store.create(job_id, "ef_analysis", "P1/S1/E1/3", "P1", "S1", "E1", "3", traceparent=TRACEPARENT)
+    timestamps = {"createdAt": 100.0, "pullStartedAt": 110.0, "pullStoppedAt": 130.0,
+                  "startedAt": 131.0, "stoppedAt": 200.0}
+
+    inference._trace_job(dict(jobs.store.get(job_id), status=jobs.SUCCEEDED, exit_code=0,
+                              ecs_timestamps=timestamps))
+
+    by_name = {span.name: span for span in spans}
+    assert set(by_name) == {"job", "ecs.provisioning", "ecs.image_pull", "ef.run"}
+    assert all(span.context.trace_id == TRACE_ID and span.parent_id == SPAN_ID for span in spans)
+    assert by_name["ef.run"].start_ns == 131 * 10 ** 9
+    assert by_name["ef.run"].attributes["exit_code"] == 0
+
+
+# ---------------------------------------------------------
+# Exportação OTLP/JSON
+# ---------------------------------------------------------
+def test_file_export_writes_otlp_batches(tmp_path, spans):
+    path = tmp_path / "spans.jsonl"
+    exporter = tracing.SpanExporter(destination=str(path))
+
+    with tracing.continue_trace("work", TRACEPARENT, attributes={"job_id": "j1", "n": 2}) as span:
+        span.set_error("boom")
+    exporter._export(spans)
+
+    (line,) = path.read_text().splitlines()
+    (resource,) = json.loads(line)["resourceSpans"]
+    (encoded,) = resource["scopeSpans"][0]["spans"]
+    assert encoded["traceId"] == TRACE_ID
+    assert encoded["parentSpanId"] == SPAN_ID
+    assert encoded["status"] == {"code": tracing.STATUS_ERROR, "message": "boom"}
+    assert {"key": "n", "value": {"intValue": "2"}} in encoded["attributes"]
+    assert exporter.exported == 1
+
+
+def test_export_failure_is_counted(tmp_path, spans):
+    exporter = tracing.SpanExporter(destination=str(tmp_path / "missing" / "spans.jsonl"))
+
+    with tracing.continue_trace("work", TRACEPARENT):
+        pass
+    exporter._export(spans)
+
+    assert (exporter.exported, exporter.errors) == (0, 1)
@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import ef
+import jobs
+import warmpool
+
+
+API_DATA = {"project": "P1", "subject": "S1", "experiment": "E1", "scan": "3"}
+
+
+@pytest.fixture
+def pool(tmp_path, store, monkeypatch):
+    pool = warmpool.WarmPool(path=str(tmp_path / "work.sqlite3"), min_size=0, max_size=10,
+                             jobs_per_worker=1, backend=store)
+    monkeypatch.setattr(pool, "start", lambda: None)
+    return pool
+
+
+class StubLauncher:
+
+    name = "stub"
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.counts = []
+
+    def run_task(self, **request):
+        self.counts.append(request.get("count", 1))
+        return self.responses.pop(0)
+
+
+def _tasks(*names):
+    return [{"taskArn": f"arn:aws:ecs:task/{name}", "lastStatus": "PROVISIONING"} for name in names]
+
+
+@pytest.fixture
+def launcher(pool, monkeypatch):
+    monkeypatch.setattr(ef, "breaker", ef.resilience.CircuitBreaker("test"))
+    monkeypatch.setattr(ef, "targets", ef.placement.load_targets("", "us-east-2", "cluster", "subnet-1"))
+    monkeypatch.setattr(warmpool, "TOKEN", "secret")
+
+    def install(*responses):
+        pool._launcher = StubLauncher(*responses)
+        return pool._launcher
+
+    return install
+
+
+def test_lease_and_complete(pool, new_job):
+    job_id = new_job()
+    pool.submit(API_DATA, job_id)
+
+    status, body, _ = pool.lease("w1", task="arn:task/1")
+    assert status == 200
+    assert body["job_id"] == job_id
+    assert body["exame"] == API_DATA
+    assert jobs.store.get(job_id)["status"] == jobs.LAUNCHED
+
+    assert pool.heartbeat("w2", int(body["lease_id"]))[0] == 409
+    assert pool.complete("w1", int(body["lease_id"]), jobs.SUCCEEDED, {"ef": 55})[0] == 200
+    assert jobs.store.get(job_id)["status"] == jobs.SUCCEEDED
+    assert pool.lease("w1")[0] == 204
+
+
+def test_partial_launch_records_started_tasks(pool, launcher):
+    stub = launcher({
+        "tasks": _tasks("a", "b"),
+        "failures": [{"reason": "Capacity is unavailable at this time"}]
+    }, {"tasks": _tasks("c"), "failures": []})
+
+    pool._launch(3)
+
+    assert pool.backend.count(warmpool.LAUNCH_PREFIX) == 2
+    assert pool.stats()["launched"] == 2
+
+    # Próxima rodada do scaler: só o que faltou
+    for i in range(3):
+        pool._queue.put(f"item-{i}")
+    assert pool.scale_once()["launched"] == 1
+    assert stub.counts == [3, 1]
+    assert pool.backend.count(warmpool.LAUNCH_PREFIX) == 3
+
+
+# ---------------------------------------------------------
+# /work: token obrigatório
+# ---------------------------------------------------------
+def test_work_routes_require_token(monkeypatch):
+    monkeypatch.setattr(warmpool, "ENABLED", True)
+    monkeypatch.setattr(warmpool, "TOKEN", "secret")
+
+    assert warmpool._check(None, {"worker": "w1"})[1][0] == 401
+    assert warmpool._check("Bearer wrong", {"worker": "w1"})[1][0] == 401
+    assert warmpool._check("Bearer secret", {"worker": "w1"}) == ("w1", None)
+
+
+def test_work_routes_disabled_without_pool_mode(monkeypatch):
+    monkeypatch.setattr(warmpool, "ENABLED", False)
+
+    assert warmpool._check("Bearer secret", {"worker": "w1"})[1][0] == 404
+
+
+def test_pool_mode_refuses_to_start_without_token():
+    env = dict(os.environ, EF_DISPATCH_MODE="pool")
+    env.pop("EF_POOL_TOKEN", None)
+
+    result = subprocess.run([sys.executable, "-c", "import warmpool"], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    assert result.returncode != 0
+    assert "EF_POOL_TOKEN" in result.stderr
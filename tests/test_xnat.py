@@ -0,0 +1,65 @@
+import pytest
+
+import xnat
+
+
+def _document(scan_ids):
+    return {"items": [{
+        "data_fields": {"ID": "E1", "label": "E1", "modality": "MR"},
+        "meta": {"xsi:type": "xnat:mrSessionData"},
+        "children": [{
+            "field": "scans/scan",
+            "items": [
+                {
+                    "data_fields": {"ID": scan_id, "type": "SAX"},
+                    "children": [{"field": "file", "items": [{"data_fields": {"label": "DICOM"}}]}]
+                }
+                for scan_id in scan_ids
+            ]
+        }]
+    }]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = xnat.XnatClient(host="http://xnat.test", cache_ttl=60, cache_size=2)
+    client.paths = []
+
+    def get(path, **params):
+        client.paths.append(path)
+        return _document(["1", "2"])
+
+    monkeypatch.setattr(client, "_get", get)
+    return client
+
+
+def test_experiment_is_parsed_and_cached(client):
+    scans = client.list_scans("P1", "S1", "E1")
+
+    assert [scan["ID"] for scan in scans] == ["1", "2"]
+    assert xnat.preferred_resource(scans[0])["label"] == "DICOM"
+    assert client.scan("P1", "S1", "E1", "2")["ID"] == "2"
+    assert client.paths == ["/data/projects/P1/subjects/S1/experiments/E1"]
+
+
+def test_path_segments_are_quoted(client):
+    client.experiment("P1/../admin", "S 1", "E1?format=xml")
+
+    assert client.paths == ["/data/projects/P1%2F..%2Fadmin/subjects/S%201/experiments/E1%3Fformat%3Dxml"]
+
+
+def test_cache_is_bounded_and_invalidated(client):
+    for experiment in ("E1", "E2", "E3"):
+        client.experiment("P1", "S1", experiment)
+    assert client.stats()["cached_experiments"] == 2
+
+    assert client.invalidate("P1") == 2
+    client.experiment("P1", "S1", "E3")
+    assert len(client.paths) == 4
+
+
+def test_unexpected_document_raises_xnat_error(client, monkeypatch):
+    monkeypatch.setattr(client, "_get", lambda path, **params: {"items": []})
+
+    with pytest.raises(xnat.XnatError):
+        client.experiment("P1", "S1", "E1")
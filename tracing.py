@@ -0,0 +1,508 @@
+"""
+Tracing por spans do /infer até o fim da tarefa EF.
+
+Um trace começa em submit_infer() (ou continua o header traceparent do
+cliente) e segue pelos estágios, cada um com o seu span:
+
+    infer <modelo>          handling do pedido, com filhos xnat.*,
+                            dedup.claim, admission e dispatch.enqueue
+    dispatch.wait           tempo na fila em disco até uma thread pegar
+    ecs.launch / run_task   RunTask, uma tentativa por span (alvo, launcher)
+    ecs.provisioning        createdAt -> pull da imagem (ENI, agendamento)
+    ecs.image_pull          pull da imagem
+    ef.run                  o container rodando o modelo
+    pool.wait / compute     no warm pool (warmpool.py), no lugar dos do ECS
+    job                     do /infer até o job terminar
+
+O contexto viaja no formato W3C (traceparent): no payload da fila de
+disparo e, para a tarefa, na variável TRACEPARENT ao lado do EXAME_JSON,
+então a imagem pode pendurar os próprios spans no mesmo trace. Os estágios
+do ECS saem dos timestamps do DescribeTasks quando o poller vê a tarefa
+parar (jobs.py).
+
+Exportação em OTLP/JSON por uma thread por processo, em lotes e sem
+bloquear o request (fila cheia descarta e conta):
+
+    EF_TRACE_EXPORT=/var/log/monai-mock/spans.jsonl           arquivo, um
+                                                               ExportTraceServiceRequest por linha
+    EF_TRACE_EXPORT=http://otel-collector:4318/v1/traces      coletor OTLP/HTTP
+
+Amostragem na raiz: EF_TRACE_SAMPLE_RATE (0 desliga; padrão) e no máximo
+EF_TRACE_MAX_PER_SECOND traces novos por segundo por worker. Um traceparent
+recebido é respeitado (sampled ou não). Pedido não amostrado usa um span
+nulo: o custo é um random() e um objeto vazio por estágio, sem I/O.
+"""
+import atexit
+import contextvars
+import datetime
+import functools
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+
+import requests
+
+import applog
+
+
+log = applog.get_logger(__name__)
+
+SAMPLE_RATE = float(os.getenv("EF_TRACE_SAMPLE_RATE", "0"))
+MAX_PER_SECOND = float(os.getenv("EF_TRACE_MAX_PER_SECOND", "50"))
+EXPORT = os.getenv("EF_TRACE_EXPORT", "")
+SERVICE_NAME = os.getenv("EF_TRACE_SERVICE_NAME", "monai-mock")
+
+EXPORT_INTERVAL = float(os.getenv("EF_TRACE_EXPORT_INTERVAL", "2"))
+EXPORT_BATCH = int(os.getenv("EF_TRACE_EXPORT_BATCH", "512"))
+QUEUE_SIZE = int(os.getenv("EF_TRACE_QUEUE_SIZE", "10000"))
+EXPORT_TIMEOUT = float(os.getenv("EF_TRACE_EXPORT_TIMEOUT", "5"))
+
+# SpanKind do OTLP
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+PRODUCER = 4
+CONSUMER = 5
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar("monai_mock_span", default=None)
+
+
+# =========================================================
+# Contexto (W3C traceparent)
+# =========================================================
+class SpanContext:
+
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id, span_id, sampled=True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def parse(cls, traceparent):
+        """"00-<trace_id>-<span_id>-<flags>" -> SpanContext, ou None se inválido."""
+        if not traceparent:
+            return None
+
+        parts = traceparent.strip().lower().split("-")
+        if len(parts) < 4 or [len(part) for part in parts[:4]] != [2, 32, 16, 2]:
+            return None
+        # ff é inválida; a versão 00 tem exatamente 4 campos (versões
+        # futuras podem acrescentar campos depois das flags)
+        if parts[0] == "ff" or (parts[0] == "00" and len(parts) != 4):
+            return None
+
+        try:
+            int(parts[0], 16)
+            trace_id, span_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+        except ValueError:
+            return None
+
+        # Ids só com zeros são inválidos
+        if not trace_id or not span_id:
+            return None
+
+        return cls(parts[1], parts[2], bool(flags & 1))
+
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class _RateLimiter:
+    """Token bucket: no máximo rate traces novos por segundo."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        if self.rate <= 0:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+
+# =========================================================
+# Spans
+# =========================================================
+class Span:
+
+    __slots__ = ("name", "context", "parent_id", "kind", "start_ns", "end_ns",
+                 "attributes", "links", "status", "status_message", "_token")
+
+    def __init__(self, name, context, parent_id=None, kind=INTERNAL, start=None, attributes=None, links=None):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = _to_ns(start) if start is not None else time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.links = links or []
+        self.status = None
+        self.status_message = None
+        self._token = None
+
+    @property
+    def recording(self):
+        return True
+
+    @property
+    def traceparent(self):
+        return self.context.traceparent
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = STATUS_ERROR
+        self.status_message = str(message)[:500]
+
+    def end(self, end=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = _to_ns(end) if end is not None else time.time_ns()
+        exporter.submit(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None and self.status is None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """Pedido fora da amostra: mesma interface, nada é gravado."""
+
+    context = None
+    traceparent = None
+    recording = False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, message):
+        pass
+
+    def end(self, end=None):
+        pass
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        return False
+
+
+def _to_ns(value):
+    if isinstance(value, int):
+        return value
+    return int(value * 1_000_000_000)
+
+
+_limiter = _RateLimiter(MAX_PER_SECOND)
+
+
+def _sample_root():
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE and _limiter.allow()
+
+
+def _links(traceparents):
+    contexts = (SpanContext.parse(tp) for tp in traceparents or ())
+    return [context for context in contexts if context is not None]
+
+
+def start_span(name, kind=INTERNAL, attributes=None, start=None, root=True):
+    """
+    Filho do span atual (with). Sem span atual, root=True começa um trace
+    novo se sorteado; root=False não grava nada.
+    """
+    parent = _current.get()
+
+    if parent is None:
+        if not root or not _sample_root():
+            return _NoopSpan()
+        return Span(name, SpanContext(_new_id(128), _new_id(64)), kind=kind, start=start, attributes=attributes)
+
+    if not parent.recording:
+        return _NoopSpan()
+
+    return Span(
+        name, SpanContext(parent.context.trace_id, _new_id(64)), parent_id=parent.context.span_id,
+        kind=kind, start=start, attributes=attributes
+    )
+
+
+def continue_trace(name, traceparent, kind=INTERNAL, attributes=None, start=None, links=None, root=False):
+    """
+    Filho de um contexto serializado (header do cliente, payload da fila,
+    registro do job). Sem contexto válido, root=True sorteia um trace novo;
+    root=False não grava nada. links: outros traceparents relacionados.
+    """
+    parent = SpanContext.parse(traceparent)
+
+    if parent is None:
+        if not root or not _sample_root():
+            return _NoopSpan()
+        context, parent_id = SpanContext(_new_id(128), _new_id(64)), None
+    elif not parent.sampled:
+        return _NoopSpan()
+    else:
+        context, parent_id = SpanContext(parent.trace_id, _new_id(64)), parent.span_id
+
+    return Span(name, context, parent_id=parent_id, kind=kind, start=start, attributes=attributes, links=_links(links))
+
+
+def record_span(name, traceparent, start, end, attributes=None, error=None):
+    """Span já terminado, com início e fim conhecidos (fila, timestamps do ECS)."""
+    if start is None or end is None or end < start:
+        return
+
+    span = continue_trace(name, traceparent, attributes=attributes, start=start)
+    if error:
+        span.set_error(error)
+    span.end(end)
+
+
+def traced(name):
+    """Decorator: a chamada vira um span filho (só dentro de um trace)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(name, root=False):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_traceparent():
+    span = _current.get()
+    return span.traceparent if span is not None else None
+
+
+def set_error(message):
+    """Marca o span atual como erro (falha tratada, sem exceção)."""
+    span = _current.get()
+    if span is not None:
+        span.set_error(message)
+
+
+def epoch(value):
+    """Timestamp do ECS (datetime do boto3, ISO 8601 do CLI ou epoch) -> segundos."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+
+    try:
+        return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+# =========================================================
+# Exportação (OTLP/JSON)
+# =========================================================
+def _value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes):
+    return [{"key": key, "value": _value(value)} for key, value in attributes.items() if value is not None]
+
+
+def encode(spans):
+    """Spans -> ExportTraceServiceRequest (mapeamento JSON do OTLP)."""
+    resource = {
+        "service.name": SERVICE_NAME,
+        "host.name": socket.gethostname(),
+        "process.pid": os.getpid()
+    }
+
+    encoded = []
+    for span in spans:
+        item = {
+            "traceId": span.context.trace_id,
+            "spanId": span.context.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _attributes(span.attributes),
+            "status": {"code": span.status or STATUS_OK}
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        if span.status_message:
+            item["status"]["message"] = span.status_message
+        if span.links:
+            item["links"] = [{"traceId": link.trace_id, "spanId": link.span_id} for link in span.links]
+        encoded.append(item)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes(resource)},
+            "scopeSpans": [{"scope": {"name": "monai-mock"}, "spans": encoded}]
+        }]
+    }
+
+
+class SpanExporter:
+    """Fila limitada + thread de exportação por processo (como o applog)."""
+
+    def __init__(self, destination=EXPORT, interval=EXPORT_INTERVAL, batch_size=EXPORT_BATCH, maxsize=QUEUE_SIZE):
+        self.destination = destination
+        self.interval = interval
+        self.batch_size = batch_size
+        self._maxsize = maxsize
+        self._after_fork()
+
+        self.exported = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def _after_fork(self):
+        self._queue = queue.Queue(maxsize=self._maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._session = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def submit(self, span):
+        if not self.destination:
+            return
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _export_loop(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.interval)]
+            except queue.Empty:
+                continue
+
+            # Espera o lote encher até interval
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._export(batch)
+
+    def _export(self, batch):
+        body = json.dumps(encode(batch), separators=(",", ":"))
+
+        try:
+            if self.destination.startswith(("http://", "https://")):
+                if self._session is None:
+                    self._session = requests.Session()
+                response = self._session.post(
+                    self.destination, data=body, timeout=EXPORT_TIMEOUT,
+                    headers={"Content-Type": "application/json"}
+                )
+                response.raise_for_status()
+            else:
+                path = self.destination[len("file://"):] if self.destination.startswith("file://") else self.destination
+                # Uma linha por lote: O_APPEND mantém as linhas dos workers inteiras
+                with open(path, "a") as f:
+                    f.write(body + "\n")
+        except (OSError, requests.RequestException) as e:
+            self.errors += 1
+            log.warning("Span export failed", extra={"destination": self.destination, "spans": len(batch), "error": str(e)})
+            return
+
+        self.exported += len(batch)
+
+    def flush(self):
+        """Exporta o que estiver na fila (saída do processo)."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._export(batch)
+                batch = []
+        if batch:
+            self._export(batch)
+
+    def stats(self):
+        return {
+            "sample_rate": SAMPLE_RATE,
+            "max_per_second": MAX_PER_SECOND,
+            "destination": self.destination or None,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "export_errors": self.errors
+        }
+
+
+exporter = SpanExporter()
+
+os.register_at_fork(after_in_child=exporter._after_fork)
+os.register_at_fork(after_in_child=_limiter._after_fork)
+atexit.register(exporter.flush)
+
+
+def stats():
+    return exporter.stats()
@@ -0,0 +1,534 @@
+"""
+Warm pool de workers EF (opcional, EF_DISPATCH_MODE=pool).
+
+No modo padrão cada scan vira uma tarefa Fargate nova com EXAME_JSON, e o
+cold start (pull da imagem + ENI) costuma demorar mais que o próprio
+cálculo da FE. No warm pool algumas tarefas de longa duração ficam
+ligadas e puxam os exames de uma fila de trabalho exposta pelo servidor:
+
+    POST /work/lease              {"worker", "task", "wait"} -> exame, ou 204
+    POST /work/<lease>/heartbeat  {"worker"} renova o aluguel durante o cálculo
+    POST /work/<lease>/complete   {"worker", "status", "result", "error"}
+    GET  /work/pool               estado do pool e dos workers
+
+A fila é uma DiskQueue (diskqueue.py) separada da fila de disparos, com
+aluguéis remotos: o worker que morre no meio do cálculo perde o aluguel
+depois de EF_POOL_LEASE_SECONDS sem heartbeat e o exame vai para outro.
+
+O tamanho do pool acompanha a fila. Um único worker do gunicorn por vez
+(lease no store) calcula o alvo ceil(exames na fila /
+EF_POOL_JOBS_PER_WORKER), limitado a [EF_POOL_MIN, EF_POOL_MAX], e lança
+as tarefas que faltam (RunTask com EF_WORK_URL no lugar de EXAME_JSON).
+Para encolher não há StopTask: o alvo só baixa depois de
+EF_POOL_SCALE_DOWN_DELAY segundos sem precisar dele, e os workers
+excedentes recebem {"retire": true} no próximo lease, sem interromper
+nenhum cálculo.
+
+As rotas /work exigem Authorization: Bearer <EF_POOL_TOKEN> (o mesmo
+token vai para as tarefas lançadas); sem o token o modo pool não sobe.
+
+ef_worker.py é o worker de referência do protocolo e o stand-in local
+(EF_POOL_LAUNCHER=local). Cada long poll prende uma thread do gunicorn
+por até EF_POOL_LEASE_WAIT segundos: workers x threads precisa ficar
+bem acima de EF_POOL_MAX.
+"""
+import hmac
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+from threading import Thread
+
+import applog
+import diskqueue
+import ecs
+import ef
+import jobs
+import metrics
+import resilience
+import state
+import tracing
+
+
+log = applog.get_logger(__name__)
+
+ENABLED = os.getenv("EF_DISPATCH_MODE", "task") == "pool"
+
+POOL_MIN = int(os.getenv("EF_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("EF_POOL_MAX", "4"))
+JOBS_PER_WORKER = int(os.getenv("EF_POOL_JOBS_PER_WORKER", "2"))
+SCALE_INTERVAL = float(os.getenv("EF_POOL_SCALE_INTERVAL", "10"))
+SCALE_DOWN_DELAY = float(os.getenv("EF_POOL_SCALE_DOWN_DELAY", "300"))
+
+# Endereço do servidor visto de dentro das tarefas (o EF_WORK_URL delas)
+SERVER_URL = os.getenv("EF_POOL_SERVER_URL", "http://localhost:8000")
+TOKEN = os.getenv("EF_POOL_TOKEN")
+# Só quando difere do token do pool (o PUT do label aceita EF_POOL_TOKEN)
+LABEL_TOKEN = os.getenv("EF_LABEL_TOKEN")
+if ENABLED and not TOKEN:
+    # Sem token qualquer um alugaria exames (e dados do XNAT) pelo /work
+    raise ValueError("EF_DISPATCH_MODE=pool requires EF_POOL_TOKEN")
+LAUNCHER = os.getenv("EF_POOL_LAUNCHER", ecs.LAUNCHER)
+
+LEASE_SECONDS = float(os.getenv("EF_POOL_LEASE_SECONDS", "60"))
+LEASE_WAIT_MAX = float(os.getenv("EF_POOL_LEASE_WAIT", "20"))
+MAX_ATTEMPTS = int(os.getenv("EF_POOL_MAX_ATTEMPTS", "3"))
+# Sem lease / heartbeat por esse tempo, o worker é dado como morto
+WORKER_TTL = float(os.getenv("EF_POOL_WORKER_TTL", "60"))
+# Prazo para uma tarefa lançada se registrar (cold start)
+LAUNCH_TIMEOUT = float(os.getenv("EF_POOL_LAUNCH_TIMEOUT", "300"))
+
+WORK_QUEUE_DB = os.getenv(
+    "EF_WORK_QUEUE_DB",
+    os.path.join(tempfile.gettempdir(), "monai-mock-work.sqlite3")
+)
+
+WORKER_PREFIX = "pool-worker:"
+LAUNCH_PREFIX = "pool-launch:"
+TARGET_KEY = "pool:target"
+SCALER_LEASE = "lease:pool-scaler"
+
+# Máximo de tarefas por chamada RunTask
+RUN_TASK_MAX_COUNT = 10
+
+WORKER_ID_MAX_LENGTH = 128
+
+
+# _touch(): não mexe no job atual do worker
+_KEEP = object()
+
+
+def _owner(worker):
+    return "worker:" + worker
+
+
+class WarmPool:
+
+    def __init__(self, path=WORK_QUEUE_DB, min_size=POOL_MIN, max_size=POOL_MAX,
+                 jobs_per_worker=JOBS_PER_WORKER, queue_size=ef.DISPATCH_QUEUE_SIZE,
+                 scale_interval=SCALE_INTERVAL, scale_down_delay=SCALE_DOWN_DELAY,
+                 lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, backend=None):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.jobs_per_worker = max(1, jobs_per_worker)
+        self.queue_size = queue_size
+        self.scale_interval = scale_interval
+        self.scale_down_delay = scale_down_delay
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backend = backend or state.store
+
+        self._queue = diskqueue.DiskQueue(path, visibility_timeout=lease_seconds)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._launcher = None
+
+        self._submitted = 0
+        self._rejected = 0
+        self._leased = 0
+        self._succeeded = 0
+        self._failed = 0
+        self._lost = 0
+        self._gave_up = 0
+        self._retired = 0
+        self._launched = 0
+
+    def start(self):
+        """Sobe o scaler deste processo (só o que pega o lease escala)."""
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            Thread(target=self._scale_loop, name="ef-pool-scaler", daemon=True).start()
+            self._pid = os.getpid()
+
+    # -----------------------------------------------------
+    # Fila de trabalho
+    # -----------------------------------------------------
+    def submit(self, api_data, job_id):
+        """Grava o exame na fila do pool; levanta ef.DispatchQueueFull se cheia."""
+        self.start()
+
+        if self._queue.depth >= self.queue_size:
+            self._queue.counts()
+
+        if self._queue.depth >= self.queue_size:
+            with self._lock:
+                self._rejected += 1
+            metrics.DISPATCH_REJECTED.inc()
+            raise ef.DispatchQueueFull(ef.DISPATCH_RETRY_AFTER)
+
+        self._queue.put(json.dumps(
+            {"job_id": job_id, "api_data": api_data, "trace": tracing.current_traceparent()},
+            separators=(",", ":")
+        ))
+
+        with self._lock:
+            self._submitted += 1
+
+    def lease(self, worker, task=None, wait=0.0):
+        """Long poll de um worker: (status, body, headers) como o inference.py."""
+        self.start()
+        self._touch(worker, task)
+
+        if self._should_retire(worker):
+            self.backend.delete(WORKER_PREFIX + worker)
+            with self._lock:
+                self._retired += 1
+            metrics.POOL_LEASES.labels("retire").inc()
+            log.info("Pool worker retired", extra={"worker": worker, "task": task})
+            return 200, {"retire": True}, {}
+
+        deadline = time.monotonic() + wait
+
+        while True:
+            messages = self._queue.get(1, timeout=max(0.0, deadline - time.monotonic()), owner=_owner(worker))
+            if not messages:
+                metrics.POOL_LEASES.labels("empty").inc()
+                return 204, None, {}
+
+            message = messages[0]
+            item = json.loads(message.payload)
+            job_id = item["job_id"]
+
+            # Job que já terminou por outro caminho ou saiu do store: descarta
+            job = jobs.store.get(job_id) if job_id else None
+            if job_id and (job is None or job["status"] in jobs.TERMINAL_STATUSES):
+                self._queue.complete(message.id, _owner(worker))
+                continue
+
+            if message.attempts > self.max_attempts:
+                self._queue.complete(message.id, _owner(worker))
+                with self._lock:
+                    self._gave_up += 1
+                log.error("Pool job gave up after repeated deliveries", extra={
+                    "job_id": job_id, "max_attempts": self.max_attempts
+                })
+                jobs.store.mark_failed([job_id], "EF workers lost the job after repeated attempts")
+                continue
+
+            break
+
+        now = time.time()
+        metrics.POOL_WAIT.observe(max(0.0, now - message.enqueued_at))
+        tracing.record_span("pool.wait", item.get("trace"), message.enqueued_at, now, {
+            "job_id": job_id, "worker": worker, "attempt": message.attempts
+        })
+        metrics.POOL_LEASES.labels("job").inc()
+        with self._lock:
+            self._leased += 1
+
+        if message.attempts > 1:
+            log.warning("Pool job redelivered", extra={"job_id": job_id, "attempt": message.attempts, "worker": worker})
+
+        jobs.store.mark_leased([job_id], worker, task_definition=ef.TASK_DEFINITION)
+        self._touch(worker, task, job=job_id)
+        log.info("Pool job leased", extra={"job_id": job_id, "worker": worker, "lease_id": message.id})
+
+        return 200, {
+            "lease_id": str(message.id),
+            "job_id": job_id,
+            "exame": item["api_data"],
+            "attempt": message.attempts,
+            "lease_seconds": self.lease_seconds,
+            # O worker pode pendurar os próprios spans no trace do /infer
+            "traceparent": item.get("trace")
+        }, {}
+
+    def heartbeat(self, worker, lease_id):
+        if not self._queue.extend(lease_id, _owner(worker), self.lease_seconds):
+            return 409, {"error": "Lease lost, the job was handed to another worker"}, {}
+
+        self._touch(worker)
+        return 200, {"lease_seconds": self.lease_seconds}, {}
+
+    def complete(self, worker, lease_id, status, result=None, error=None):
+        if status not in jobs.TERMINAL_STATUSES:
+            return 400, {"error": f"status must be one of {', '.join(jobs.TERMINAL_STATUSES)}"}, {}
+
+        payload = self._queue.complete(lease_id, _owner(worker))
+        if payload is None:
+            with self._lock:
+                self._lost += 1
+            return 409, {"error": "Lease lost, the job was handed to another worker"}, {}
+
+        item = json.loads(payload)
+        job_id = item["job_id"]
+        record = self._touch(worker, job=None, completed=True)
+        if record.get("leased_at"):
+            now = time.time()
+            metrics.POOL_JOB_DURATION.labels(status).observe(max(0.0, now - record["leased_at"]))
+            tracing.record_span(
+                "pool.compute", item.get("trace"), record["leased_at"], now,
+                {"job_id": job_id, "worker": worker, "status": status},
+                (error or "EF worker reported a failure") if status == jobs.FAILED else None
+            )
+
+        if status == jobs.SUCCEEDED:
+            jobs.store.mark_succeeded([job_id], result)
+        else:
+            jobs.store.mark_failed([job_id], error or "EF worker reported a failure")
+
+        with self._lock:
+            if status == jobs.SUCCEEDED:
+                self._succeeded += 1
+            else:
+                self._failed += 1
+
+        log.info("Pool job completed", extra={"job_id": job_id, "worker": worker, "status": status})
+        return 200, {"job_id": job_id, "status": status}, {}
+
+    # -----------------------------------------------------
+    # Workers
+    # -----------------------------------------------------
+    def _touch(self, worker, task=None, job=_KEEP, completed=False):
+        """Registra / renova o worker no store; devolve o registro anterior."""
+        key = WORKER_PREFIX + worker
+        stored = self.backend.get(key)
+        now = time.time()
+
+        if stored is None:
+            previous = {}
+            record = {"worker": worker, "task": task, "registered_at": now, "job": None, "leased_at": None, "completed": 0}
+            if task:
+                # A tarefa lançada pelo scaler chegou: deixa de contar como "subindo"
+                self.backend.delete(LAUNCH_PREFIX + task)
+            log.info("Pool worker registered", extra={"worker": worker, "task": task})
+        else:
+            previous = json.loads(stored)
+            record = dict(previous)
+
+        record["last_seen"] = now
+        if task:
+            record["task"] = task
+        if job is not _KEEP:
+            record["job"] = job
+            record["leased_at"] = now if job else None
+        if completed:
+            record["completed"] += 1
+
+        self.backend.set(key, json.dumps(record), ttl=WORKER_TTL)
+        return previous
+
+    def workers(self):
+        return [json.loads(value) for _, value in self.backend.scan(WORKER_PREFIX)]
+
+    def _target(self):
+        stored = self.backend.get(TARGET_KEY)
+        return json.loads(stored)["target"] if stored else None
+
+    def _should_retire(self, worker):
+        target = self._target()
+        if target is None:
+            return False
+
+        # Os excedentes são sempre os mais novos: pedidos simultâneos de
+        # workers diferentes não aposentam mais do que o necessário
+        live = sorted(self.workers(), key=lambda record: (record["registered_at"], record["worker"]))
+        return any(record["worker"] == worker for record in live[target:])
+
+    # -----------------------------------------------------
+    # Escala
+    # -----------------------------------------------------
+    def _scale_loop(self):
+        while True:
+            time.sleep(self.scale_interval)
+
+            try:
+                # Todos os workers têm um scaler; só o que pega o lease escala
+                if self.backend.add(SCALER_LEASE, f"{os.getpid()}:{uuid.uuid4().hex}", ttl=self.scale_interval * 0.9):
+                    self.scale_once()
+            except Exception as e:
+                log.error("Error scaling the warm pool", extra={"error": str(e)})
+
+    def scale_once(self):
+        counts = self._queue.counts()
+        backlog = counts["ready"] + counts["leased"]
+        wanted = min(self.max_size, max(self.min_size, math.ceil(backlog / self.jobs_per_worker)))
+        now = time.time()
+
+        stored = self.backend.get(TARGET_KEY)
+        previous = json.loads(stored) if stored else {"target": wanted, "needed_at": now}
+
+        # Cresce na hora; só encolhe depois de scale_down_delay sem precisar
+        if wanted >= previous["target"]:
+            target, needed_at = wanted, now
+        elif now - previous["needed_at"] >= self.scale_down_delay:
+            target, needed_at = wanted, now
+        else:
+            target, needed_at = previous["target"], previous["needed_at"]
+
+        self.backend.set(TARGET_KEY, json.dumps({"target": target, "needed_at": needed_at}))
+        if target != previous["target"]:
+            log.info("Warm pool resized", extra={"from": previous["target"], "to": target, "backlog": backlog})
+
+        live = len(self.workers())
+        starting = self.backend.count(LAUNCH_PREFIX)
+        metrics.POOL_WORKERS.labels("live").set(live)
+        metrics.POOL_WORKERS.labels("starting").set(starting)
+        metrics.POOL_WORKERS.labels("target").set(target)
+
+        missing = target - live - starting
+        if missing > 0:
+            self._launch(missing)
+
+        return {"backlog": backlog, "target": target, "live": live, "starting": starting, "launched": max(0, missing)}
+
+    def _get_launcher(self):
+        if self._launcher is None:
+            self._launcher = ecs.get_launcher() if LAUNCHER == ecs.LAUNCHER else ecs.create_launcher(LAUNCHER)
+        return self._launcher
+
+    def _launch(self, count):
+        environment = [
+            {"name": "EF_WORKER_MODE", "value": "pool"},
+            {"name": "EF_WORK_URL", "value": SERVER_URL},
+            {"name": "EF_POOL_TOKEN", "value": TOKEN}
+        ]
+        if LABEL_TOKEN:
+            environment.append({"name": "EF_LABEL_TOKEN", "value": LABEL_TOKEN})
+
+        task_request = ef.build_task_request(environment, f"ef-pool-{int(time.time())}")
+        launcher = self._get_launcher()
+
+        while count > 0:
+            chunk = min(count, RUN_TASK_MAX_COUNT)
+            count -= chunk
+
+            log.info("Starting pool workers", extra={"launcher": launcher.name, "count": chunk})
+            try:
+                response, _ = ef._run_task(launcher, dict(task_request, count=chunk))
+            except (resilience.RetryLater, ecs.LaunchError) as e:
+                # Tenta de novo na próxima rodada do scaler
+                log.warning("Pool scale-up postponed", extra={"error": str(e)})
+                return
+
+            # Sucesso parcial: as que subiram contam como "starting" e a
+            # próxima rodada do scaler só pede o que faltou
+            for task in response["tasks"]:
+                self.backend.set(LAUNCH_PREFIX + task["taskArn"], json.dumps({
+                    "task": task["taskArn"], "launched_at": time.time()
+                }), ttl=LAUNCH_TIMEOUT)
+
+            metrics.POOL_LAUNCHES.inc(len(response["tasks"]))
+            with self._lock:
+                self._launched += len(response["tasks"])
+
+            if len(response["tasks"]) < chunk:
+                log.warning("Pool scale-up partially failed", extra={
+                    "requested": chunk, "started": len(response["tasks"]),
+                    "failures": response.get("failures")
+                })
+                return
+
+    def stats(self):
+        workers = self.workers()
+        queue_stats = self._queue.stats()
+
+        with self._lock:
+            return {
+                "enabled": True,
+                "min": self.min_size,
+                "max": self.max_size,
+                "jobs_per_worker": self.jobs_per_worker,
+                "target": self._target(),
+                "workers": len(workers),
+                "busy": sum(1 for record in workers if record.get("job")),
+                "starting": self.backend.count(LAUNCH_PREFIX),
+                "depth": queue_stats["ready"] + queue_stats["leased"],
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "leased": self._leased,
+                "succeeded": self._succeeded,
+                "failed": self._failed,
+                "lost_leases": self._lost,
+                "gave_up": self._gave_up,
+                "retired": self._retired,
+                "launched": self._launched,
+                "queue": queue_stats
+            }
+
+
+pool = WarmPool()
+
+
+# =========================================================
+# HTTP (/work)
+# =========================================================
+def _check(authorization, body):
+    """Devolve (worker, None) ou (None, resposta de erro)."""
+    if not ENABLED:
+        return None, (404, {"error": "Warm pool is disabled (EF_DISPATCH_MODE=pool)"}, {})
+
+    if not TOKEN or not hmac.compare_digest(authorization or "", f"Bearer {TOKEN}"):
+        return None, (401, {"error": "Invalid pool token"}, {})
+
+    worker = body.get("worker") if isinstance(body, dict) else None
+    if not isinstance(worker, str) or not worker or len(worker) > WORKER_ID_MAX_LENGTH:
+        return None, (400, {"error": "worker is required"}, {})
+
+    return worker, None
+
+
+def _lease_id(lease_id):
+    try:
+        return int(lease_id)
+    except ValueError:
+        return None
+
+
+def parse_wait(body):
+    """Segundos de long poll pedidos pelo worker (None se inválido)."""
+    try:
+        return max(0.0, min(float(body.get("wait") or 0), LEASE_WAIT_MAX))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def lease(authorization, body):
+    worker, error = _check(authorization, body)
+    if error:
+        return error
+
+    wait = parse_wait(body)
+    if wait is None:
+        return 400, {"error": "wait must be a number of seconds"}, {}
+
+    return pool.lease(worker, body.get("task"), wait)
+
+
+def heartbeat(authorization, lease_id, body):
+    worker, error = _check(authorization, body)
+    if error:
+        return error
+
+    lease_id = _lease_id(lease_id)
+    if lease_id is None:
+        return 404, {"error": "Lease not found"}, {}
+
+    return pool.heartbeat(worker, lease_id)
+
+
+def complete(authorization, lease_id, body):
+    worker, error = _check(authorization, body)
+    if error:
+        return error
+
+    lease_id = _lease_id(lease_id)
+    if lease_id is None:
+        return 404, {"error": "Lease not found"}, {}
+
+    return pool.complete(worker, lease_id, body.get("status"), body.get("result"), body.get("error"))
+
+
+def status():
+    if not ENABLED:
+        return 200, {"enabled": False}, {}
+
+    return 200, dict(pool.stats(), worker_list=pool.workers()), {}
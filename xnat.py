@@ -0,0 +1,314 @@
+"""
+Cliente REST do XNAT de onde vêm os exames enviados ao EF.
+
+XnatClient mantém, por worker do gunicorn, uma sessão HTTP com pool de
+conexões keep-alive e um token JSESSIONID: a senha só é enviada no login
+(POST /data/JSESSION) e de novo quando o XNAT responde 401 (sessão expirada).
+
+Os metadados são buscados por experimento, em uma única chamada que já
+traz todas as séries e seus recursos (arquivos), e ficam em um cache
+LRU + TTL. O /datastore/image/info/ e o /infer do mesmo exame, que o OHIF
+dispara em sequência, fazem uma só consulta ao XNAT.
+
+Sem XNAT_HOST configurado o servidor segue sem consultar o XNAT
+(metadados padrão, sem seleção de série). fake_xnat.py sobe um XNAT
+falso local para testes e benchmarks.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import applog
+import metrics
+
+
+log = applog.get_logger(__name__)
+
+XNAT_HOST = os.getenv("XNAT_HOST", "").rstrip("/")
+XNAT_USER = os.getenv("XNAT_USER", "admin")
+XNAT_PASSWORD = os.getenv("XNAT_PASSWORD", "")
+XNAT_TIMEOUT = float(os.getenv("XNAT_TIMEOUT", "10"))
+XNAT_POOL_MAXSIZE = int(os.getenv("XNAT_POOL_MAXSIZE", "4"))
+
+# Metadados de experimento em cache (séries mudam raramente depois do envio)
+XNAT_CACHE_TTL = float(os.getenv("XNAT_CACHE_TTL", "300"))
+XNAT_CACHE_SIZE = int(os.getenv("XNAT_CACHE_SIZE", "512"))
+
+# Recurso com as imagens, quando a série tem mais de um
+PREFERRED_RESOURCE = "DICOM"
+
+# xsi:type do experimento -> modalidade, quando o campo modality não vem
+SESSION_MODALITIES = {
+    "xnat:mrSessionData": "MR",
+    "xnat:ctSessionData": "CT",
+    "xnat:petSessionData": "PT",
+    "xnat:usSessionData": "US",
+    "xnat:crSessionData": "CR"
+}
+
+
+class XnatError(Exception):
+    """Falha ao consultar o XNAT."""
+
+
+class NotFound(XnatError):
+    """Projeto, sujeito ou experimento inexistente."""
+
+
+def _children(item, field):
+    for child in item.get("children", []):
+        if child.get("field") == field:
+            return child.get("items", [])
+    return []
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_experiment(document):
+    """Resposta de GET .../experiments/<e>?format=json -> dict com as séries."""
+    item = document["items"][0]
+    fields = item.get("data_fields", {})
+    xsi_type = item.get("meta", {}).get("xsi:type", "")
+
+    scans = []
+    for scan_item in _children(item, "scans/scan"):
+        scan_fields = scan_item.get("data_fields", {})
+
+        resources = [
+            {
+                "label": resource["data_fields"].get("label", ""),
+                "format": resource["data_fields"].get("format", ""),
+                "file_count": _int(resource["data_fields"].get("file_count")),
+                "file_size": _int(resource["data_fields"].get("file_size"))
+            }
+            for resource in _children(scan_item, "file")
+        ]
+
+        scans.append({
+            "ID": str(scan_fields.get("ID", "")),
+            "type": scan_fields.get("type", ""),
+            "series_description": scan_fields.get("series_description", ""),
+            "quality": scan_fields.get("quality", ""),
+            "frames": _int(scan_fields.get("frames")),
+            "resources": resources
+        })
+
+    return {
+        "id": fields.get("ID", ""),
+        "label": fields.get("label", ""),
+        "date": fields.get("date", ""),
+        "modality": fields.get("modality") or SESSION_MODALITIES.get(xsi_type, ""),
+        "xsi_type": xsi_type,
+        "scans": scans
+    }
+
+
+def preferred_resource(scan):
+    resources = scan.get("resources") or []
+
+    for resource in resources:
+        if resource["label"] == PREFERRED_RESOURCE:
+            return resource
+
+    return resources[0] if resources else None
+
+
+class XnatClient:
+
+    def __init__(self, host=XNAT_HOST, user=XNAT_USER, password=XNAT_PASSWORD,
+                 timeout=XNAT_TIMEOUT, pool_maxsize=XNAT_POOL_MAXSIZE,
+                 cache_ttl=XNAT_CACHE_TTL, cache_size=XNAT_CACHE_SIZE):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._login_lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._token = None
+
+        self._cache = OrderedDict()
+        self._loading = {}
+
+        self._requests = 0
+        self._logins = 0
+        self._hits = 0
+        self._misses = 0
+
+    def enabled(self):
+        return bool(self.host)
+
+    # -----------------------------------------------------
+    # Sessão HTTP e JSESSIONID
+    # -----------------------------------------------------
+    def _get_session(self):
+        # Recriada após fork: sockets não podem ser compartilhados entre workers
+        with self._lock:
+            if self._pid != os.getpid():
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                self._session = requests.Session()
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+                self._token = None
+                self._pid = os.getpid()
+
+            return self._session
+
+    def _login(self, session, stale_token):
+        with self._login_lock:
+            # Outra thread já renovou enquanto esta esperava
+            if self._token is not None and self._token != stale_token:
+                return self._token
+
+            try:
+                response = session.post(
+                    f"{self.host}/data/JSESSION",
+                    auth=(self.user, self.password),
+                    timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                raise XnatError(str(e))
+
+            if response.status_code != 200:
+                raise XnatError(f"XNAT login failed with {response.status_code}")
+
+            self._token = response.text.strip()
+            self._logins += 1
+            log.info("XNAT session opened", extra={"host": self.host})
+
+            return self._token
+
+    def _get(self, path, **params):
+        session = self._get_session()
+        token = self._token or self._login(session, None)
+
+        for attempt in range(2):
+            with self._lock:
+                self._requests += 1
+
+            try:
+                response = session.get(
+                    f"{self.host}{path}",
+                    params=dict(params, format="json"),
+                    cookies={"JSESSIONID": token},
+                    timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                raise XnatError(str(e))
+
+            if response.status_code == 401 and attempt == 0:
+                # JSESSIONID expirou: um novo login e repete o pedido
+                token = self._login(session, token)
+                continue
+
+            if response.status_code == 404:
+                raise NotFound(f"{path} not found")
+
+            if response.status_code != 200:
+                raise XnatError(f"{path} returned {response.status_code}")
+
+            return response.json()
+
+    # -----------------------------------------------------
+    # Metadados (cache LRU + TTL por experimento)
+    # -----------------------------------------------------
+    def experiment(self, project, subject, experiment):
+        key = (project, subject, experiment)
+
+        while True:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None and time.monotonic() - entry[0] < self.cache_ttl:
+                    self._cache.move_to_end(key)
+                    self._hits += 1
+                    metrics.cache_lookup("xnat", True)
+                    return entry[1]
+
+                loading = self._loading.get(key)
+                if loading is None:
+                    # Esta thread busca; as demais do mesmo exame esperam
+                    loading = self._loading[key] = threading.Event()
+                    self._misses += 1
+                    metrics.cache_lookup("xnat", False)
+                    break
+
+            loading.wait(self.timeout)
+
+        try:
+            # Partes vêm do ?image= do cliente: "/", "?" ou ".." não podem mudar o caminho
+            document = self._get("/data/projects/{}/subjects/{}/experiments/{}".format(
+                *(quote(part, safe="") for part in key)
+            ))
+            metadata = parse_experiment(document)
+        except (KeyError, IndexError, ValueError) as e:
+            raise XnatError(f"Unexpected XNAT response for {experiment}: {e}")
+        else:
+            with self._lock:
+                self._cache[key] = (time.monotonic(), metadata)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return metadata
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            loading.set()
+
+    def list_scans(self, project, subject, experiment):
+        """Todas as séries do experimento (uma única chamada ao XNAT)."""
+        return self.experiment(project, subject, experiment)["scans"]
+
+    def scan(self, project, subject, experiment, scan_id):
+        for scan in self.list_scans(project, subject, experiment):
+            if scan["ID"] == scan_id:
+                return scan
+        return None
+
+    def invalidate(self, project=None, subject=None, experiment=None):
+        prefix = tuple(part for part in (project, subject, experiment) if part)
+
+        with self._lock:
+            keys = [key for key in self._cache if key[:len(prefix)] == prefix]
+            for key in keys:
+                del self._cache[key]
+
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled(),
+                "requests": self._requests,
+                "logins": self._logins,
+                "cached_experiments": len(self._cache),
+                "cache_hits": self._hits,
+                "cache_misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+
+client = XnatClient()
+
+
+def enabled():
+    return client.enabled()
+
+
+def list_scans(project, subject, experiment):
+    return client.list_scans(project, subject, experiment)